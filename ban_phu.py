@@ -1,4 +1,4 @@
-from machine import Pin, ADC, I2C, deepsleep
+from machine import Pin, ADC, I2C, deepsleep, lightsleep
 import time
 import bme280_float as bme280
 import urequests
@@ -7,7 +7,12 @@ import json
 import math
 import ubinascii
 import gc
-from collections import deque
+import wire_format
+from outbox import Outbox
+from http_client import HttpClient, parse_url
+from sample_window import SampleWindow
+from device_state import DeviceState
+from pressure_trend import PressureTrend
 
 ## 1. CẤU HÌNH HỆ THỐNG
 CONFIG = {
@@ -15,8 +20,22 @@ CONFIG = {
     'wifi_ssid': "Xiaomi11T",
     'wifi_password': "heiina123",
     
-    # Server nhận dữ liệu
-    'flask_server': "http://192.168.254.185:5000/data",
+    # Server nhận dữ liệu (endpoint nhận theo lô)
+    'flask_server': "http://192.168.254.185:5000/api/data/batch",
+    
+    # Giữ một kết nối HTTP/1.1 tới server qua các lần gửi (False: urequests, mỗi lần một kết nối)
+    'keep_alive': True,
+    
+    # Định dạng gửi: 'binary' (bản ghi cố định 32 byte) hoặc 'json'
+    'wire_format': 'binary',
+    
+    # Hàng đợi báo cáo chưa gửi trên flash
+    'outbox': {
+        'path': 'outbox.bin',      # File bộ đệm vòng
+        'capacity': 1440,          # Số báo cáo tối đa (1 ngày nếu 1 phút/lần, ~46 KB)
+        'batch_size': 60,          # Số báo cáo mỗi request
+        'max_batches': 10          # Số request tối đa mỗi chu kỳ
+    },
     
     # Cấu hình cảm biến
     'sensors': {
@@ -25,11 +44,27 @@ CONFIG = {
         'i2c_sda': 21,             # Chân I2C SDA
         'sampling_interval': 5,    # Thời gian giữa các lần lấy mẫu (giây)
         'sample_count': 10,        # Số mẫu cần thu thập
-        'deep_sleep': False,       # Chế độ ngủ sâu
         'soil_min': 1000,          # Giá trị tối thiểu hợp lệ của cảm biến đất
         'soil_max': 3000           # Giá trị tối đa hợp lệ của cảm biến đất
     },
     
+    # Lịch hoạt động và ước tính thời lượng pin
+    'power': {
+        'deep_sleep': False,       # Ngủ nhẹ giữa các mẫu, ngủ sâu giữa các chu kỳ, tắt WiFi sau khi gửi
+        'cycle_sleep': 60,         # Thời gian nghỉ giữa hai chu kỳ (giây)
+        'upload_every': 1,         # Gửi mỗi N chu kỳ (báo cáo có cảnh báo được gửi ngay)
+        'state_store': 'rtc',      # Nơi giữ trạng thái qua deep sleep: 'rtc' hoặc 'flash'
+        'state_path': 'state.json',
+        'battery_mah': 2000,       # Dung lượng pin
+        'current_ma': {            # Dòng tiêu thụ ước tính theo trạng thái
+            'active': 40,          # CPU chạy, WiFi tắt
+            'radio': 120,          # WiFi bật, đang kết nối/gửi
+            'idle': 40,            # time.sleep (không ngủ sâu)
+            'light_sleep': 0.8,
+            'deep_sleep': 0.15
+        }
+    },
+    
     # Hệ số hồi quy cho dự báo mưa
     'regression_coeffs': {
         'intercept': -5.0,
@@ -39,6 +74,15 @@ CONFIG = {
         'pressure': -0.02,         # Áp suất khí quyển
         'pressure_trend': 0.5      # Xu hướng áp suất
     },
+    # Cách đổi tổ hợp tuyến tính thành xác suất: 'identity' (cắt về 0-1) hoặc 'logistic'
+    'rain_link': 'identity',
+    
+    # Hệ số do server huấn luyện (ghi đè regression_coeffs/rain_link khi tải về được)
+    'model': {
+        'url': "http://192.168.254.185:5000/api/model/latest",
+        'path': 'model.json',      # Bản đã tải, dùng lại sau khi khởi động lại
+        'check_every': 60          # Hỏi server mỗi N lần gửi dữ liệu
+    },
     
     # Ngưỡng dự báo thời tiết
     'weather_thresholds': [
@@ -67,37 +111,14 @@ CONFIG = {
 }
 
 ## 2. LỚP XỬ LÝ DỮ LIỆU THỐNG KÊ
-class DataProcessor:
-    @staticmethod
-    def get_median(values):
-        """Tính giá trị trung vị"""
-        if not values:
-            return 0
-        sorted_vals = sorted(values)
-        n = len(sorted_vals)
-        mid = n // 2
-        if n % 2 == 1:
-            return sorted_vals[mid]
-        return (sorted_vals[mid-1] + sorted_vals[mid]) / 2
-
-    @staticmethod
-    def filter_outliers(values):
-        """Lọc giá trị ngoại lai bằng phương pháp IQR"""
-        if len(values) < 4:
-            return values
-            
-        q1 = DataProcessor.get_median(values[:len(values)//2])
-        q3 = DataProcessor.get_median(values[len(values)//2:])
-        iqr = q3 - q1
-        
-        lower = q1 - 1.5 * iqr
-        upper = q3 + 1.5 * iqr
-        
-        return [v for v in values if lower <= v <= upper]
+# Lọc nhiễu IQR và lấy trung bình: sample_window.SampleWindow (không cấp phát mỗi chu kỳ)
 
 ## 3. LỚP QUẢN LÝ CẢM BIẾN
 class SensorManager:
-    def __init__(self):
+    # Cửa sổ mẫu dùng chung cho mọi chu kỳ (SensorManager được tạo lại mỗi chu kỳ)
+    windows = None
+
+    def __init__(self, state=None):
         # Khởi tạo I2C với timeout
         self.i2c = I2C(0, scl=Pin(CONFIG['sensors']['i2c_scl']), 
                       sda=Pin(CONFIG['sensors']['i2c_sda']), 
@@ -105,7 +126,9 @@ class SensorManager:
         
         # Khởi tạo BME280 với kiểm tra lỗi
         try:
-            self.bme = bme280.BME280(i2c=self.i2c)
+            # Oversampling x1 (cấu hình 'weather monitoring' của Bosch): mỗi lần đọc,
+            # thư viện đặt chế độ forced, cảm biến đo một lần (~10 ms) rồi tự về sleep
+            self.bme = bme280.BME280(i2c=self.i2c, mode=bme280.BME280_OSAMPLE_1)
             print("Khởi tạo BME280 thành công")
         except Exception as e:
             print("Lỗi khởi tạo BME280:", e)
@@ -115,8 +138,8 @@ class SensorManager:
         self.soil_sensor = ADC(Pin(CONFIG['sensors']['soil_pin']))
         self.soil_sensor.atten(ADC.ATTN_11DB)
         
-        # Lịch sử áp suất 3 giờ (6 mẫu, mỗi mẫu 30 phút)
-        self.pressure_history = deque((), 6)
+        # Lịch sử áp suất 3 giờ theo thời gian thực (ô 10 phút, bộ nhớ cố định)
+        self.pressure_history = PressureTrend()
         
         # Giá trị đọc trước đó
         self.last_valid_read = {
@@ -126,6 +149,18 @@ class SensorManager:
             'soil_moisture': CONFIG['default_values']['soil_moisture']
         }
 
+        # Khôi phục trạng thái đã lưu trước lần ngủ sâu
+        if state:
+            self.pressure_history.load_state(state.get('pressure_history'))
+            self.last_valid_read.update(state.get('last_valid_read', {}))
+
+    def export_state(self):
+        """Trạng thái cần giữ qua deep sleep"""
+        return {
+            'pressure_history': self.pressure_history.to_state(),
+            'last_valid_read': self.last_valid_read
+        }
+
     def read_bme280(self):
         """Đọc giá trị từ BME280 với xử lý lỗi"""
         if not self.bme:
@@ -133,10 +168,9 @@ class SensorManager:
             return (float('nan'), float('nan'), float('nan'))
         
         try:
-            temp, pressure, humidity = self.bme.values
-            temp_val = float(temp[:-1])    # Bỏ 'C'
-            pressure_val = float(pressure[:-3]) # Bỏ 'hPa'
-            humidity_val = float(humidity[:-1])  # Bỏ '%'
+            # Số thực trực tiếp (áp suất theo Pa), không qua chuỗi như .values
+            temp_val, pressure_pa, humidity_val = self.bme.read_compensated_data()
+            pressure_val = pressure_pa / 100
             
             # Kiểm tra giá trị hợp lệ
             if -40 <= temp_val <= 85 and 300 <= pressure_val <= 1100 and 0 <= humidity_val <= 100:
@@ -166,9 +200,24 @@ class SensorManager:
             print("Lỗi đọc cảm biến đất:", e)
             return float('nan')
 
-    def collect_samples(self):
+    def sample_windows(self):
+        """Cấp phát cửa sổ mẫu một lần; chỉ cấp phát lại khi sample_count thay đổi"""
+        count = CONFIG['sensors']['sample_count']
+        windows = SensorManager.windows
+        if windows is None or windows['temperature'].capacity != count:
+            # 'f': số thực của MicroPython trên ESP32 vốn là 32 bit
+            windows = {key: SampleWindow(count, 'f')
+                       for key in ('temperature', 'humidity', 'pressure', 'soil_moisture')}
+            SensorManager.windows = windows
+        for window in windows.values():
+            window.reset()
+        return windows
+
+    def collect_samples(self, scheduler):
         """Thu thập và xử lý nhiều mẫu dữ liệu"""
-        temps, hums, pressures, soils = [], [], [], []
+        windows = self.sample_windows()
+        temps, hums = windows['temperature'], windows['humidity']
+        pressures, soils = windows['pressure'], windows['soil_moisture']
 
         print(f"Bắt đầu thu thập {CONFIG['sensors']['sample_count']} mẫu...")
         
@@ -177,36 +226,32 @@ class SensorManager:
             temp, pressure, humidity = self.read_bme280()
             soil = self.read_soil_moisture()
 
-            # Ghi lại giá trị hợp lệ
-            if not math.isnan(temp):
-                temps.append(temp)
-            if not math.isnan(humidity):
-                hums.append(humidity)
-            if not math.isnan(pressure):
-                pressures.append(pressure)
-            if not math.isnan(soil):
-                soils.append(soil)
+            # Ghi lại giá trị hợp lệ (SampleWindow bỏ qua NaN)
+            temps.add(temp)
+            hums.add(humidity)
+            pressures.add(pressure)
+            soils.add(soil)
 
             # Hiển thị thông tin debug
             print(f"[{i+1:02}] T: {temp:.1f}°C, H: {humidity:.1f}%, P: {pressure:.1f} hPa, Soil: {soil}")
 
             # Chờ giữa các lần đọc
             if i < CONFIG['sensors']['sample_count'] - 1:
-                time.sleep(CONFIG['sensors']['sampling_interval'])
+                scheduler.pause(CONFIG['sensors']['sampling_interval'])
 
         # Xử lý dữ liệu với fallback
         def process_values(values, key):
-            if not values:
+            if not len(values):
                 print(f"⚠️ Không có dữ liệu {key} hợp lệ, sử dụng giá trị cuối cùng: {self.last_valid_read[key]}")
                 return self.last_valid_read[key]
             
-            # Lọc nhiễu
-            filtered = DataProcessor.filter_outliers(values)
-            if not filtered:
+            # Lọc nhiễu và lấy trung bình
+            mean = values.filtered_mean()
+            if mean is None:
                 print(f"⚠️ Tất cả giá trị {key} bị loại bỏ do nhiễu, sử dụng giá trị cuối cùng: {self.last_valid_read[key]}")
                 return self.last_valid_read[key]
                 
-            return sum(filtered)/len(filtered)
+            return mean
 
         result = {
             'temperature': process_values(temps, 'temperature'),
@@ -215,23 +260,45 @@ class SensorManager:
             'soil_moisture': process_values(soils, 'soil_moisture')
         }
 
-        # Cập nhật xu hướng áp suất
-        self.pressure_history.append(result['pressure'])
-        if len(self.pressure_history) > 6:
-            self.pressure_history.popleft()
+        # Cập nhật xu hướng áp suất (cùng timestamp với báo cáo gửi lên server)
+        result['timestamp'] = int(time.time())
+        if len(pressures):
+            self.pressure_history.add(result['timestamp'], result['pressure'])
         result['pressure_trend'] = self.calculate_pressure_trend()
 
         print("Kết thúc thu thập dữ liệu")
         return result
 
     def calculate_pressure_trend(self):
-        """Tính xu hướng thay đổi áp suất (hPa/3h)"""
-        if len(self.pressure_history) < 2:
-            return 0.0
-        return self.pressure_history[-1] - self.pressure_history[0]
+        """Tính xu hướng thay đổi áp suất (hPa/3h), bình phương tối thiểu trên 3 giờ gần nhất"""
+        return self.pressure_history.trend()
 
 ## 4. LỚP PHÂN TÍCH THỜI TIẾT
 class WeatherAnalyzer:
+    # Phiên bản hệ số do server huấn luyện đang dùng (None: hệ số trong CONFIG)
+    model_version = None
+
+    @staticmethod
+    def apply_model(model):
+        """Dùng bộ hệ số tải từ server thay cho regression_coeffs/rain_link"""
+        CONFIG['regression_coeffs'] = model['coeffs']
+        CONFIG['rain_link'] = model['link']
+        WeatherAnalyzer.model_version = model['version']
+
+    @staticmethod
+    def load_model():
+        """Nạp bộ hệ số đã lưu trên flash (một lần sau khi khởi động)"""
+        if WeatherAnalyzer.model_version is not None:
+            return
+        try:
+            with open(CONFIG['model']['path']) as f:
+                WeatherAnalyzer.apply_model(json.load(f))
+            print(f"Dùng hệ số mô hình phiên bản {WeatherAnalyzer.model_version}")
+        except OSError:
+            pass  # Chưa tải lần nào: dùng hệ số mặc định
+        except (ValueError, KeyError) as e:
+            print("File hệ số mô hình không hợp lệ:", e)
+
     @staticmethod
     def calculate_dew_point(temp, hum):
         """Tính điểm sương (°C)"""
@@ -302,6 +369,9 @@ class WeatherAnalyzer:
             CONFIG['regression_coeffs']['pressure_trend'] * min(0, pressure_trend)
         )
         
+        if CONFIG['rain_link'] == 'logistic':
+            prob = 1 / (1 + math.exp(-max(-50.0, min(50.0, prob))))
+        
         # Giới hạn trong khoảng 0-1
         return max(0.0, min(1.0, prob))
 
@@ -371,11 +441,15 @@ class WeatherAnalyzer:
 
 ## 5. LỚP QUẢN LÝ MẠNG
 class NetworkManager:
+    # Kết nối HTTP dùng chung cho mọi chu kỳ (NetworkManager được tạo lại mỗi chu kỳ)
+    http = None
+
     def __init__(self):
+        # Chỉ bật radio khi cần kết nối (connect_wifi)
         self.wlan = network.WLAN(network.STA_IF)
-        self.wlan.active(True)
         self.retry_count = 0
         self.max_retries = 3
+        self.outbox = Outbox(CONFIG['outbox']['path'], CONFIG['outbox']['capacity'])
 
     def connect_wifi(self):
         """Kết nối WiFi với cơ chế retry thông minh"""
@@ -383,6 +457,7 @@ class NetworkManager:
             return True
         
         print("\nĐang kết nối WiFi...")
+        self.wlan.active(True)
         self.wlan.connect(CONFIG['wifi_ssid'], CONFIG['wifi_password'])
         
         for i in range(20):  # Tăng timeout lên 20 giây
@@ -397,28 +472,53 @@ class NetworkManager:
         self.retry_count += 1
         return False
 
-    def send_data(self, data):
-        """Gửi dữ liệu đến server với xử lý lỗi đầy đủ"""
-        if not self.connect_wifi():
-            return False
-            
+    @staticmethod
+    def compact_report(report):
+        """Chỉ giữ các trường server lưu, theo tên trường của server"""
+        return {
+            'temp': report['temperature'],
+            'humi': report['humidity'],
+            'pres': report['pressure'],
+            'soil': report['soil_moisture'],
+            'ptrend': report['pressure_trend'],
+            'ah': report['absolute_humidity'],
+            'dew': report['dew_point'],
+            'rain': report['rain_probability'],
+            'comfort': report['comfort_index'],
+            'desc': report['weather_description'],
+            'alerts': report['alerts'],
+            'device_id': report['device_id'],
+            'timestamp': report['timestamp']
+        }
+
+    def build_payload(self, records):
+        """Tạo body và Content-Type cho các record nối liền nhau, theo CONFIG['wire_format']"""
+        if CONFIG['wire_format'] == 'binary':
+            return records, wire_format.CONTENT_TYPE
+        size = wire_format.RECORD_SIZE
+        readings = [wire_format.decode(records[i:i + size]) for i in range(0, len(records), size)]
+        return json.dumps(readings), 'application/json'
+
+    def post_batch(self, records):
+        """Gửi một lô record; trả về mã HTTP, hoặc None nếu lỗi mạng"""
+        start = time.ticks_ms()
         try:
-            headers = {'Content-Type': 'application/json'}
-            payload = json.dumps(data)
-            print("\nĐang gửi dữ liệu đến server...")
-            
-            # Thêm timeout và kiểm tra kết nối
-            response = urequests.post(
-                CONFIG['flask_server'],
-                data=payload,
-                headers=headers,
-                timeout=10
-            )
-            
-            print("Server phản hồi:", response.status_code, response.text)
-            response.close()
-            return True
-            
+            payload, content_type = self.build_payload(records)
+            if CONFIG['keep_alive']:
+                if NetworkManager.http is None:
+                    NetworkManager.http = HttpClient(CONFIG['flask_server'], timeout=10)
+                status, _ = NetworkManager.http.post(payload, content_type)
+            else:
+                response = urequests.post(
+                    CONFIG['flask_server'],
+                    data=payload,
+                    headers={'Content-Type': content_type},
+                    timeout=10
+                )
+                status = response.status_code
+                response.close()
+            print(f"Gửi xong sau {time.ticks_diff(time.ticks_ms(), start)} ms")
+            return status
         except OSError as e:
             if e.errno == 113:  # ECONNABORTED
                 print("Lỗi kết nối: Server từ chối hoặc timeout")
@@ -426,30 +526,209 @@ class NetworkManager:
                 print("Lỗi mạng:", e)
         except Exception as e:
             print("Lỗi khi gửi dữ liệu:", e)
-            
-        # Thử lại nếu cần
-        if self.retry_count < self.max_retries:
-            print(f"Thử lại ({self.retry_count + 1}/{self.max_retries})...")
+        return None
+
+    def get(self, url):
+        """GET một URL trên server, trả về (mã HTTP, body)"""
+        if CONFIG['keep_alive']:
+            if NetworkManager.http is None:
+                NetworkManager.http = HttpClient(CONFIG['flask_server'], timeout=10)
+            # Dùng chung kết nối giữ sẵn: url phải cùng server với flask_server
+            return NetworkManager.http.request('GET', path=parse_url(url)[2])
+        response = urequests.get(url, timeout=10)
+        try:
+            return response.status_code, response.content
+        finally:
+            response.close()
+
+    def update_model(self):
+        """Tải bộ hệ số mới hơn bản đang dùng (nếu server có), lưu lên flash và dùng ngay"""
+        url = CONFIG['model']['url'] + '?since=%d' % (WeatherAnalyzer.model_version or 0)
+        try:
+            status, body = self.get(url)
+            if status == 200:
+                model = json.loads(body)
+                with open(CONFIG['model']['path'], 'w') as f:
+                    json.dump(model, f)
+                WeatherAnalyzer.apply_model(model)
+                print(f"Đã cập nhật hệ số mô hình lên phiên bản {model['version']}")
+            elif status != 204:  # 204: không có bản mới hơn
+                print("Server phản hồi khi tải hệ số mô hình:", status)
+        except Exception as e:
+            print("Lỗi khi tải hệ số mô hình:", e)
+
+    def flush_outbox(self):
+        """Gửi các báo cáo đang chờ theo lô, cũ nhất trước. True nếu đã gửi hết"""
+        if not len(self.outbox):
+            return True
+        if not self.connect_wifi():
+            return False
+
+        settings = CONFIG['outbox']
+        failures = 0
+        for _ in range(settings['max_batches']):
+            if not len(self.outbox):
+                break
+            records = self.outbox.peek(settings['batch_size'])
+            count = len(records) // wire_format.RECORD_SIZE
+            print(f"\nĐang gửi {count}/{len(self.outbox)} báo cáo đến server...")
+            status = self.post_batch(records)
+
+            if status is not None and 200 <= status < 300:
+                self.outbox.drop(count)
+                failures = 0
+                continue
+            if status is not None and 400 <= status < 500 and status != 429:
+                # Server không bao giờ nhận lô này, bỏ đi để không chặn hàng đợi
+                print(f"Server từ chối lô ({status}), bỏ {count} báo cáo")
+                self.outbox.drop(count)
+                continue
+
+            # Lỗi mạng, server bận (429) hoặc lỗi server: giữ lại, thử lại sau
+            if status is not None:
+                print("Server phản hồi:", status)
+            failures += 1
+            if failures > self.max_retries:
+                break
+            print(f"Thử lại ({failures}/{self.max_retries})...")
             time.sleep(2)
-            return self.send_data(data)
-        
-        return False
 
-## 6. HÀM CHÍNH
-def main():
+        return not len(self.outbox)
+
+    def device_id(self):
+        """Địa chỉ MAC dạng hex (bật giao diện WiFi nếu cần để đọc MAC)"""
+        if not self.wlan.active():
+            self.wlan.active(True)
+        return ubinascii.hexlify(self.wlan.config('mac')).decode()
+
+    def radio_off(self):
+        """Tắt WiFi; kết nối keep-alive không còn dùng được"""
+        if NetworkManager.http is not None:
+            NetworkManager.http.close()
+        self.wlan.active(False)
+
+    def queue_report(self, data):
+        """Lưu báo cáo vào hàng đợi trên flash"""
+        self.outbox.append(wire_format.encode(self.compact_report(data)))
+        if self.outbox.dropped:
+            print(f"⚠️ Hàng đợi đầy, đã bỏ {self.outbox.dropped} báo cáo cũ nhất")
+
+    def send_data(self, data):
+        """Lưu báo cáo vào hàng đợi trên flash rồi gửi mọi báo cáo đang chờ"""
+        self.queue_report(data)
+        return self.flush_outbox()
+
+## 6. LỊCH HOẠT ĐỘNG VÀ NĂNG LƯỢNG
+class Scheduler:
+    """Điều phối thức/ngủ, giữ trạng thái qua deep sleep và ước tính thời lượng pin.
+
+    Thời gian mỗi chu kỳ được chia theo trạng thái trong CONFIG['power']['current_ma'];
+    tổng dồn được lưu cùng trạng thái để báo cáo duty cycle qua nhiều chu kỳ.
+    """
+    MODES = ('active', 'radio', 'idle', 'light_sleep', 'deep_sleep')
+
+    def __init__(self):
+        settings = CONFIG['power']
+        self.low_power = settings['deep_sleep']
+        self.store = DeviceState(settings['state_store'], settings['state_path'])
+        self.state = self.store.load()
+        self.cycle_ms = {mode: 0 for mode in self.MODES}
+        self._mode = 'active'
+        self._since = time.ticks_ms()
+
+    def _close_segment(self):
+        now = time.ticks_ms()
+        self.cycle_ms[self._mode] += time.ticks_diff(now, self._since)
+        self._since = now
+
+    def set_mode(self, mode):
+        """Chuyển trạng thái tính năng lượng ('active' hoặc 'radio')"""
+        self._close_segment()
+        self._mode = mode
+
+    def pause(self, seconds):
+        """Chờ giữa hai lần lấy mẫu: ngủ nhẹ (giữ RAM) ở chế độ tiết kiệm năng lượng"""
+        self._close_segment()
+        ms = int(seconds * 1000)
+        if self.low_power:
+            lightsleep(ms)
+            self.cycle_ms['light_sleep'] += ms
+        else:
+            time.sleep(seconds)
+            self.cycle_ms['idle'] += ms
+        self._since = time.ticks_ms()
+
+    def upload_due(self, report, pending):
+        """Có gửi trong chu kỳ này không: đủ upload_every chu kỳ, có cảnh báo, hoặc đủ một lô"""
+        waited = self.state.get('cycles_since_upload', 0) + 1
+        return (waited >= CONFIG['power']['upload_every'] or bool(report['alerts'])
+                or pending >= CONFIG['outbox']['batch_size'])
+
+    def uploaded(self, done):
+        self.state['cycles_since_upload'] = 0 if done else self.state.get('cycles_since_upload', 0) + 1
+
+    def model_check_due(self):
+        """Đã đủ CONFIG['model']['check_every'] lần gửi kể từ lần hỏi hệ số mô hình trước"""
+        every = CONFIG['model']['check_every']
+        count = self.state.get('uploads_since_model_check', every - 1) + 1
+        due = count >= every
+        self.state['uploads_since_model_check'] = 0 if due else count
+        return due
+
+    def report_duty_cycle(self):
+        """In duty cycle và thời lượng pin ước tính (chu kỳ này và tổng dồn)"""
+        currents = CONFIG['power']['current_ma']
+        totals = self.state.setdefault('energy_ms', {})
+        for mode in self.MODES:
+            totals[mode] = totals.get(mode, 0) + self.cycle_ms[mode]
+        self.state['cycles'] = self.state.get('cycles', 0) + 1
+
+        for label, spent in (('chu kỳ này', self.cycle_ms), (f"{self.state['cycles']} chu kỳ", totals)):
+            total = sum(spent.values())
+            if not total:
+                continue
+            awake = spent['active'] + spent['radio'] + spent['idle']
+            avg_ma = sum(spent[mode] * currents[mode] for mode in self.MODES) / total
+            hours = CONFIG['power']['battery_mah'] / avg_ma
+            print(f"🔋 {label}: thức {awake / total * 100:.1f}% (radio {spent['radio'] / total * 100:.1f}%), "
+                  f"trung bình {avg_ma:.2f} mA, pin ~{hours / 24:.1f} ngày")
+
+    def sleep(self):
+        """Lưu trạng thái rồi ngủ tới chu kỳ sau (deep sleep không quay lại hàm này)"""
+        self._close_segment()
+        ms = CONFIG['power']['cycle_sleep'] * 1000
+        self.cycle_ms['deep_sleep' if self.low_power else 'idle'] += ms
+        self.report_duty_cycle()
+        try:
+            self.store.save(self.state)
+        except Exception as e:
+            print("Lỗi lưu trạng thái:", e)
+
+        if self.low_power:
+            print("Đang chuyển sang chế độ ngủ sâu...")
+            deepsleep(ms)
+        else:
+            print(f"Chờ {CONFIG['power']['cycle_sleep']} giây trước khi bắt đầu chu kỳ mới...")
+            time.sleep(CONFIG['power']['cycle_sleep'])
+
+## 7. HÀM CHÍNH
+def main(scheduler):
     print("\n=== KHỞI ĐỘNG HỆ THỐNG DỰ BÁO THỜI TIẾT ===")
     print("Phiên bản: 2.0 - Ngày cập nhật: 15/11/2023")
     
+    network = None
     try:
         # Khởi tạo các thành phần
         print("\nĐang khởi tạo hệ thống...")
-        sensors = SensorManager()
+        sensors = SensorManager(scheduler.state.get('sensors'))
         analyzer = WeatherAnalyzer()
+        analyzer.load_model()
         network = NetworkManager()
         
         # Thu thập dữ liệu cảm biến
         print("\n[1/3] Đang thu thập dữ liệu cảm biến...")
-        sensor_data = sensors.collect_samples()
+        sensor_data = sensors.collect_samples(scheduler)
+        scheduler.state['sensors'] = sensors.export_state()
         
         # Phân tích thời tiết
         print("\n[2/3] Đang phân tích dữ liệu thời tiết...")
@@ -464,8 +743,9 @@ def main():
             if not math.isnan(weather_data['rain_probability'])
             else float('nan')
         )
-        report['device_id'] = ubinascii.hexlify(network.wlan.config('mac')).decode()
-        report['timestamp'] = int(time.time())
+        if 'device_id' not in scheduler.state:
+            scheduler.state['device_id'] = network.device_id()
+        report['device_id'] = scheduler.state['device_id']
         
         # Hiển thị kết quả
         print("\n=== KẾT QUẢ PHÂN TÍCH ===")
@@ -485,26 +765,37 @@ def main():
             for alert in report['alerts']:
                 print("-", alert)
         
-        # Gửi dữ liệu
-        print("\n[3/3] Đang gửi dữ liệu...")
-        if network.send_data(report):
-            print("✅ Gửi dữ liệu thành công!")
+        # Gửi dữ liệu (hoặc chỉ xếp hàng tới cửa sổ gửi sau)
+        if scheduler.upload_due(report, len(network.outbox) + 1):
+            print("\n[3/3] Đang gửi dữ liệu...")
+            scheduler.set_mode('radio')
+            sent = network.send_data(report)
+            if sent and scheduler.model_check_due():
+                network.update_model()
+            if scheduler.low_power:
+                network.radio_off()
+            scheduler.set_mode('active')
+            scheduler.uploaded(sent)
+            if sent:
+                print("✅ Gửi dữ liệu thành công!")
+            else:
+                print(f"❌ Chưa gửi được, {len(network.outbox)} báo cáo chờ gửi lại")
         else:
-            print("❌ Gửi dữ liệu thất bại!")
+            network.queue_report(report)
+            scheduler.uploaded(False)
+            print(f"\n[3/3] Đã lưu báo cáo, {len(network.outbox)} báo cáo chờ cửa sổ gửi tiếp theo")
         
     except Exception as e:
         print("\n⛔ LỖI HỆ THỐNG:", e)
     finally:
+        if network is not None:
+            network.outbox.close()
         # Dọn dẹp bộ nhớ
         gc.collect()
         print("\nHoàn tất chu kỳ hoạt động")
 
 if __name__ == '__main__':
     while True:
-        main()
-        if CONFIG['sensors']['deep_sleep']:
-            print("Đang chuyển sang chế độ ngủ sâu...")
-            deepsleep(60 * 1000)  # Ngủ 1 phút
-        else:
-            print("Chờ 60 giây trước khi bắt đầu chu kỳ mới...")
-            time.sleep(60)  # Chờ 1 phút
\ No newline at end of file
+        scheduler = Scheduler()
+        main(scheduler)
+        scheduler.sleep()
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""Đàn thiết bị gửi chậm: webserver_async.py (asyncio) so với serve.py (luồng).
+
+Mô phỏng --clients ESP32 cùng lúc POST /api/data thật chậm: mở kết nối trong
+--ramp giây, gửi header rồi nhỏ giọt thân JSON thành --pieces phần trong
+--slow đến --slow + --spread giây (quanh 10 giây timeout của
+NetworkManager.send_data), rồi chờ phản hồi. Trong lúc đó một dashboard poll GET /get_current mỗi 100 ms.
+Đo: số kết nối giữ đồng thời, số request thành công, độ trễ poll p50/p99,
+RSS và số luồng của tiến trình server.
+
+--compare chạy thêm một đàn nhỏ hơn (--compare-clients) vào serve.py với 1
+worker x --threads luồng: mỗi thiết bị gửi chậm giữ một luồng nên dashboard
+phải chờ tới khi có luồng rảnh.
+
+Kiểm tra (asyncio): mọi request thành công, gần như toàn bộ đàn được giữ
+đồng thời, số bản ghi trong database khớp, poll p99 dưới --max-probe-ms.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_async.py --clients 10000 --compare
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+import webserver_async  # noqa: E402
+from ingest_queue import percentile  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen([sys.executable] + command, env=env, cwd=ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    lines = []
+    # Đọc log liên tục để server không bị chặn vì đầy pipe
+    threading.Thread(target=lambda: lines.extend(process.stdout), daemon=True).start()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, lines
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{command[0]} không khởi động được:\n" + ''.join(lines))
+
+
+def proc_status(pid):
+    """(RSS MB, số luồng) của tiến trình pid"""
+    rss = threads = 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) / 1024
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss, threads
+
+
+def reading(device_id, timestamp):
+    return {'temp': round(20 + random.random() * 15, 2), 'humi': round(40 + random.random() * 55, 2),
+            'pres': 1013.2, 'soil': random.randint(1000, 3000), 'ptrend': 0.1, 'ah': 12.3,
+            'dew': 18.4, 'rain': 0.25, 'comfort': 70, 'desc': 'Ít khả năng có mưa',
+            'device_id': device_id, 'timestamp': timestamp}
+
+
+async def read_status(reader):
+    """Mã trạng thái của phản hồi HTTP (đọc hết nội dung theo Content-Length)"""
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+class Fleet:
+    def __init__(self, port):
+        self.port = port
+        self.open = 0
+        self.peak = 0
+        self.statuses = []
+
+    async def device(self, index, delay, slow, pieces):
+        await asyncio.sleep(delay)
+        body = json.dumps(reading(f'slow-{index:05}', int(time.time()))).encode()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', self.port)
+        except OSError:
+            self.statuses.append(0)
+            return
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+        try:
+            writer.write(f'POST /api/data HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                         f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode())
+            step = -(-len(body) // pieces)
+            for i in range(0, len(body), step):
+                await asyncio.sleep(slow / pieces)
+                writer.write(body[i:i + step])
+                await writer.drain()
+            self.statuses.append(await read_status(reader))
+        except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+            self.statuses.append(0)
+        finally:
+            self.open -= 1
+            writer.close()
+
+
+def probe(port, stop, results):
+    """Dashboard poll /get_current mỗi 100 ms trên một kết nối keep-alive.
+
+    Chạy trong tiến trình riêng để độ trễ đo được không lẫn thời gian event
+    loop của đàn thiết bị giả lập.
+    """
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    latencies = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            conn.request('GET', '/get_current')
+            conn.getresponse().read()
+        except (OSError, http.client.HTTPException):
+            break
+        latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.1)
+    conn.close()
+    results.put(latencies)
+
+
+async def run_fleet(port, pid, clients, ramp, slow, spread, pieces):
+    fleet = Fleet(port)
+    ctx = multiprocessing.get_context('fork')
+    stop = ctx.Event()
+    results = ctx.Queue()
+    prober = ctx.Process(target=probe, args=(port, stop, results))
+    prober.start()
+    started = time.perf_counter()
+    devices = asyncio.gather(*(fleet.device(i, ramp * i / clients, slow + random.uniform(0, spread), pieces)
+                               for i in range(clients)))
+    server = (0, 0)
+    while not devices.done():
+        await asyncio.sleep(0.5)
+        if fleet.open >= fleet.peak:
+            server = max(server, proc_status(pid))
+    await devices
+    elapsed = time.perf_counter() - started
+    stop.set()
+    latencies = results.get()
+    prober.join()
+    return fleet, latencies, elapsed, server
+
+
+def report(label, clients, fleet, latencies, elapsed, server):
+    ok = sum(1 for s in fleet.statuses if 200 <= s < 300)
+    print(f"{label:26s} {clients:6d} thiết bị: giữ đồng thời {fleet.peak:6d}, thành công {ok:6d}, "
+          f"{elapsed:6.1f}s | poll p50 {percentile(latencies, 50) or 0:7.1f} ms "
+          f"p99 {percentile(latencies, 99) or 0:8.1f} ms | server RSS {server[0]:6.1f} MB, {server[1]} luồng")
+    return ok
+
+
+def count_rows(prefix):
+    with storage.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM weather WHERE device_id LIKE ?", (prefix + '%',)).fetchone()[0]
+
+
+def seed():
+    storage.migrate()
+    storage.insert_readings([('node-000', 25.0, 60.0, 1013.0, 1500, 0.0, 12.0, 18.0, 0.3, 60,
+                              'Ít khả năng có mưa', int(time.time()), '2024-01-01 00:00:00')])
+    storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--ramp', type=float, default=3.0, help="Số giây mở hết các kết nối")
+    parser.add_argument('--slow', type=float, default=5.0, help="Số giây tối thiểu gửi thân mỗi request")
+    parser.add_argument('--spread', type=float, default=10.0,
+                        help="Thời gian gửi thêm ngẫu nhiên 0..spread giây (rải đều lúc request xong)")
+    parser.add_argument('--pieces', type=int, default=4)
+    parser.add_argument('--max-probe-ms', type=float, default=1000.0)
+    parser.add_argument('--compare', action='store_true', help="Chạy thêm serve.py (luồng) để so sánh")
+    parser.add_argument('--compare-clients', type=int, default=64)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ingest-mode', choices=('sync', 'async'), default='sync',
+                        help="INGEST_MODE của server (async: luồng ghi gom lô, chiếm GIL lâu hơn)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    files = webserver_async.raise_open_file_limit()
+    if files < args.clients + 100:
+        print(f"⚠️ Giới hạn {files} file mở: giảm --clients xuống {files - 100}")
+        args.clients = files - 100
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, WEATHER_DB=os.path.join(tmp, 'async.db'), INGEST_MODE=args.ingest_mode)
+        storage.configure(env['WEATHER_DB'])
+        seed()
+
+        port = free_port()
+        process, _ = start_server(['webserver_async.py', '--host', '127.0.0.1', '--port', str(port)], port, env)
+        try:
+            result = asyncio.run(run_fleet(port, process.pid, args.clients, args.ramp, args.slow, args.spread, args.pieces))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        fleet, latencies = result[0], result[1]
+        done = report('asyncio (webserver_async)', args.clients, *result)
+        stored = count_rows('slow-')     # Server đã ghi nốt hàng đợi khi thoát
+        p99 = percentile(latencies, 99) or float('inf')
+        print(f"{'':26s} database: {stored} bản ghi")
+        ok &= done == stored == args.clients and fleet.peak >= 0.9 * args.clients and p99 <= args.max_probe_ms
+
+        if args.compare:
+            port = free_port()
+            process, _ = start_server(['serve.py', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                                       '--threads', str(args.threads), '--timeout', '120'], port, env)
+            try:
+                pid = next(int(p) for p in subprocess.check_output(['pgrep', '-P', str(process.pid)]).split())
+                result = asyncio.run(run_fleet(port, pid, args.compare_clients, args.ramp, args.slow, args.spread, args.pieces))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            report(f'luồng (serve.py 1x{args.threads})', args.compare_clients, *result)
+    print("✅ khớp" if ok else "❌ không khớp")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
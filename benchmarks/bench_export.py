@@ -0,0 +1,240 @@
+"""Đo xuất dữ liệu theo luồng (export.py): tốc độ (bản ghi/giây) và bộ nhớ theo định dạng.
+
+Sinh --rows bản ghi (--months tháng, --devices thiết bị) vào database tạm rồi
+với mỗi định dạng csv/arrow/parquet:
+- xuất toàn bộ, và chỉ 1/8 khoảng thời gian, trong tiến trình con riêng (spawn)
+  để đo RSS đỉnh: bộ nhớ phải gần như không đổi dù khoảng xuất lớn gấp 8;
+- so với cách cũ (nạp hết vào một list rồi mới ghi) để thấy bộ nhớ tăng theo dữ liệu;
+- đọc lại file (csv, pyarrow) kiểm tra số dòng và tổng nhiệt độ khớp database;
+- xuất lọc theo vài thiết bị (trộn nhiều cursor) và qua endpoint /api/export;
+- giá trị lẻ ở cột INTEGER (soil_moisture, comfort_index) và timestamp lẻ
+  phải đọc lại nguyên vẹn từ arrow/parquet, không bị cắt thành số nguyên.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_export.py --rows 1000000
+"""
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import export  # noqa: E402
+import storage  # noqa: E402
+
+DAY = 86400
+
+
+def fill(rows, months, devices):
+    storage.migrate()
+    end = int(time.time())
+    start = end - months * 30 * DAY
+    step = (end - start) / rows
+    batch = []
+    for i in range(rows):
+        # Làm tròn như số liệu thiết bị gửi lên
+        batch.append((f'node-{i % devices:03}', round(20 + random.random() * 15, 2),
+                      round(40 + random.random() * 55, 2), round(995 + random.random() * 25, 2),
+                      random.randint(1000, 3000), round(random.uniform(-3, 3), 2),
+                      round(10 + random.random() * 10, 2), round(15 + random.random() * 10, 2),
+                      round(random.random(), 3), random.randint(0, 100), 'Ít khả năng có mưa',
+                      int(start + i * step), '2024-01-01 00:00:00'))
+        if len(batch) >= 50000:
+            storage.insert_readings(batch)
+            batch = []
+    if batch:
+        storage.insert_readings(batch)
+    return start, end
+
+
+def child(db, fmt, start, end, device_ids, naive, path, queue):
+    """Chạy trong tiến trình con: xuất ra path, gửi (số dòng, byte, giây, RSS đỉnh MB)"""
+    storage.configure(db)
+    rows = 0
+
+    def count(n):
+        nonlocal rows
+        rows += n
+
+    started = time.perf_counter()
+    with open(path, 'wb') as out:
+        if naive:
+            # Cách cũ: nạp toàn bộ kết quả rồi mới mã hóa
+            with storage.connection() as conn:
+                data = conn.execute(f"SELECT {', '.join(export.COLUMNS)} FROM weather "
+                                    "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp, id",
+                                    (start, end)).fetchall()
+            rows = len(data)
+            for part in export.iter_csv([data], list(export.COLUMNS)):
+                out.write(part)
+        else:
+            for part in export.export(fmt, None, start, end, device_ids, on_chunk=count):
+                out.write(part)
+        size = out.tell()
+    seconds = time.perf_counter() - started
+    queue.put((rows, size, seconds, peak_rss_mb()))
+
+
+def peak_rss_mb():
+    """RSS đỉnh của tiến trình (VmHWM; ru_maxrss trên Linux giữ giá trị của tiến trình cha qua exec)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(db, fmt, start, end, path, device_ids=None, naive=False):
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=child, args=(db, fmt, start, end, device_ids, naive, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def read_back(fmt, path):
+    """(số dòng, tổng nhiệt độ) của file đã xuất"""
+    if fmt == 'csv':
+        with open(path, encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            index = next(reader).index('temperature')
+            rows = total = 0
+            for row in reader:
+                rows += 1
+                total += float(row[index])
+        return rows, total
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    if fmt == 'parquet':
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_stream(source).read_all()
+    return table.num_rows, pc.sum(table['temperature']).as_py()
+
+
+def expected(start, end, device_ids=None):
+    where, params = "timestamp >= ? AND timestamp < ?", [start, end]
+    if device_ids:
+        where += f" AND device_id IN ({', '.join('?' * len(device_ids))})"
+        params += device_ids
+    with storage.connection() as conn:
+        return conn.execute(f"SELECT COUNT(*), SUM(temperature) FROM weather WHERE {where}",
+                            params).fetchone()
+
+
+def report(label, result):
+    rows, size, seconds, rss = result
+    print(f"{label:32s} {rows:9d} dòng {size / 1e6:8.1f} MB {seconds:7.2f}s "
+          f"{rows / seconds:10.0f} dòng/giây   RSS đỉnh {rss:7.1f} MB")
+
+
+def check(fmt, path, start, end, device_ids=None):
+    rows, total = read_back(fmt, path)
+    want_rows, want_total = expected(start, end, device_ids)
+    return rows == want_rows and abs(total - want_total) <= 1e-6 * abs(want_total)
+
+
+FRACTION_DEVICE = 'fraction'
+FRACTION_FIELDS = {'soil_moisture': 1500.5, 'comfort_index': 50.5}
+
+
+def check_fractions(timestamp):
+    """Bản ghi có giá trị lẻ ở cột INTEGER đọc lại khớp qua mọi định dạng pyarrow"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    storage.insert_readings([(FRACTION_DEVICE, 25.0, 60.0, 1010.0, FRACTION_FIELDS['soil_moisture'], 0.0,
+                              12.0, 17.0, 0.1, FRACTION_FIELDS['comfort_index'], 'Ít khả năng có mưa',
+                              timestamp, '2024-01-01 00:00:00')])
+    want = dict(FRACTION_FIELDS, timestamp=timestamp)
+    ok = True
+    for fmt in ('arrow', 'parquet'):
+        data = b''.join(export.export(fmt, columns=list(want), device_ids=[FRACTION_DEVICE]))
+        if fmt == 'parquet':
+            table = pq.read_table(pa.BufferReader(data))
+        else:
+            table = pa.ipc.open_stream(data).read_all()
+        got = {c: table[c][0].as_py() for c in want}
+        print(f"{fmt + ' giá trị lẻ':32s} {got}")
+        ok &= got == want
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--memory-slack', type=float, default=25.0,
+                        help="Chênh lệch RSS đỉnh tối đa (MB) giữa khoảng 1/8 và toàn bộ (page cache SQLite ~16 MB)")
+    parser.add_argument('--dir', help="Thư mục đặt database tạm")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    ok = True
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        db = os.path.join(tmp, 'export.db')
+        storage.configure(db)
+        started = time.perf_counter()
+        start, end = fill(args.rows, args.months, args.devices)
+        print(f"Đã sinh {args.rows} bản ghi trong {time.perf_counter() - started:.1f}s\n")
+        eighth = end - (end - start) // 8
+        path = os.path.join(tmp, 'out')
+
+        for fmt in export.available_formats():
+            small = run(db, fmt, eighth, end, path)
+            report(f"{fmt} 1/8 khoảng", small)
+            full = run(db, fmt, start, end, path)
+            report(f"{fmt} toàn bộ", full)
+            good = check(fmt, path, start, end)
+            flat = full[3] - small[3] <= args.memory_slack
+            print(f"{'':32s} đọc lại khớp: {good}, bộ nhớ không đổi: {flat}")
+            ok &= good and flat
+        if 'parquet' not in export.available_formats():
+            print("⚠️ Không có pyarrow: bỏ qua arrow/parquet")
+
+        small = run(db, 'csv', eighth, end, path, naive=True)
+        report("csv nạp hết (cách cũ) 1/8", small)
+        full = run(db, 'csv', start, end, path, naive=True)
+        report("csv nạp hết (cách cũ) toàn bộ", full)
+
+        devices = [f'node-{i:03}' for i in range(0, args.devices, max(1, args.devices // 4))][:4]
+        result = run(db, 'csv', start, end, path, device_ids=devices)
+        report(f"csv {len(devices)} thiết bị", result)
+        good = check('csv', path, start, end, devices)
+        print(f"{'':32s} đọc lại khớp: {good}")
+        ok &= good
+
+        import webserver3
+        client = webserver3.create_app().test_client()
+        started = time.perf_counter()
+        response = client.get(f'/api/export?format=csv&from={start}&to={end}')
+        rows = sum(1 for _ in csv.reader(io.StringIO(response.get_data(as_text=True)))) - 1
+        seconds = time.perf_counter() - started
+        print(f"{'/api/export csv (test client)':32s} {rows:9d} dòng {seconds:17.2f}s {rows / seconds:10.0f} dòng/giây")
+        ok &= response.status_code == 200 and rows == expected(start, end)[0]
+
+        if 'parquet' in export.available_formats():
+            # Ngoài [start, end) để không đổi số dòng của các phép kiểm tra trên
+            ok &= check_fractions(start - 1000.5)
+    print("✅ khớp" if ok else "❌ không khớp")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Đo độ trễ truy vấn get_history trước và sau khi tạo chỉ mục (migration v2).
+
+Sinh --rows bản ghi giả lập (mặc định 10 triệu) cho --devices trạm, mỗi trạm
+báo cáo một lần mỗi phút, bản ghi mới nhất là thời điểm hiện tại.
+
+Chạy: python benchmarks/bench_history_index.py --rows 10000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+
+def synthetic_rows(count, devices):
+    now = int(time.time())
+    minutes = count // devices + 1
+    start = now - minutes * 60
+    for i in range(count):
+        minute, device = divmod(i, devices)
+        yield (f'node-{device:03}', 20 + random.random() * 15, 40 + random.random() * 55,
+               995 + random.random() * 25, random.randint(1000, 3000),
+               random.uniform(-3, 3), 10 + random.random() * 10, 15 + random.random() * 10,
+               random.random(), random.randint(0, 100), 'Ít khả năng có mưa',
+               start + minute * 60, '2024-01-01 00:00:00')
+
+
+def fill(path, rows, devices):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(storage.SCHEMA_SQL)
+    start = time.perf_counter()
+    conn.executemany(storage.INSERT_SQL, synthetic_rows(rows, devices))
+    conn.commit()
+    conn.execute("PRAGMA user_version = 1")
+    conn.close()
+    print(f"Đã sinh {rows} bản ghi trong {time.perf_counter() - start:.1f}s")
+
+
+def measure(label, repeat, devices):
+    cutoff = time.time() - 24 * 3600
+    for name, kwargs in (('all devices', {}), ('one device', {'device_id': f'node-{devices // 2:03}'})):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            rows = storage.fetch_history('temperature', cutoff, limit=100, **kwargs)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"{label:6} {name:11}: median={timings[len(timings) // 2]:9.2f} ms  "
+              f"max={timings[-1]:9.2f} ms  ({len(rows)} rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--devices', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dir', help="Thư mục đặt database tạm (cần vài GB cho 10M bản ghi)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        fill(path, args.rows, args.devices)
+        storage.configure(path)
+
+        measure('before', args.repeat, args.devices)
+
+        start = time.perf_counter()
+        storage.migrate()
+        print(f"Migration (tạo chỉ mục) mất {time.perf_counter() - start:.1f}s")
+
+        measure('after', args.repeat, args.devices)
+        storage.configure()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""So sánh một lần tải dashboard: 9 request /get_history/<metric> và 1 request /get_history.
+
+Đo thời gian và số byte phản hồi cho cùng khoảng 24 giờ.
+
+Chạy: python benchmarks/bench_history_multi.py --rows 100000 --bucket raw
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def seed(storage, rows, devices):
+    now = int(time.time())
+    step = 86400 / rows
+    batch = [(f'node-{i % devices:02}', 20 + random.random() * 15, 40 + random.random() * 55,
+              995 + random.random() * 25, random.randint(1000, 3000),
+              random.uniform(-3, 3), 10 + random.random() * 10, 15 + random.random() * 10,
+              random.random(), random.randint(0, 100), 'Ít khả năng có mưa',
+              int(now - 86400 + i * step), '2024-01-01 00:00:00') for i in range(rows)]
+    storage.insert_readings(batch)
+
+
+def run(client, urls, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = 0
+        for url in urls:
+            resp = client.get(url)
+            assert resp.status_code == 200, resp.get_data(as_text=True)
+            size += len(resp.get_data())
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--bucket', default='auto', help="auto, raw, 5m, 1h, ...")
+    parser.add_argument('--limit', type=int, default=1000, help="Số dòng khi bucket=raw")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['WEATHER_DB'] = os.path.join(tmp, 'bench.db')
+        with contextlib.redirect_stdout(io.StringIO()):
+            import webserver3
+            import storage
+            app = webserver3.create_app()
+            seed(storage, args.rows, args.devices)
+            client = app.test_client()
+            query = f"bucket={args.bucket}&limit={args.limit}"
+            per_metric = run(client, [f'/get_history/{m}?{query}' for m in webserver3.METRIC_MAP],
+                             args.repeat)
+            combined = run(client, [f'/get_history?metrics=all&{query}'], args.repeat)
+        storage.configure()
+
+    print(f"rows={args.rows} bucket={args.bucket}")
+    print(f"9 x /get_history/<metric>: {per_metric[0]:8.2f} ms  {per_metric[1]:9d} bytes")
+    print(f"1 x /get_history         : {combined[0]:8.2f} ms  {combined[1]:9d} bytes")
+    print(f"tỉ lệ: thời gian x{per_metric[0] / combined[0]:.1f}, dung lượng x{per_metric[1] / combined[1]:.1f}")
+
+
+if __name__ == '__main__':
+    main()
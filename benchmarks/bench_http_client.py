@@ -0,0 +1,121 @@
+"""So sánh thời gian gửi mỗi báo cáo: urequests (mỗi request một kết nối
+HTTP/1.0) và http_client.HttpClient (một kết nối HTTP/1.1 keep-alive).
+
+Server thay thế là một server http.server HTTP/1.1 nhỏ trong tiến trình, giải
+mã lô bằng wire_format như /api/data/batch (server dev của werkzeug luôn đóng
+kết nối sau mỗi request nên không dùng được để đo keep-alive). Trên localhost
+chưa có độ trễ radio/WiFi; --rtt-ms thêm độ trễ giả lập cho mỗi lần đi-về
+(bắt tay TCP tốn thêm một lần đi-về).
+
+Chạy: python benchmarks/bench_http_client.py --reports 500 [--rtt-ms 20]
+"""
+import argparse
+import http.server
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wire_format  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+
+PATH = '/api/data/batch'
+
+
+def make_record(i):
+    return wire_format.encode({
+        'temp': 25.5, 'humi': 70.0, 'pres': 1009.5, 'soil': 2100, 'ptrend': -0.5,
+        'ah': 15.0, 'dew': 20.0, 'rain': 0.3, 'comfort': 60,
+        'desc': wire_format.DESCRIPTIONS[3], 'alerts': [],
+        'device_id': '246f28a1b2c3', 'timestamp': 1700000000 + i * 60,
+    })
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Nhận lô bản ghi nhị phân, trả JSON có Content-Length như /api/data/batch"""
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True     # Header và body ghi riêng; tránh trễ ACK 40 ms
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        readings = wire_format.decode_many(body)
+        reply = json.dumps({'status': 'success', 'accepted': len(readings), 'rejected': 0}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def urequests_post(port, body, rtt):
+    """Giống urequests.post + response.close(): kết nối mới, HTTP/1.0, đọc tới khi server đóng"""
+    time.sleep(rtt)                      # SYN / SYN-ACK
+    sock = socket.create_connection(('127.0.0.1', port))
+    try:
+        sock.sendall(b'POST %s HTTP/1.0\r\nHost: 127.0.0.1\r\nContent-Type: %s\r\n'
+                     b'Content-Length: %d\r\n\r\n'
+                     % (PATH.encode(), wire_format.CONTENT_TYPE.encode(), len(body)) + body)
+        time.sleep(rtt)                  # request / response
+        reader = sock.makefile('rb')
+        status = int(reader.readline().split()[1])
+        reader.read()
+        reader.close()
+    finally:
+        sock.close()
+    return status
+
+
+def bench(post, records):
+    times = []
+    for record in records:
+        start = time.perf_counter()
+        status = post(record)
+        times.append((time.perf_counter() - start) * 1000)
+        assert 200 <= status < 300, status
+    times.sort()
+    return sum(times) / len(times), times[len(times) // 2], times[int(len(times) * 0.99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reports', type=int, default=500)
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    args = parser.parse_args()
+
+    rtt = args.rtt_ms / 1000
+    records = [make_record(i) for i in range(args.reports)]
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    client = HttpClient(f'http://127.0.0.1:{port}{PATH}')
+
+    def keep_alive_post(body):
+        if client._sock is None:
+            time.sleep(rtt)              # Bắt tay TCP khi phải kết nối lại
+        time.sleep(rtt)
+        return client.post(body, wire_format.CONTENT_TYPE)[0]
+
+    results = {
+        'urequests': bench(lambda body: urequests_post(port, body, rtt), records),
+        'HttpClient keep-alive': bench(keep_alive_post, records),
+    }
+    client.close()
+    server.shutdown()
+
+    print(f"reports={args.reports} rtt={args.rtt_ms} ms  "
+          f"(HttpClient: {client.connects} kết nối cho {client.requests} request)")
+    for name, (mean, p50, p99) in results.items():
+        print(f"{name:22}: mean={mean:7.3f} ms  p50={p50:7.3f} ms  p99={p99:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""So sánh tốc độ ghi (rows/sec) giữa /api/data (từng bản ghi) và /api/data/batch.
+
+Với --mode async, thời gian tính tới khi luồng ghi đã ghi hết hàng đợi;
+độ trễ phản hồi request được in riêng.
+
+Chạy: python benchmarks/bench_ingest.py --rows 2000 --batch-size 500 [--mode async]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_reading(i, device_id='bench-node'):
+    return {
+        'temp': round(random.uniform(20, 35), 2),
+        'humi': round(random.uniform(40, 95), 2),
+        'pres': round(random.uniform(995, 1020), 2),
+        'soil': random.randint(1000, 3000),
+        'ptrend': round(random.uniform(-3, 3), 2),
+        'ah': round(random.uniform(10, 20), 2),
+        'dew': round(random.uniform(15, 25), 2),
+        'rain': round(random.random(), 3),
+        'comfort': random.randint(0, 100),
+        'desc': 'Ít khả năng có mưa',
+        'device_id': device_id,
+        'timestamp': 1700000000 + i * 60,
+    }
+
+
+def drain(webserver3):
+    if webserver3.ingest_queue is not None:
+        webserver3.ingest_queue.wait_idle()
+
+
+def bench_single(webserver3, client, readings, latencies):
+    start = time.perf_counter()
+    for reading in readings:
+        t0 = time.perf_counter()
+        resp = client.post('/api/data', json=reading)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert resp.status_code in (200, 202), resp.get_data(as_text=True)
+    drain(webserver3)
+    return time.perf_counter() - start
+
+
+def bench_batch(webserver3, client, readings, batch_size, ndjson=False):
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch_size):
+        chunk = readings[i:i + batch_size]
+        if ndjson:
+            body = '\n'.join(json.dumps(r) for r in chunk)
+            resp = client.post('/api/data/batch', data=body,
+                               content_type='application/x-ndjson')
+        else:
+            resp = client.post('/api/data/batch', json=chunk)
+        assert resp.status_code in (200, 202), resp.get_data(as_text=True)
+        assert resp.get_json()['accepted'] == len(chunk)
+    drain(webserver3)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    args = parser.parse_args()
+
+    readings = [make_reading(i) for i in range(args.rows)]
+
+    latencies = []
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['WEATHER_DB'] = os.path.join(tmp, 'bench.db')
+        os.environ['INGEST_MODE'] = args.mode
+        with contextlib.redirect_stdout(io.StringIO()):
+            import webserver3
+            client = webserver3.create_app().test_client()
+            single = bench_single(webserver3, client, readings, latencies)
+            batch = bench_batch(webserver3, client, readings, args.batch_size)
+            ndjson = bench_batch(webserver3, client, readings, args.batch_size, ndjson=True)
+            if webserver3.ingest_queue is not None:
+                webserver3.ingest_queue.stop()
+        webserver3.storage.configure()
+
+    latencies.sort()
+    print(f"mode={args.mode} rows={args.rows} batch_size={args.batch_size}")
+    print(f"single-row POST : {args.rows / single:10.0f} rows/sec  "
+          f"(request p50={latencies[len(latencies) // 2]:.2f} ms, "
+          f"p99={latencies[int(len(latencies) * 0.99)]:.2f} ms)")
+    print(f"batch JSON array: {args.rows / batch:10.0f} rows/sec")
+    print(f"batch NDJSON    : {args.rows / ndjson:10.0f} rows/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""So sánh lstsq.fit (chuẩn hóa + QR/Cholesky) với đường nghịch đảo cũ của do_an.py.
+
+legacy_inverse() dưới đây là bản sao nguyên văn calculate_regression_coefficients
+trước khi do_an.py chuyển sang lstsq. Với mỗi kịch bản cửa sổ 20 mẫu:
+- sai số hệ số so với nghiệm chính xác (giải phương trình chuẩn bằng
+  fractions.Fraction), theo hệ số lớn nhất;
+- số lần thất bại (ValueError, hoặc kết quả NaN/vô cùng);
+- chạy cả với float 64 bit (CPython) và float 32 bit (giả lập MicroPython trên
+  ESP32 bằng numpy.float32, phép tính giữ nguyên 32 bit);
+- số phép toán số thực mỗi lần fit (đếm bằng CountingFloat) và µs mỗi lần fit.
+Thoát với mã 1 nếu lstsq thất bại hoặc sai số float 64 bit vượt --tolerance.
+
+Chạy: python benchmarks/bench_lstsq.py --windows 300
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from fractions import Fraction
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lstsq  # noqa: E402
+
+
+def legacy_inverse(X, y):
+    """Đường cũ của do_an.py: X^T X thô, nghịch đảo Gauss-Jordan"""
+    if len(X) < 4:
+        print("Không đủ dữ liệu để tính hồi quy!")
+        return [0, 0, 0, 0]
+
+    def transpose(matrix):
+        return list(map(list, zip(*matrix)))
+
+    def matmul(A, B):
+        result = [[0] * len(B[0]) for _ in range(len(A))]
+        for i in range(len(A)):
+            for j in range(len(B[0])):
+                for k in range(len(B)):
+                    result[i][j] += A[i][k] * B[k][j]
+        return result
+
+    def inverse(matrix):
+        n = len(matrix)
+        identity_matrix = [[float(i == j) for i in range(n)] for j in range(n)]
+        augmented_matrix = [row[:] for row in matrix]
+
+        for i in range(n):
+            if augmented_matrix[i][i] == 0:
+                for j in range(i + 1, n):
+                    if augmented_matrix[j][i] != 0:
+                        augmented_matrix[i], augmented_matrix[j] = augmented_matrix[j], augmented_matrix[i]
+                        identity_matrix[i], identity_matrix[j] = identity_matrix[j], identity_matrix[i]
+                        break
+                else:
+                    raise ValueError("Matrix is not invertible")
+
+            diag = augmented_matrix[i][i]
+            for j in range(n):
+                augmented_matrix[i][j] /= diag
+                identity_matrix[i][j] /= diag
+
+            for j in range(n):
+                if i != j:
+                    factor = augmented_matrix[j][i]
+                    for k in range(n):
+                        augmented_matrix[j][k] -= factor * augmented_matrix[i][k]
+                        identity_matrix[j][k] -= factor * identity_matrix[i][k]
+
+        return identity_matrix
+
+    X_T = transpose(X)
+    X_T_X = matmul(X_T, X)
+    X_T_y = matmul(X_T, [[yi] for yi in y])
+    X_T_X_inv = inverse(X_T_X)
+    b = matmul(X_T_X_inv, X_T_y)
+    b = [row[0] for row in b]
+
+    return b
+
+
+METHODS = {
+    'nghịch đảo cũ': legacy_inverse,
+    'lstsq qr': lambda X, y: lstsq.fit(X, y, method='qr')[0],
+    'lstsq cholesky': lambda X, y: lstsq.fit(X, y, method='cholesky')[0],
+}
+
+
+class CountingFloat(float):
+    """Số thực đếm số phép toán số học thực hiện trên nó"""
+    ops = 0
+
+
+def _counted(name):
+    base = getattr(float, name)
+
+    def op(self, *args):
+        CountingFloat.ops += 1
+        result = base(self, *args)
+        return CountingFloat(result) if isinstance(result, float) else result
+    return op
+
+
+for _name in ('__add__', '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__',
+              '__truediv__', '__rtruediv__', '__pow__', '__neg__', '__abs__'):
+    setattr(CountingFloat, _name, _counted(_name))
+
+
+def window(kind, n=20):
+    """Một cửa sổ (X, y) theo kịch bản"""
+    rows = []
+    for _ in range(n):
+        if kind == 'do_an':
+            # Giá trị giả lập như do_an.py hiện tại
+            t, h, s = random.uniform(20, 40), random.uniform(30, 80), random.randint(400, 800)
+        elif kind == 'ổn định':
+            # Cảm biến thật trong 40 giây: thay đổi rất ít quanh giá trị trung bình
+            t, h, s = 29.5 + random.uniform(-0.05, 0.05), 60 + random.uniform(-0.2, 0.2), random.randint(598, 602)
+        else:
+            # Cảm biến đất kẹt một giá trị
+            t, h, s = random.uniform(20, 40), random.uniform(30, 80), 600
+        rows.append([1, t, h, s])
+    y = [float(random.random() < 0.4) for _ in rows]
+    return rows, y
+
+
+def exact_solution(X, y):
+    """Nghiệm chính xác của X^T X b = X^T y (Fraction), hoặc None nếu suy biến"""
+    k = len(X[0])
+    Xf = [[Fraction(v) for v in row] for row in X]
+    yf = [Fraction(v) for v in y]
+    a = [[sum(r[i] * r[j] for r in Xf) for j in range(k)] + [sum(r[i] * t for r, t in zip(Xf, yf))]
+         for i in range(k)]
+    for c in range(k):
+        pivot = next((r for r in range(c, k) if a[r][c] != 0), None)
+        if pivot is None:
+            return None
+        a[c], a[pivot] = a[pivot], a[c]
+        for r in range(k):
+            if r != c and a[r][c] != 0:
+                f = a[r][c] / a[c][c]
+                a[r] = [u - f * v for u, v in zip(a[r], a[c])]
+    return [float(a[i][k] / a[i][i]) for i in range(k)]
+
+
+def run(method, X, y, precision):
+    if precision == 'float32':
+        X = [[np.float32(v) for v in row] for row in X]
+        y = [np.float32(v) for v in y]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            b = [float(v) for v in method(X, y)]
+    except (ValueError, ZeroDivisionError):
+        return None
+    if any(math.isnan(v) or math.isinf(v) for v in b):
+        return None
+    return b
+
+
+def residual(X, y, b):
+    return math.sqrt(sum((sum(xi * bi for xi, bi in zip(row, b)) - yi) ** 2 for row, yi in zip(X, y)) / len(y))
+
+
+def accuracy(windows, tolerance):
+    ok = True
+    print(f"{'kịch bản':10s} {'số thực':8s} {'cách tính':15s} {'sai số trung vị':>16s} {'sai số lớn nhất':>16s} "
+          f"{'thất bại':>9s}")
+    for kind in ('do_an', 'ổn định', 'kẹt cảm biến'):
+        samples = [window(kind) for _ in range(windows)]
+        exact = [exact_solution(X, y) for X, y in samples]
+        raw = statistics.median(lstsq.raw_condition(X) for X, _ in samples)
+        std = statistics.median(lstsq.fit(X, y)[1] for X, y in samples)
+        print(f"-- {kind}: số điều kiện trung vị X thô {raw:.3g}, sau chuẩn hóa {std:.3g}")
+        for precision in ('float64', 'float32'):
+            for name, method in METHODS.items():
+                errors, failures = [], 0
+                for (X, y), ref in zip(samples, exact):
+                    b = run(method, X, y, precision)
+                    if b is None:
+                        failures += 1
+                        continue
+                    if ref is not None:
+                        errors.append(max(abs(u - v) for u, v in zip(b, ref)) / max(abs(v) for v in ref))
+                    else:
+                        # Không có nghiệm duy nhất: so phần dư với phần dư nhỏ nhất có thể
+                        best = np.linalg.lstsq(np.array(X, dtype=float), np.array(y), rcond=None)[0]
+                        errors.append(residual(X, y, b) / residual(X, y, best) - 1)
+                median = f"{statistics.median(errors):.2e}" if errors else '-'
+                worst = f"{max(errors):.2e}" if errors else '-'
+                print(f"{kind:10s} {precision:8s} {name:15s} {median:>16s} {worst:>16s} {failures:>9d}")
+                if name.startswith('lstsq'):
+                    ok &= failures == 0
+                    if precision == 'float64' and errors:
+                        ok &= max(errors) <= tolerance
+    return ok
+
+
+def performance(fits):
+    print(f"\n{'cách tính':15s} {'phép toán/fit':>14s} {'µs/fit':>10s} {'fit/giây':>10s}")
+    samples = [window('do_an') for _ in range(fits)]
+    for name, method in METHODS.items():
+        X, y = samples[0]
+        CountingFloat.ops = 0
+        method([[CountingFloat(v) for v in row] for row in X], [CountingFloat(v) for v in y])
+        ops = CountingFloat.ops
+        start = time.perf_counter()
+        for X, y in samples:
+            method(X, y)
+        us = (time.perf_counter() - start) / fits * 1e6
+        print(f"{name:15s} {ops:14d} {us:10.1f} {1e6 / us:10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--windows', type=int, default=300)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    ok = accuracy(args.windows, args.tolerance)
+    performance(args.windows)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""So sánh gửi từng báo cáo một (như trước) với gửi theo lô từ outbox.
+
+Chạy server Flask (werkzeug) trong tiến trình. Mỗi request mở một kết nối
+TCP mới như urequests trên ESP32. Mô phỏng một lần mất mạng: các báo cáo
+dồn vào outbox.Outbox rồi được gửi theo lô khi có mạng lại. In số request,
+số byte gửi đi và thời gian cho mỗi báo cáo.
+
+Chạy: python benchmarks/bench_outbox.py --reports 1440 --batch-size 60
+"""
+import argparse
+import http.client
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wire_format  # noqa: E402
+from outbox import Outbox  # noqa: E402
+
+
+def make_record(i):
+    return wire_format.encode({
+        'temp': random.uniform(20, 35), 'humi': random.uniform(40, 95),
+        'pres': random.uniform(995, 1020), 'soil': random.randint(1000, 3000),
+        'ptrend': random.uniform(-3, 3), 'ah': random.uniform(10, 20),
+        'dew': random.uniform(15, 25), 'rain': random.random(),
+        'comfort': random.randint(0, 100), 'desc': wire_format.DESCRIPTIONS[3],
+        'alerts': [], 'device_id': '246f28a1b2c3', 'timestamp': 1700000000 + i * 60,
+    })
+
+
+def post(port, path, body):
+    """Một request trên một kết nối mới; trả về số byte đã gửi"""
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': wire_format.CONTENT_TYPE}
+    conn.request('POST', path, body, headers)
+    status = conn.getresponse()
+    status.read()
+    conn.close()
+    assert 200 <= status.status < 300, status.status
+    request_line = f'POST {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+    header_bytes = sum(len(f'{k}: {v}\r\n') for k, v in headers.items())
+    return len(request_line) + header_bytes + len('Content-Length: \r\n\r\n') + len(str(len(body))) + len(body)
+
+
+def bench_single(port, records):
+    sent = 0
+    start = time.perf_counter()
+    for record in records:
+        sent += post(port, '/api/data', record)
+    return len(records), sent, time.perf_counter() - start
+
+
+def bench_outbox(port, records, path, batch_size):
+    outbox = Outbox(path, capacity=len(records))
+    for record in records:           # Mất mạng: báo cáo dồn lại trên flash
+        outbox.append(record)
+    requests = sent = 0
+    start = time.perf_counter()
+    while len(outbox):
+        body = outbox.peek(batch_size)
+        sent += post(port, '/api/data/batch', body)
+        outbox.drop(len(body) // wire_format.RECORD_SIZE)
+        requests += 1
+    elapsed = time.perf_counter() - start
+    outbox.close()
+    return requests, sent, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--reports', type=int, default=1440)
+    parser.add_argument('--batch-size', type=int, default=60)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+
+    records = [make_record(i) for i in range(args.reports)]
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['WEATHER_DB'] = os.path.join(tmp, 'bench.db')
+        # receive_data in ra từng bản ghi; bỏ qua để không ảnh hưởng phép đo
+        sys.stdout = open(os.devnull, 'w')
+        import webserver3
+        server = make_server('127.0.0.1', 0, webserver3.create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        results = {
+            'từng báo cáo': bench_single(server.server_port, records),
+            f'outbox, lô {args.batch_size}': bench_outbox(server.server_port, records,
+                                                         os.path.join(tmp, 'outbox.bin'),
+                                                         args.batch_size),
+        }
+        server.shutdown()
+
+    print(f"reports={args.reports}", file=sys.__stdout__)
+    for name, (requests, sent, elapsed) in results.items():
+        print(f"{name:16}: {requests:5} request  {sent / args.reports:7.1f} byte/báo cáo  "
+              f"{elapsed / args.reports * 1000:7.3f} ms/báo cáo", file=sys.__stdout__)
+
+
+if __name__ == '__main__':
+    main()
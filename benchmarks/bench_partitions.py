@@ -0,0 +1,137 @@
+"""Hết hạn dữ liệu thô: DELETE trên bảng weather đơn so với xóa phân vùng tháng.
+
+Sinh cùng một tập bản ghi (--months tháng, --devices thiết bị) vào:
+- "before": bảng weather đơn của schema v5, hết hạn bằng DELETE ... WHERE timestamp < ?;
+- "after": schema hiện tại (phân vùng tháng sau VIEW weather), hết hạn bằng
+  storage.apply_retention().
+Đo thời gian hết hạn, dung lượng WAL sinh ra và độ trễ fetch_history trước/sau.
+Kiểm tra: số bản ghi thô còn lại đúng bằng số bản ghi trong các tháng được giữ,
+truy vấn thô đi qua VIEW cho cùng kết quả như bảng đơn, và bảng tổng hợp theo
+ngày vẫn trả về đủ các ngày đã hết hạn dữ liệu thô.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_partitions.py --months 12 --rows-per-month 200000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+
+def synthetic_rows(key, count, devices):
+    """count bản ghi rải đều trong tháng key"""
+    start, end = storage.partition_range(key)
+    step = (end - start) / count
+    for i in range(count):
+        yield (f'node-{i % devices:03}', 20 + random.random() * 15, 40 + random.random() * 55,
+               995 + random.random() * 25, random.randint(1000, 3000),
+               random.uniform(-3, 3), 10 + random.random() * 10, 15 + random.random() * 10,
+               random.random(), random.randint(0, 100), 'Ít khả năng có mưa',
+               int(start + i * step), '2024-01-01 00:00:00')
+
+
+def wal_size(path):
+    try:
+        return os.path.getsize(path + '-wal')
+    except OSError:
+        return 0
+
+
+def history_latency(repeat, since, until):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = storage.fetch_history('temperature', since, limit=100, until=until)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--rows-per-month', type=int, default=200000)
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--keep-days', type=float, default=90)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--dir', help="Thư mục đặt database tạm")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    now = time.time()
+    current = storage.partition_key(now)
+    keys = list(range(current - args.months + 1, current + 1))
+    cutoff = now - args.keep_days * 86400
+    kept = [k for k in keys if storage.partition_range(k)[1] > cutoff]
+    probe = storage.partition_range(kept[0])[0] + 86400     # Một ngày vẫn còn dữ liệu thô
+    ok = True
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        results = {}
+        for label in ('before', 'after'):
+            path = os.path.join(tmp, f'{label}.db')
+            storage.configure(path)
+            random.seed(args.seed)
+            start = time.perf_counter()
+            if label == 'before':
+                storage.migrate(target=5)
+                conn = sqlite3.connect(path)
+                for key in keys:
+                    conn.executemany(storage.INSERT_SQL, synthetic_rows(key, args.rows_per_month, args.devices))
+                    conn.commit()
+                conn.close()
+                with storage.transaction() as conn:
+                    for sql in storage.rollup_rebuild_statements():
+                        conn.execute(sql)
+            else:
+                storage.migrate()
+                for key in keys:
+                    rows = list(synthetic_rows(key, args.rows_per_month, args.devices))
+                    for lo in range(0, len(rows), 50000):
+                        storage.insert_readings(rows[lo:lo + 50000])
+            total = args.months * args.rows_per_month
+            print(f"{label:6}: ghi {total} bản ghi trong {time.perf_counter() - start:.1f}s")
+
+            latency_before, reference = history_latency(args.repeat, probe, probe + 86400)
+            with storage.connection() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            start = time.perf_counter()
+            if label == 'before':
+                with storage.transaction() as conn:
+                    deleted = conn.execute("DELETE FROM weather WHERE timestamp < ?",
+                                           (storage.partition_range(kept[0])[0],)).rowcount
+                what = f"DELETE {deleted} bản ghi"
+            else:
+                dropped = storage.apply_retention(args.keep_days, now)
+                what = f"DROP {len(dropped)} phân vùng"
+            seconds = time.perf_counter() - start
+            wal = wal_size(path)
+            latency_after, rows = history_latency(args.repeat, probe, probe + 86400)
+            with storage.connection() as conn:
+                remaining = conn.execute("SELECT COUNT(*) FROM weather").fetchone()[0]
+            days = storage.fetch_buckets('temperature', storage.partition_range(keys[0])[0],
+                                         storage.partition_range(keys[-1])[1], 86400)
+            print(f"{label:6}: hết hạn ({what}) {seconds * 1000:9.1f} ms, WAL {wal / 1e6:7.1f} MB | "
+                  f"fetch_history trước {latency_before:6.2f} ms, sau {latency_after:6.2f} ms | "
+                  f"còn {remaining} bản ghi thô, {len(days)} ngày tổng hợp")
+            results[label] = (remaining, rows, reference, len(days))
+
+        expected = len(kept) * args.rows_per_month
+        expected_days = (storage.partition_range(keys[-1])[1] - storage.partition_range(keys[0])[0]) // 86400
+        for label, (remaining, rows, reference, days) in results.items():
+            ok &= remaining == expected and rows == reference and days == expected_days
+        ok &= results['before'][1] == results['after'][1]
+    print("✅ khớp" if ok else "❌ không khớp")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Kiểm tra reanalysis (NumPy) cho kết quả giống WeatherAnalyzer của thiết bị,
+và đo tốc độ tính lại (rows/sec) trên database tạm.
+
+WeatherAnalyzer và CONFIG được lấy thẳng từ mã nguồn ban_phu.py (qua ast,
+không import được vì cần module machine của MicroPython), nên phép so khớp
+luôn dùng đúng mã đang chạy trên thiết bị. Thoát với mã 1 nếu có sai khác.
+
+Chạy: python benchmarks/bench_reanalysis.py --cases 200000 --rows 1000000
+"""
+import argparse
+import ast
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import reanalysis  # noqa: E402
+
+
+def load_device_code():
+    """(WeatherAnalyzer, CONFIG) từ ban_phu.py"""
+    with open(os.path.join(ROOT, 'ban_phu.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    wanted = [node for node in tree.body
+              if (isinstance(node, ast.Assign) and node.targets[0].id == 'CONFIG')
+              or (isinstance(node, ast.ClassDef) and node.name == 'WeatherAnalyzer')]
+    namespace = {'math': math}
+    exec(compile(ast.Module(body=wanted, type_ignores=[]), 'ban_phu.py', 'exec'), namespace)
+    return namespace['WeatherAnalyzer'], namespace['CONFIG']
+
+
+def check_params(config):
+    """DEFAULT_PARAMS phải trùng CONFIG của thiết bị"""
+    params = reanalysis.DEFAULT_PARAMS
+    errors = []
+    if params['regression_coeffs'] != config['regression_coeffs']:
+        errors.append('regression_coeffs')
+    if params['rain_link'] != config['rain_link']:
+        errors.append('rain_link')
+    device_thresholds = [{k: v for k, v in t.items() if k != 'comfort'}
+                         for t in config['weather_thresholds']]
+    if params['weather_thresholds'] != device_thresholds:
+        errors.append('weather_thresholds')
+    for key in ('high', 'low'):
+        if params['pressure_thresholds'][key] != config['pressure_thresholds'][key]:
+            errors.append(f'pressure_thresholds.{key}')
+    return errors
+
+
+def random_inputs(n):
+    """Đầu vào gồm giá trị thường, giá trị sát ngưỡng và NaN"""
+    nan = float('nan')
+    cases = []
+    for _ in range(n):
+        temp = random.choice([random.uniform(-10, 45), random.uniform(20, 32), nan])
+        hum = random.choice([random.uniform(5, 100), random.uniform(85, 100), 100.0, nan])
+        pressure = random.choice([random.uniform(970, 1030), 1000.0, 1020.0, nan])
+        soil = random.choice([float(random.randint(1000, 3000)), nan])
+        trend = random.choice([random.uniform(-5, 3), 0.0, nan])
+        cases.append((temp, hum, pressure, soil, trend))
+    return cases
+
+
+def check_parity(analyzer, cases):
+    columns = [np.array(c, dtype=np.float64) for c in zip(*cases)]
+    derived = reanalysis.derive(*columns)
+    mismatches = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, (temp, hum, pressure, soil, trend) in enumerate(cases):
+            expected = analyzer.analyze_weather({
+                'temperature': temp, 'humidity': hum, 'pressure': pressure,
+                'soil_moisture': soil, 'pressure_trend': trend})
+            for column in reanalysis.DERIVED_COLUMNS:
+                want = expected[column]
+                got = derived[column][i]
+                if isinstance(want, str) or column == 'comfort_index':
+                    same = want == got
+                elif math.isnan(want):
+                    same = math.isnan(got)
+                else:
+                    same = math.isclose(want, got, rel_tol=1e-9, abs_tol=1e-9)
+                if not same:
+                    mismatches += 1
+                    if mismatches <= 5:
+                        print(f"  khác nhau ở {column}: {cases[i]} -> thiết bị={want!r} numpy={got!r}",
+                              file=sys.__stdout__)
+    return mismatches
+
+
+def bench_scalar(analyzer, cases):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for temp, hum, pressure, soil, trend in cases:
+            analyzer.analyze_weather({'temperature': temp, 'humidity': hum, 'pressure': pressure,
+                                      'soil_moisture': soil, 'pressure_trend': trend})
+    return len(cases) / (time.perf_counter() - start)
+
+
+def fill_database(rows):
+    import storage
+    storage.init_db()
+    batch = []
+    for i in range(rows):
+        batch.append(('bench-node', round(random.uniform(20, 35), 2), round(random.uniform(40, 95), 2),
+                      round(random.uniform(995, 1020), 2), random.randint(1000, 3000),
+                      round(random.uniform(-3, 3), 2), None, None, None, None, None,
+                      1700000000 + i * 60, '2023-11-15 00:00:00'))
+        if len(batch) == 50000:
+            storage.insert_readings(batch)
+            batch = []
+    if batch:
+        storage.insert_readings(batch)
+
+
+COLLECTOR_DEVICE = 'bench-collector'
+
+BAD_PARAMS = [
+    {'weather_thresholds': 5},
+    {'weather_thresholds': [{'ah_min': 1}]},
+    {'weather_thresholds': [{'ah_min': 'x', 'temp_dew_max': 1, 'rain_prob': 0.5, 'description': 'a'}]},
+    {'regression_coeffs': 5},
+    {'regression_coeffs': {'unknown': 1.0}},
+    {'regression_coeffs': {'ah': '0.3'}},
+    {'pressure_thresholds': {'high': None}},
+    {'rain_link': 'probit'},
+    {'nope': 1},
+    [1, 2],
+]
+
+
+def check_merge_params():
+    """Số bộ tham số sai mà merge_params không báo ValueError"""
+    accepted = 0
+    for params in BAD_PARAMS:
+        try:
+            reanalysis.merge_params(params)
+        except ValueError:
+            continue
+        print(f"❌ merge_params nhận tham số sai: {params}")
+        accepted += 1
+    return accepted
+
+
+def add_collector_rows(rows):
+    """Thêm dòng kiểu collector.py (không có áp suất, rain 0/1 của nút)"""
+    import collector
+    import storage
+    payloads = [np.array((random.randint(2000, 3500), random.randint(4000, 9500),
+                          random.randint(1000, 3000), random.randint(0, 1)),
+                         dtype=collector.READING_DTYPE).tobytes() for _ in range(rows)]
+    timestamps = [1700000030 + i * 60 for i in range(rows)]
+    storage.insert_readings(collector.readings_to_rows(payloads, timestamps, COLLECTOR_DEVICE,
+                                                       '2023-11-15 00:00:00'),
+                            extra_columns=collector.PREDICTION_COLUMNS)
+
+
+def collector_snapshot():
+    import storage
+    with storage.connection() as conn:
+        return conn.execute("SELECT * FROM weather WHERE device_id = ? ORDER BY timestamp",
+                            (COLLECTOR_DEVICE,)).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', type=int, default=200000)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--collector-rows', type=int, default=10000,
+                        help="Số dòng kiểu collector.py (không áp suất) trộn vào database")
+    parser.add_argument('--chunk-size', type=int, default=reanalysis.DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    analyzer_cls, config = load_device_code()
+    analyzer = analyzer_cls()
+    errors = check_params(config)
+    if errors:
+        print(f"DEFAULT_PARAMS khác CONFIG của thiết bị: {', '.join(errors)}")
+
+    cases = random_inputs(args.cases)
+    mismatches = check_parity(analyzer, cases)
+    print(f"so khớp với WeatherAnalyzer: {args.cases * len(reanalysis.DERIVED_COLUMNS) - mismatches}/"
+          f"{args.cases * len(reanalysis.DERIVED_COLUMNS)} giá trị giống nhau")
+
+    scalar_rate = bench_scalar(analyzer, cases[:20000])
+    start = time.perf_counter()
+    reanalysis.derive(*[np.array(c, dtype=np.float64) for c in zip(*cases)])
+    vector_rate = args.cases / (time.perf_counter() - start)
+    print(f"chỉ tính toán: vô hướng {scalar_rate:12.0f} rows/sec | NumPy {vector_rate:12.0f} rows/sec")
+
+    bad_params = check_merge_params()
+    print(f"merge_params: {len(BAD_PARAMS) - bad_params}/{len(BAD_PARAMS)} bộ tham số sai bị từ chối")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['WEATHER_DB'] = os.path.join(tmp, 'bench.db')
+        import storage
+        storage.configure(os.environ['WEATHER_DB'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            fill_database(args.rows)
+            add_collector_rows(args.collector_rows)
+            before = collector_snapshot()
+            _, dry_seconds = reanalysis.reanalyze(chunk_size=args.chunk_size, dry_run=True)
+            rows, seconds = reanalysis.reanalyze(chunk_size=args.chunk_size)
+            changed = sum(a != b for a, b in zip(before, collector_snapshot()))
+        storage.get_pool().close_all()
+    print(f"database {rows} dòng: đọc+tính {rows / dry_seconds:10.0f} rows/sec, "
+          f"đọc+tính+ghi+tổng hợp lại {rows / seconds:10.0f} rows/sec ({seconds:.1f}s)")
+    print(f"{'✅' if not changed else '❌'} dòng collector (không áp suất) bị ghi đè: "
+          f"{changed}/{len(before)}")
+
+    sys.exit(1 if mismatches or errors or bad_params or changed or rows != args.rows else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""So sánh SlidingRLS với đường tính lại toàn bộ cửa sổ của do_an.py.
+
+calculate_regression_coefficients và store_data được lấy thẳng từ mã nguồn
+do_an.py (qua ast, không import được vì cần module machine của MicroPython).
+Script kiểm tra:
+- trên cùng chuỗi mẫu, hệ số của SlidingRLS (trên đặc trưng chuẩn hóa như
+  do_an.py, đổi lại theo giá trị thô) trùng hệ số của đường tính lại
+  (sai khác tương đối theo hệ số lớn nhất <= --tolerance);
+- khi SlidingRLS tính hoàn toàn bằng float 32 bit (như float của MicroPython
+  trên ESP32: mọi phép nhân/cộng/chia của Sherman-Morrison, resync và
+  Cholesky), đặc trưng chuẩn hóa sai khác so với lstsq ít hơn đặc trưng thô
+  và không quá --tolerance-f32;
+- cửa sổ suy biến (cảm biến kẹt một giá trị) không làm đường nào báo lỗi,
+  SlidingRLS vẫn cho hệ số hữu hạn; delta tăng tạm thời khi suy biến trở lại
+  giá trị cấu hình khi cửa sổ hết suy biến và sau reset();
+- thời gian mỗi lần đo (lưu mẫu + tính hệ số) theo kích thước cửa sổ.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_rls.py --steps 3000
+"""
+import argparse
+import ast
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lstsq  # noqa: E402
+from sliding_rls import SlidingRLS  # noqa: E402
+
+
+def load_device_namespace(max_data_size):
+    """Các hàm/hằng cần dùng của do_an.py với MAX_DATA_SIZE cho trước"""
+    with open(os.path.join(ROOT, 'do_an.py'), encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    wanted = [node for node in tree.body
+              if (isinstance(node, ast.FunctionDef)
+                  and node.name in ('calculate_regression_coefficients', 'store_data',
+                                    'standardize', 'unstandardize'))
+              or (isinstance(node, ast.Assign)
+                  and node.targets[0].id in ('RIDGE', 'CONDITION_WARNING',
+                                             'FEATURE_CENTER', 'FEATURE_SCALE'))]
+    # Đường tính lại toàn bộ luôn được dùng cho phép so sánh, bất kể SOLVER trên thiết bị
+    namespace = {'MAX_DATA_SIZE': max_data_size, 'SOLVER': 'lstsq', 'lstsq': lstsq}
+    exec(compile(ast.Module(body=wanted, type_ignores=[]), 'do_an.py', 'exec'), namespace)
+    return namespace
+
+
+def load_device_code(max_data_size):
+    """(store_data, calculate_regression_coefficients) từ do_an.py với MAX_DATA_SIZE cho trước"""
+    namespace = load_device_namespace(max_data_size)
+    return namespace['store_data'], namespace['calculate_regression_coefficients']
+
+
+def sample(stuck_soil=None):
+    """Một lần đo giả lập như do_an.py: (x, nhãn mưa)"""
+    temperature = random.uniform(20, 40)
+    humidity = random.uniform(30, 80)
+    soil = stuck_soil if stuck_soil is not None else random.randint(400, 800)
+    rain = 1 if (temperature < 25.0 or humidity > 70.0 or soil > 600) else 0
+    return [1, temperature, humidity, soil], rain
+
+
+def float32_rls(k, window):
+    """SlidingRLS tính bằng float 32 bit: bộ đệm là mảng NumPy float32 nên mọi giá
+    trị đọc ra là np.float32, và mọi phép tính với hằng Python vẫn là float32
+    (NumPy >= 2, NEP 50) - kể cả các list tạm trong resync/_cholesky_inverse.
+    """
+    rls = SlidingRLS(k, window, typecode='f')
+    for name in ('xs', 'ys', 'P', 'xty', '_u'):
+        setattr(rls, name, np.array(getattr(rls, name), dtype=np.float32))
+    return rls
+
+
+def parity_error(window, steps, float32=False, standardized=True):
+    """(sai khác tương đối lớn nhất so với đường tính lại lstsq float64, số lần so sánh)"""
+    namespace = load_device_namespace(window)
+    store_data, calculate = namespace['store_data'], namespace['calculate_regression_coefficients']
+    standardize = namespace['standardize'] if standardized else list
+    unstandardize = namespace['unstandardize'] if standardized else list
+    rls = float32_rls(4, window) if float32 else SlidingRLS(4, window)
+    X, y = [], []
+    worst = 0.0
+    compared = 0
+    for _ in range(steps):
+        x, rain = sample()
+        store_data(X, y, x, rain)
+        rls.add(standardize(x), rain)
+        if len(X) < 8:
+            continue
+        reference = calculate(X, y)
+        coefficients = rls.coefficients()
+        if float32 and not all(type(v) is np.float32 for v in coefficients):
+            raise TypeError("SlidingRLS đã tính bằng float64")
+        got = unstandardize(coefficients)
+        scale = max(abs(v) for v in reference) or 1.0
+        worst = max(worst, max(abs(a - b) for a, b in zip(got, reference)) / scale)
+        compared += 1
+    return worst, compared
+
+
+def check_parity(window, steps, tolerance):
+    worst, compared = parity_error(window, steps)
+    print(f"cửa sổ {window:4d}: {compared} lần so sánh, sai khác tương đối lớn nhất {worst:.2e}")
+    return worst <= tolerance
+
+
+def check_float32(window, steps, tolerance):
+    state = random.getstate()
+    raw, _ = parity_error(window, steps, float32=True, standardized=False)
+    random.setstate(state)
+    standardized, _ = parity_error(window, steps, float32=True)
+    print(f"float 32 bit, cửa sổ {window:4d}: sai khác lớn nhất đặc trưng thô {raw:.2e}, "
+          f"đặc trưng chuẩn hóa {standardized:.2e}")
+    return standardized <= tolerance and standardized < raw
+
+
+def check_singular(window):
+    store_data, calculate = load_device_code(window)
+    rls = SlidingRLS(4, window)
+    X, y = [], []
+    errors = 0
+    for _ in range(window * 3):
+        x, rain = sample(stuck_soil=500)
+        x[2] = 60.0                      # Độ ẩm cũng kẹt: X^T X suy biến
+        store_data(X, y, x, rain)
+        rls.add(x, rain)
+        if len(X) >= 4:
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    calculate(X, y)
+            except ValueError:
+                errors += 1
+    coefficients = rls.coefficients()
+    finite = all(not math.isnan(v) and not math.isinf(v) for v in coefficients)
+    print(f"cửa sổ suy biến: đường tính lại báo ValueError {errors} lần, "
+          f"SlidingRLS cho hệ số hữu hạn: {finite}")
+    return finite and not errors
+
+
+def check_delta(window, delta=1e-12):
+    """delta tăng tạm thời khi cửa sổ suy biến phải trở lại giá trị cấu hình
+    khi cửa sổ hết suy biến, và sau reset()
+    """
+    rls = SlidingRLS(4, window, delta=delta)
+    raised = delta
+    for _ in range(window * 3):
+        x, rain = sample(stuck_soil=500)
+        x[2] = 60.0
+        rls.add(x, rain)
+        raised = max(raised, rls.delta)
+    for _ in range(window * 3):
+        rls.add(*sample())
+    recovered = rls.delta
+    for _ in range(window * 3):
+        x, rain = sample(stuck_soil=500)
+        x[2] = 60.0
+        rls.add(x, rain)
+    stuck = rls.delta
+    rls.reset()
+    print(f"delta {delta:.0e}: khi suy biến tối đa {raised:.0e}, hết suy biến {recovered:.0e}, "
+          f"sau reset {rls.delta:.0e} (trước reset {stuck:.0e})")
+    return raised > delta and recovered == delta and rls.delta == delta
+
+
+def bench(window, steps):
+    store_data, calculate = load_device_code(window)
+    stream = [sample() for _ in range(steps + window)]
+
+    X, y = [], []
+    for x, rain in stream[:window]:
+        store_data(X, y, x, rain)
+    start = time.perf_counter()
+    for x, rain in stream[window:]:
+        store_data(X, y, x, rain)
+        calculate(X, y)
+    full_us = (time.perf_counter() - start) / steps * 1e6
+
+    rls = SlidingRLS(4, window)
+    for x, rain in stream[:window]:
+        rls.add(x, rain)
+    start = time.perf_counter()
+    for x, rain in stream[window:]:
+        rls.add(x, rain)
+        rls.coefficients()
+    rls_us = (time.perf_counter() - start) / steps * 1e6
+    print(f"cửa sổ {window:4d}: tính lại {full_us:9.1f} µs/lần đo | SlidingRLS {rls_us:7.1f} µs/lần đo "
+          f"(x{full_us / rls_us:.1f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--steps', type=int, default=3000)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    parser.add_argument('--tolerance-f32', type=float, default=1e-3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    ok = True
+    for window in (20, 200):
+        ok &= check_parity(window, args.steps, args.tolerance)
+    ok &= check_float32(200, args.steps, args.tolerance_f32)
+    ok &= check_singular(20)
+    ok &= check_delta(20)
+    for window in (20, 100, 500):
+        bench(window, min(args.steps, 1000))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""So sánh chi phí truy vấn lịch sử dài hạn: gộp từ dữ liệu thô và đọc bảng tổng hợp.
+
+Sinh --rows bản ghi trải đều trong --days ngày, sau đó đo thời gian lấy
+1 ngày (bucket 1h) và 1 năm (bucket 1d) theo hai cách.
+
+Chạy: python benchmarks/bench_rollups.py --rows 2000000 --days 365
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+
+def synthetic_rows(count, days, devices):
+    now = int(time.time())
+    step = days * 86400 / count
+    for i in range(count):
+        yield (f'node-{i % devices:02}', 20 + random.random() * 15, 40 + random.random() * 55,
+               995 + random.random() * 25, random.randint(1000, 3000),
+               random.uniform(-3, 3), 10 + random.random() * 10, 15 + random.random() * 10,
+               random.random(), random.randint(0, 100), 'Ít khả năng có mưa',
+               int(now - days * 86400 + i * step), '2024-01-01 00:00:00')
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2_000_000)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'bench.db'))
+        storage.migrate()
+
+        start = time.perf_counter()
+        batch = []
+        for row in synthetic_rows(args.rows, args.days, args.devices):
+            batch.append(row)
+            if len(batch) == 5000:
+                storage.insert_readings(batch)
+                batch = []
+        if batch:
+            storage.insert_readings(batch)
+        print(f"Ghi {args.rows} bản ghi (kèm cập nhật bảng tổng hợp): "
+              f"{args.rows / (time.perf_counter() - start):.0f} rows/sec")
+
+        now = time.time()
+        cases = [('1 ngày, bucket 1h', now - 86400, 3600),
+                 ('1 năm, bucket 1d', now - 365 * 86400, 86400)]
+        rollup_metrics = storage.ROLLUP_METRICS
+        for label, since, bucket in cases:
+            storage.ROLLUP_METRICS = {}
+            raw_ms, raw_n = timed(lambda: storage.fetch_buckets('temperature', since, now, bucket),
+                                  args.repeat)
+            storage.ROLLUP_METRICS = rollup_metrics
+            rollup_ms, rollup_n = timed(lambda: storage.fetch_buckets('temperature', since, now, bucket),
+                                        args.repeat)
+            print(f"{label:18}: thô {raw_ms:9.2f} ms ({raw_n} khung)   "
+                  f"tổng hợp {rollup_ms:7.2f} ms ({rollup_n} khung)")
+        storage.configure()
+
+
+if __name__ == '__main__':
+    main()
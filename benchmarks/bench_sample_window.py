@@ -0,0 +1,129 @@
+"""Kiểm tra SampleWindow cho kết quả giống bộ lọc IQR cũ, và so sánh thời gian
+và bộ nhớ cấp phát mỗi chu kỳ.
+
+Bộ lọc cũ (DataProcessor.get_median/filter_outliers + sum/len trong
+ban_phu.py trước đây) được chép lại bên dưới vì ban_phu.py chỉ chạy trên
+MicroPython. Thoát với mã 1 nếu có trường hợp kết quả khác nhau.
+
+Chạy: python benchmarks/bench_sample_window.py --cases 20000 --sizes 10,100,500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_window import SampleWindow  # noqa: E402
+
+
+def legacy_median(values):
+    if not values:
+        return 0
+    sorted_vals = sorted(values)
+    n = len(sorted_vals)
+    mid = n // 2
+    if n % 2 == 1:
+        return sorted_vals[mid]
+    return (sorted_vals[mid - 1] + sorted_vals[mid]) / 2
+
+
+def legacy_filtered_mean(values):
+    if len(values) >= 4:
+        q1 = legacy_median(values[:len(values) // 2])
+        q3 = legacy_median(values[len(values) // 2:])
+        iqr = q3 - q1
+        lower = q1 - 1.5 * iqr
+        upper = q3 + 1.5 * iqr
+        values = [v for v in values if lower <= v <= upper]
+    return sum(values) / len(values) if values else None
+
+
+def make_samples(n):
+    """Mẫu giống cảm biến: nhiễu Gauss, giá trị lặp (ADC), gai nhiễu, NaN"""
+    kind = random.randrange(4)
+    samples = []
+    for _ in range(n):
+        if kind == 0:
+            v = random.gauss(25, 0.3)
+        elif kind == 1:
+            v = float(random.randint(2000, 2004))
+        elif kind == 2:
+            v = random.gauss(1010, 0.5) if random.random() > 0.1 else random.uniform(300, 1100)
+        else:
+            v = round(random.uniform(40, 60), 1)
+        if random.random() < 0.05:
+            v = float('nan')
+        samples.append(v)
+    return samples
+
+
+def check(cases):
+    mismatches = 0
+    for _ in range(cases):
+        samples = make_samples(random.randint(1, 64))
+        window = SampleWindow(len(samples))
+        for v in samples:
+            window.add(v)
+        expected = legacy_filtered_mean([v for v in samples if v == v])
+        got = window.filtered_mean()
+        if (expected is None) != (got is None) or (
+                expected is not None and abs(expected - got) > 1e-9 * max(1.0, abs(expected))):
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"  khác nhau: {samples} -> cũ={expected} mới={got}")
+    return mismatches
+
+
+def measure(fn, cycles):
+    """(µs mỗi chu kỳ, đỉnh bộ nhớ cấp phát thêm); đo thời gian không bật tracemalloc"""
+    start = time.perf_counter()
+    for _ in range(cycles):
+        fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed / cycles * 1e6, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--sizes', default='10,100,500')
+    parser.add_argument('--cycles', type=int, default=200)
+    args = parser.parse_args()
+
+    mismatches = check(args.cases)
+    print(f"so khớp với bộ lọc cũ: {args.cases - mismatches}/{args.cases} trường hợp giống nhau")
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        samples = [v for v in make_samples(size) if v == v]
+        window = SampleWindow(size)
+
+        def legacy_cycle():
+            values = []
+            for v in samples:
+                values.append(v)
+            legacy_filtered_mean(values)
+
+        def window_cycle():
+            window.reset()
+            for v in samples:
+                window.add(v)
+            window.filtered_mean()
+
+        legacy_us, legacy_peak = measure(legacy_cycle, args.cycles)
+        window_us, window_peak = measure(window_cycle, args.cycles)
+        print(f"sample_count={size:4}: list+sorted {legacy_us:8.1f} µs, đỉnh cấp phát {legacy_peak:6} B | "
+              f"SampleWindow {window_us:8.1f} µs, đỉnh cấp phát {window_peak:6} B")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
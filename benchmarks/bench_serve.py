@@ -0,0 +1,229 @@
+"""Tải thử serve.py (gunicorn nhiều worker): request/giây theo số worker.
+
+Với mỗi số worker trong --workers, chạy serve.py trên database tạm (đã có sẵn
+--rows bản ghi), rồi --clients tiến trình tải, mỗi tiến trình --connections
+kết nối keep-alive, gửi liên tục trong --seconds giây một hỗn hợp:
+GET /get_current, GET /get_history/temperature (đọc database) và
+POST /api/data. In request/giây và hệ số so với 1 worker.
+
+Kiểm tra thêm trạng thái dùng chung: sau một POST, /get_current trên mọi
+worker (nhận ra qua pid trong /api/metrics) phải trả cùng bản ghi và cùng
+ETag trong vòng vài lần WATCH_INTERVAL; migration chỉ chạy một lần.
+Hệ số tăng tốc chỉ được kiểm tra khi máy có đủ CPU cho cả server và client
+(--workers lớn nhất x 2); trên máy ít CPU chỉ in ra để tham khảo.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_serve.py --workers 1,2,4 --seconds 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+import webserver3  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def seed(rows, devices):
+    storage.migrate()
+    now = int(time.time())
+    batch = [(f'node-{i % devices:03}', 20 + random.random() * 15, 40 + random.random() * 55,
+              995 + random.random() * 25, random.randint(1000, 3000), 0.0, 12.0, 18.0, 0.3, 60,
+              'Ít khả năng có mưa', now - (rows - i) * 30, '2024-01-01 00:00:00') for i in range(rows)]
+    storage.insert_readings(batch)
+    storage.close()
+
+
+def reading(device_id, timestamp):
+    return {'temp': round(20 + random.random() * 15, 2), 'humi': round(40 + random.random() * 55, 2),
+            'pres': 1013.2, 'soil': random.randint(1000, 3000), 'ptrend': 0.1, 'ah': 12.3,
+            'dew': 18.4, 'rain': 0.25, 'comfort': 70, 'desc': 'Ít khả năng có mưa',
+            'device_id': device_id, 'timestamp': timestamp}
+
+
+def request(conn, method, path, body=None, headers=None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.getheader('ETag'), response.read()
+
+
+def start_server(port, workers, threads, env):
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py'),
+                                '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+                                '--threads', str(threads)],
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, cwd=ROOT)
+    lines = []
+    # Đọc log liên tục để server không bị chặn vì đầy pipe
+    threading.Thread(target=lambda: lines.extend(process.stdout), daemon=True).start()
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            if request(conn, 'GET', '/')[0] == 200:
+                conn.close()
+                return process, lines
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("serve.py không khởi động được:\n" + ''.join(lines))
+
+
+def client(port, connections, seconds, index, results):
+    """Một tiến trình tải: connections luồng, mỗi luồng một kết nối keep-alive"""
+    counts = [0, 0]     # [thành công, lỗi]
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def loop(n):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        device = f'load-{index}-{n}'
+        timestamp = int(time.time())
+        i = ok = failed = 0
+        while time.time() < stop_at:
+            kind = i % 3
+            i += 1
+            try:
+                if kind == 0:
+                    status = request(conn, 'GET', f'/get_current?device_id=node-{i % 20:03}')[0]
+                elif kind == 1:
+                    status = request(conn, 'GET', '/get_history/temperature?bucket=raw&limit=50'
+                                     f'&device_id=node-{i % 20:03}&from=0')[0]
+                else:
+                    timestamp += 1
+                    status = request(conn, 'POST', '/api/data', json.dumps(reading(device, timestamp)),
+                                     {'Content-Type': 'application/json'})[0]
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                status = 0
+            if 200 <= status < 300:
+                ok += 1
+            else:
+                failed += 1
+        conn.close()
+        with lock:
+            counts[0] += ok
+            counts[1] += failed
+
+    threads = [threading.Thread(target=loop, args=(n,)) for n in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(tuple(counts))
+
+
+def load(port, clients, connections, seconds):
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    processes = [ctx.Process(target=client, args=(port, connections, seconds, i, results))
+                 for i in range(clients)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    counts = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    return sum(c[0] for c in counts), sum(c[1] for c in counts), elapsed
+
+
+def check_shared_state(port, workers):
+    """POST một bản ghi rồi hỏi mọi worker: cùng bản ghi, cùng ETag trên /get_current"""
+    device = 'shared-check'
+    timestamp = int(time.time()) + 3600
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    request(conn, 'POST', '/api/data', json.dumps(reading(device, timestamp)),
+            {'Content-Type': 'application/json'})
+    conn.close()
+    time.sleep(webserver3.WATCH_INTERVAL * 4)
+
+    seen = {}
+    deadline = time.time() + 10
+    # Kết nối mới mỗi lần để lần lượt rơi vào các worker khác nhau
+    while len(seen) < workers and time.time() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        pid = json.loads(request(conn, 'GET', '/api/metrics')[2])['pid']
+        status, etag, body = request(conn, 'GET', f'/get_current?device_id={device}')
+        conn.close()
+        seen[pid] = (status, etag, json.loads(body).get('timestamp'))
+    values = set(seen.values())
+    ok = len(values) == 1 and next(iter(values))[0] == 200 and next(iter(values))[2] == timestamp
+    print(f"    trạng thái dùng chung: {len(seen)}/{workers} worker trả cùng bản ghi/ETag: {ok}")
+    return ok and len(seen) == workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=max(2, os.cpu_count() or 1),
+                        help="Số tiến trình tải")
+    parser.add_argument('--connections', type=int, default=4, help="Số kết nối mỗi tiến trình tải")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--min-speedup', type=float, default=1.5,
+                        help="Hệ số tối thiểu của worker nhiều nhất so với 1 worker (khi đủ CPU)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    counts = [int(w) for w in args.workers.split(',')]
+    cpus = os.cpu_count() or 1
+    print(f"CPU: {cpus}, {args.clients} tiến trình tải x {args.connections} kết nối, {args.seconds:.0f}s mỗi lần")
+    ok = True
+    rates = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, WEATHER_DB=os.path.join(tmp, 'serve.db'))
+        env.pop('INGEST_MODE', None)
+        storage.configure(env['WEATHER_DB'])
+        seed(args.rows, 20)
+
+        for workers in counts:
+            port = free_port()
+            process, lines = start_server(port, workers, args.threads, env)
+            try:
+                done, failed, elapsed = load(port, args.clients, args.connections, args.seconds)
+                rates[workers] = done / elapsed
+                print(f"workers={workers:2d}: {rates[workers]:8.0f} request/giây "
+                      f"(x{rates[workers] / rates[counts[0]]:.2f}), lỗi {failed}")
+                ok &= failed == 0
+                ok &= check_shared_state(port, workers)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            migrations = sum('Migration' in line for line in lines)
+            if migrations:
+                print(f"    ❌ serve.py chạy {migrations} migration (database đã ở phiên bản mới nhất)")
+                ok = False
+
+    if cpus >= 2 * max(counts):
+        speedup = rates[max(counts)] / rates[min(counts)]
+        print(f"tăng tốc {max(counts)} worker / {min(counts)} worker: x{speedup:.2f}")
+        ok &= speedup >= args.min_speedup
+    else:
+        print(f"⚠️ Chỉ có {cpus} CPU cho cả server và client: không kiểm tra hệ số tăng tốc")
+    print("✅ khớp" if ok else "❌ không khớp")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Kiểm tra spool khi luồng ghi bị giết giữa chừng (INGEST_MODE=async).
+
+Mỗi vòng chạy một tiến trình con: webserver3.create_app() (nạp lại spool
+còn sót), rồi --senders luồng POST /api/data liên tục, in 'ACK <số>' mỗi khi
+nhận 202. Trong tiến trình con, storage.update_rollups được bọc để in 'TX'
+và ngủ --hold giây: hàm này chạy bên trong giao dịch ghi lô, sau các INSERT
+và trước COMMIT. Tiến trình cha SIGKILL tiến trình con ngay khi thấy lô thứ
+k (ngẫu nhiên, sau khi khởi động xong) đang ở trong giao dịch, rồi khởi động vòng tiếp theo.
+
+Sau --rounds vòng, một tiến trình con cuối chỉ khởi động (nạp lại spool) rồi
+thoát bình thường. Kiểm tra: mọi bản ghi đã nhận 202 có trong database đúng
+một lần, không bản ghi nào bị ghi trùng, và spool thật sự đã được nạp lại.
+Thêm một tiến trình con cho trường hợp os.fsync lỗi: Spool.wait_durable phải
+báo lỗi (không coi record là đã lên đĩa) và /api/data, /api/data/batch,
+webserver_async trả 503 thay vì 202 hay 400.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_spool_crash.py --rounds 5
+"""
+import argparse
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+DEVICE = 'crash'
+BASE_TIMESTAMP = 1700000000
+
+# Dấu hiệu tiến trình con in ra; log của webserver3 từ luồng khác có thể chen
+# vào cùng dòng nên tìm theo mẫu thay vì đầu dòng
+MARKER = re.compile(r'(ACK|TX|READY) (\d+)|Đã nạp lại (\d+) bản ghi')
+
+
+def mark(text):
+    """In một dấu hiệu bằng một lần ghi (python -u), không bị cắt đôi bởi luồng khác"""
+    sys.stdout.write(text + '\n')
+
+
+def reading(index):
+    return {'temp': 25.0, 'humi': 60.0, 'pres': 1013.2, 'soil': 1500, 'ptrend': 0.1,
+            'ah': 12.3, 'dew': 18.4, 'rain': 0.25, 'comfort': 70, 'desc': 'Ít khả năng có mưa',
+            'device_id': DEVICE, 'timestamp': BASE_TIMESTAMP + index}
+
+
+def child(args):
+    """Tiến trình bị giết: ghi bất đồng bộ qua spool, in ACK cho mỗi 202"""
+    import webserver3
+
+    update_rollups = storage.update_rollups
+
+    def hold_in_transaction(conn, rows):
+        update_rollups(conn, rows)
+        mark(f"TX {len(rows)}")
+        time.sleep(args.hold)
+
+    storage.update_rollups = hold_in_transaction
+    app = webserver3.create_app()
+    mark("READY 0")
+
+    def send(first):
+        client = app.test_client()
+        for index in range(first, args.start + args.count, args.senders):
+            response = client.post('/api/data', json=reading(index))
+            if response.status_code == 202:
+                mark(f"ACK {index}")
+            elif response.status_code != 429:
+                mark(f"ERR {index} {response.status_code}")
+
+    senders = [threading.Thread(target=send, args=(args.start + i,)) for i in range(args.senders)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+
+
+def fsync_failure(args):
+    """Tiến trình con: os.fsync luôn lỗi; in 'FSYNC <tên> <kết quả>' cho mỗi kiểm tra"""
+    import asyncio
+    import tempfile as tmpdirs
+    from spool import Spool
+    import webserver3
+    import webserver_async
+    from aiohttp.test_utils import TestClient, TestServer
+
+    real_fsync = os.fsync
+
+    def broken_fsync(fd):
+        raise OSError(5, "Input/output error")
+
+    with tmpdirs.TemporaryDirectory() as directory:
+        target = Spool(directory)
+        os.fsync = broken_fsync
+        seqs = target.append([('a',), ('b',)])
+        try:
+            target.wait_durable(seqs[-1])
+            mark("FSYNC spool-raises 0")
+        except OSError:
+            mark("FSYNC spool-raises 1")
+        mark(f"FSYNC spool-not-synced {int(target.synced_seq < seqs[-1])}")
+        os.fsync = real_fsync
+        seq = target.append([('c',)])[-1]
+        target.wait_durable(seq)
+        mark(f"FSYNC spool-retry-ok {int(target.synced_seq >= seq)}")
+        target.close()
+
+    app = webserver_async.create_app()
+    client = webserver3.app.test_client()
+    os.fsync = broken_fsync
+    status = client.post('/api/data', json=reading(0)).status_code
+    mark(f"FSYNC data-503 {int(status == 503)}")
+    status = client.post('/api/data/batch', json=[reading(1), reading(2)]).status_code
+    mark(f"FSYNC batch-503 {int(status == 503)}")
+    status = client.post('/api/data', json={'temp': 1}).status_code
+    mark(f"FSYNC invalid-400 {int(status == 400)}")
+
+    async def post_async():
+        async with TestClient(TestServer(app)) as http:
+            response = await http.post('/api/data', json=reading(3))
+            return response.status
+
+    mark(f"FSYNC async-503 {int(asyncio.run(post_async()) == 503)}")
+    os.fsync = real_fsync
+
+
+def check_fsync_failure(env):
+    """Các kiểm tra của fsync_failure() không đạt"""
+    command = [sys.executable, '-u', os.path.abspath(__file__), '--fsync-fail']
+    result = subprocess.run(command, env=env, cwd=ROOT, capture_output=True, text=True)
+    checks = dict(re.findall(r'FSYNC (\S+) ([01])', result.stdout))
+    expected = ['spool-raises', 'spool-not-synced', 'spool-retry-ok',
+                'data-503', 'batch-503', 'invalid-400', 'async-503']
+    failed = [name for name in expected if checks.get(name) != '1']
+    if failed and not checks:
+        print(result.stdout[-2000:], result.stderr[-2000:])
+    return failed
+
+
+def run_child(args, start, count, env, kill_at=None):
+    """Chạy một vòng; trả về (các số đã ACK, số bản ghi đã nạp lại, đã bị giết chưa, log)"""
+    command = [sys.executable, '-u', os.path.abspath(__file__), '--child',
+               '--start', str(start), '--count', str(count),
+               '--senders', str(args.senders), '--hold', str(args.hold)]
+    process = subprocess.Popen(command, env=env, cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, text=True)
+    acked, replayed, lines = set(), 0, []
+    transactions = 0
+    ready = False      # Chỉ đếm lô của luồng ghi, không đếm lô nạp lại spool lúc khởi động
+    killed = False
+    for line in process.stdout:
+        lines.append(line)
+        for match in MARKER.finditer(line):
+            kind, number, restored = match.groups()
+            if kind == 'ACK':
+                acked.add(int(number))
+            elif kind == 'READY':
+                ready = True
+            elif kind == 'TX':
+                transactions += ready
+            else:
+                replayed += int(restored)
+        if kill_at is not None and transactions >= kill_at and not killed:
+            process.send_signal(signal.SIGKILL)
+            killed = True
+    process.wait()
+    return acked, replayed, killed, lines
+
+
+def stored_counts():
+    with storage.connection() as conn:
+        rows = conn.execute("SELECT timestamp, COUNT(*) FROM weather WHERE device_id = ? GROUP BY timestamp",
+                            (DEVICE,)).fetchall()
+    return {timestamp - BASE_TIMESTAMP: count for timestamp, count in rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--count', type=int, default=20000, help="Số bản ghi tối đa gửi mỗi vòng")
+    parser.add_argument('--senders', type=int, default=4, help="Số luồng gửi trong tiến trình con")
+    parser.add_argument('--hold', type=float, default=0.05,
+                        help="Số giây giữ mỗi giao dịch ghi lô mở (để giết đúng giữa lô)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--start', type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument('--fsync-fail', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+    if args.fsync_fail:
+        fsync_failure(args)
+        return
+    random.seed(args.seed)
+
+    ok = True
+    acked = set()
+    replayed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, WEATHER_DB=os.path.join(tmp, 'crash.db'), INGEST_MODE='async',
+                   INGEST_SPOOL_FSYNC='1', INGEST_BATCH_SIZE='200')
+        env.pop('INGEST_SPOOL_DIR', None)
+        storage.configure(env['WEATHER_DB'])
+
+        start = 0
+        for round_ in range(args.rounds):
+            kill_at = random.randint(2, 6)
+            got, restored, killed, lines = run_child(args, start, args.count, env, kill_at)
+            acked |= got
+            replayed += restored
+            print(f"vòng {round_ + 1}: {len(got):6d} bản ghi nhận 202, nạp lại {restored:6d} từ spool, "
+                  f"SIGKILL giữa lô thứ {kill_at}: {killed}")
+            if not killed:
+                print(''.join(lines[-20:]))
+                ok = False
+            start += args.count
+
+        _, restored, _, lines = run_child(args, start, 0, env)
+        replayed += restored
+        print(f"khởi động cuối: nạp lại {restored} bản ghi từ spool")
+
+        counts = stored_counts()
+        fsync_env = dict(env, WEATHER_DB=os.path.join(tmp, 'fsync.db'))
+        fsync_failed = check_fsync_failure(fsync_env)
+        missing = [index for index in acked if counts.get(index, 0) == 0]
+        duplicated = [index for index, count in counts.items() if count > 1]
+        stray = [index for index in counts if index not in acked]
+        storage.close()
+
+    print(f"đã nhận 202: {len(acked)}, trong database: {len(counts)} "
+          f"(chưa kịp ACK nhưng đã vào spool: {len(stray)}), thiếu: {len(missing)}, trùng: {len(duplicated)}")
+    if missing:
+        print(f"❌ mất bản ghi đã nhận 202: {sorted(missing)[:10]}")
+    if duplicated:
+        print(f"❌ bản ghi bị ghi trùng: {sorted(duplicated)[:10]}")
+    print(f"{'❌' if fsync_failed else '✅'} os.fsync lỗi: spool không báo đã lên đĩa, route trả 503"
+          + (f" (không đạt: {', '.join(fsync_failed)})" if fsync_failed else ""))
+    ok &= not missing and not duplicated and replayed > 0 and not fsync_failed
+    print("✅ khớp" if ok else "❌ không khớp")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
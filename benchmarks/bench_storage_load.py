@@ -0,0 +1,146 @@
+"""Đo độ trễ p50/p99 khi đọc (dashboard) và ghi (thiết bị) đồng thời.
+
+"before": mỗi thao tác tự sqlite3.connect(), journal mặc định (như code cũ).
+"after" : storage.py (pool kết nối, WAL, PRAGMA tinh chỉnh).
+
+Chạy: python benchmarks/bench_storage_load.py --seconds 5 --writers 4 --readers 8
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+
+
+def make_row(i):
+    return ('bench-node', random.uniform(20, 35), random.uniform(40, 95),
+            random.uniform(995, 1020), random.randint(1000, 3000),
+            random.uniform(-3, 3), random.uniform(10, 20), random.uniform(15, 25),
+            random.random(), random.randint(0, 100), 'Ít khả năng có mưa',
+            int(time.time()) - random.randint(0, 3600), '2024-01-01 00:00:00')
+
+
+class LegacyStore:
+    """Cách truy cập cũ: mở/đóng kết nối cho mỗi request"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, row):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(storage.INSERT_SQL, row)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def read(self, since):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute('''SELECT timestamp, temperature FROM weather
+                                   WHERE timestamp > ? ORDER BY timestamp ASC
+                                   LIMIT 100''', (since,)).fetchall()
+        finally:
+            conn.close()
+
+
+class PooledStore:
+    def write(self, row):
+        storage.insert_reading(row)
+
+    def read(self, since):
+        return storage.fetch_history('temperature', since, limit=100)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(store, seconds, writers, readers):
+    stop = time.perf_counter() + seconds
+    latencies = {'write': [], 'read': []}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(kind):
+        local = []
+        i = 0
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                if kind == 'write':
+                    store.write(make_row(i))
+                else:
+                    store.read(time.time() - 24 * 3600)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+                continue
+            local.append((time.perf_counter() - start) * 1000)
+            i += 1
+        with lock:
+            latencies[kind].extend(local)
+
+    threads = ([threading.Thread(target=worker, args=('write',)) for _ in range(writers)] +
+               [threading.Thread(target=worker, args=('read',)) for _ in range(readers)])
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def report(name, latencies, errors, seconds):
+    for kind in ('write', 'read'):
+        values = latencies[kind]
+        print(f"{name:6} {kind:5}: {len(values) / seconds:8.0f} ops/s  "
+              f"p50={percentile(values, 50):7.2f} ms  p99={percentile(values, 99):7.2f} ms")
+    if errors:
+        print(f"{name:6} errors: {len(errors)} (ví dụ: {errors[0]})")
+
+
+def seed(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute(storage.SCHEMA_SQL)
+    conn.executemany(storage.INSERT_SQL, [make_row(i) for i in range(rows)])
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seed-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before_path = os.path.join(tmp, 'before.db')
+        seed(before_path, args.seed_rows)
+        latencies, errors = run(LegacyStore(before_path), args.seconds,
+                                args.writers, args.readers)
+        report('before', latencies, errors, args.seconds)
+
+        after_path = os.path.join(tmp, 'after.db')
+        seed(after_path, args.seed_rows)
+        storage.configure(after_path, pool_size=args.writers + args.readers)
+        storage.init_db()
+        latencies, errors = run(PooledStore(), args.seconds,
+                                args.writers, args.readers)
+        report('after', latencies, errors, args.seconds)
+        storage.configure()
+
+
+if __name__ == '__main__':
+    main()
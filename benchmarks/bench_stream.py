@@ -0,0 +1,140 @@
+"""Đo số client SSE (/stream) một tiến trình phục vụ được và độ trễ đẩy dữ liệu.
+
+Chạy server Flask (werkzeug, mỗi kết nối một luồng) trong tiến trình, mở N
+kết nối /stream bằng socket thô (một luồng đọc cho tất cả), rồi gửi bản ghi
+qua POST /api/data và đo thời gian từ lúc gửi tới lúc từng client nhận được.
+
+Chạy: python benchmarks/bench_stream.py --subscribers 100,500,1000 --events 50
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import re
+import selectors
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SEQ_RE = re.compile(rb'"temperature": (\d+)')
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def open_clients(port, count):
+    clients = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b"GET /stream HTTP/1.0\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+        sock.setblocking(False)
+        clients.append(sock)
+    return clients
+
+
+def read_events(clients, arrivals, stop):
+    """Đọc tất cả client bằng một vòng lặp selector, ghi thời điểm nhận từng seq"""
+    sel = selectors.DefaultSelector()
+    buffers = {}
+    for sock in clients:
+        sel.register(sock, selectors.EVENT_READ)
+        buffers[sock] = b''
+    while not stop.is_set():
+        for key, _ in sel.select(timeout=0.1):
+            sock = key.fileobj
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                sel.unregister(sock)
+                continue
+            now = time.perf_counter()
+            buf = buffers[sock] + data
+            *events, buffers[sock] = buf.split(b'\n\n')
+            for event in events:
+                match = SEQ_RE.search(event)
+                if match:
+                    arrivals.append((int(match.group(1)), now))
+    sel.close()
+
+
+def run(port, subscribers, events, interval, broker):
+    clients = open_clients(port, subscribers)
+    deadline = time.time() + 30
+    while broker.subscriber_count() < subscribers and time.time() < deadline:
+        time.sleep(0.05)
+    connected = broker.subscriber_count()
+
+    arrivals = []
+    stop = threading.Event()
+    reader = threading.Thread(target=read_events, args=(clients, arrivals, stop))
+    reader.start()
+
+    sent = {}
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for seq in range(1, events + 1):
+        body = json.dumps({'temp': seq, 'humi': 50, 'pres': 1010, 'soil': 2000, 'ptrend': 0,
+                           'ah': 15, 'dew': 20, 'rain': 0.1, 'comfort': 60, 'desc': 'bench',
+                           'device_id': 'bench-node', 'timestamp': int(time.time()) + seq})
+        sent[seq] = time.perf_counter()
+        conn.request('POST', '/api/data', body, {'Content-Type': 'application/json'})
+        conn.getresponse().read()
+        conn.close()
+        time.sleep(interval)
+    time.sleep(1.0)
+    stop.set()
+    reader.join()
+    for sock in clients:
+        sock.close()
+
+    latencies = [(t - sent[seq]) * 1000 for seq, t in arrivals if seq in sent]
+    expected = connected * events
+    return (f"subscribers={subscribers:5} connected={connected:5} "
+            f"delivered={len(latencies) / expected * 100 if expected else 0:6.1f}%  "
+            f"p50={percentile(latencies, 50):8.2f} ms  p99={percentile(latencies, 99):8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subscribers', default='100,500,1000')
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['WEATHER_DB'] = os.path.join(tmp, 'bench.db')
+        # receive_data in ra từng bản ghi; bỏ qua để không ảnh hưởng phép đo
+        sys.stdout = open(os.devnull, 'w')
+        import webserver3
+        counts = [int(c) for c in args.subscribers.split(',')]
+        webserver3.broker.max_subscribers = max(counts)
+        server = make_server('127.0.0.1', 0, webserver3.create_app(), threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+
+        for count in counts:
+            print(run(server.server_port, count, args.events, args.interval, webserver3.broker),
+                  file=sys.__stdout__, flush=True)
+            # Chờ các luồng SSE cũ thoát
+            deadline = time.time() + 20
+            while webserver3.broker.subscriber_count() and time.time() < deadline:
+                time.sleep(0.1)
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
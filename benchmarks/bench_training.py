@@ -0,0 +1,122 @@
+"""Kiểm tra và đo training.fit() trên database tạm có nhãn rain_observed.
+
+Nhãn được sinh từ một mô hình logistic biết trước trên đúng các đặc trưng
+của thiết bị. Script kiểm tra:
+- link 'identity' (đọc theo khối) cho cùng hệ số với np.linalg.lstsq trên
+  toàn bộ dữ liệu trong bộ nhớ;
+- link 'logistic' tìm lại gần đúng hệ số đã dùng để sinh nhãn;
+- bộ nhớ đỉnh (tracemalloc) chỉ phụ thuộc chunk_size, không phụ thuộc số dòng.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_training.py --rows 500000
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+import training  # noqa: E402
+
+TRUE_COEFFS = {'intercept': -4.0, 'ah': 0.15, 'temp_dew_reciprocal': 1.2,
+               'soil': 0.0004, 'pressure': 0.08, 'pressure_trend': 0.6}
+
+
+def make_inputs(rows, rng):
+    temperature = rng.uniform(18, 36, rows)
+    humidity = rng.uniform(35, 100, rows)
+    pressure = rng.uniform(990, 1025, rows)
+    soil = rng.integers(1000, 3000, rows).astype(np.float64)
+    trend = rng.uniform(-4, 2, rows)
+    return temperature, humidity, pressure, soil, trend
+
+
+def fill_database(rows, rng):
+    """Ghi rows bản ghi có nhãn, trả về (X, y) đầy đủ để so sánh trong bộ nhớ"""
+    storage.init_db()
+    inputs = make_inputs(rows, rng)
+    X, valid = training.design_matrix(*inputs)
+    p = training.predict(X, training.coeffs_to_vector(TRUE_COEFFS), 'logistic')
+    y = (rng.random(rows) < p).astype(np.int64)
+    batch = 50000
+    for lo in range(0, rows, batch):
+        hi = min(lo + batch, rows)
+        storage.insert_readings([
+            ('bench-node', inputs[0][i], inputs[1][i], inputs[2][i], int(inputs[3][i]), inputs[4][i],
+             None, None, None, None, None, 1700000000 + i * 60, '2023-11-15 00:00:00')
+            for i in range(lo, hi)])
+    # id theo thứ tự ghi (id của mỗi phân vùng tháng bắt đầu từ một mốc riêng)
+    ids = [row[0] for chunk in storage.iter_weather_chunks(['timestamp'], batch) for row in chunk]
+    storage.update_columns(('rain_observed',), ids, [y.tolist()])
+    return X[valid], y[valid].astype(np.float64)
+
+
+def peak_memory(rows, chunk_size):
+    """Bộ nhớ đỉnh (MB) của một lần fit identity trên rows dòng đầu tiên"""
+    tracemalloc.start()
+    training.fit('identity', end=1700000000 + rows * 60, chunk_size=chunk_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--chunk-size', type=int, default=training.DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'bench.db'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            X, y = fill_database(args.rows, rng)
+
+        start = time.perf_counter()
+        linear = training.fit('identity', chunk_size=args.chunk_size)
+        linear_seconds = time.perf_counter() - start
+        reference = np.linalg.lstsq(X, y, rcond=None)[0]
+        got = training.coeffs_to_vector(linear['coeffs'])
+        error = np.max(np.abs(got - reference) / (np.abs(reference) + 1e-12))
+        print(f"identity: {linear['rows']} dòng, {linear['rows'] / linear_seconds:10.0f} rows/sec, "
+              f"sai khác tương đối so với lstsq {error:.2e}, brier {linear['metrics']['brier']:.4f} "
+              f"(hệ số hiện tại {linear['metrics']['baseline_brier']:.4f})")
+        if error > 1e-6:
+            failures += 1
+
+        start = time.perf_counter()
+        logistic = training.fit('logistic', chunk_size=args.chunk_size)
+        logistic_seconds = time.perf_counter() - start
+        print(f"logistic: {logistic['iterations']} vòng, {logistic_seconds:.1f}s "
+              f"({logistic['rows'] * logistic['iterations'] / logistic_seconds:.0f} rows/sec mỗi lượt), "
+              f"brier {logistic['metrics']['brier']:.4f}, log loss {logistic['metrics']['log_loss']:.4f}")
+        for name in training.FEATURES:
+            print(f"   {name:20s} thật {TRUE_COEFFS[name]: .5g}  ước lượng {logistic['coeffs'][name]: .5g}")
+            if abs(logistic['coeffs'][name] - TRUE_COEFFS[name]) > 0.1 * abs(TRUE_COEFFS[name]):
+                failures += 1
+
+        # Từ hai khối trở lên, đỉnh là một khối đang xử lý cộng khối đang đọc
+        few = min(args.rows, 2 * args.chunk_size)
+        small = peak_memory(few, args.chunk_size)
+        large = peak_memory(args.rows, args.chunk_size)
+        print(f"bộ nhớ đỉnh: {few} dòng {small:.1f} MB | {args.rows} dòng {large:.1f} MB")
+        if large > 1.2 * small:
+            failures += 1
+        storage.get_pool().close_all()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Giao thức UART nhị phân (uart_protocol + collector.py) so với dòng văn bản cũ của do_an.py.
+
+Script đo:
+- số byte mỗi lần đo và tần số lấy mẫu tối đa UART chịu được ở 9600 và
+  115200 baud (10 bit mỗi byte: start + 8 data + stop);
+- tốc độ tách khung (FrameDecoder) và giải mã hàng loạt (NumPy) phía máy chủ;
+- chạy thật qua pty: một luồng ghi khung như do_an.py, làm hỏng CRC mỗi
+  --corrupt-every khung và bỏ seq mỗi --skip-every khung; Collector.run ghi
+  vào database tạm. Kiểm tra số bản ghi đã lưu, số lỗi CRC và số khung mất
+  (= khung hỏng + seq bị bỏ);
+- header có trường độ dài quá lớn được đếm ở length_errors, không ở crc_errors.
+Thoát với mã 1 nếu có kiểm tra thất bại.
+
+Chạy: python benchmarks/bench_uart.py --frames 20000
+"""
+import argparse
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import collector  # noqa: E402
+import storage  # noqa: E402
+import uart_protocol  # noqa: E402
+
+BITS_PER_BYTE = 10
+
+
+def reading():
+    """Một lần đo giả lập như do_an.py"""
+    temperature = round(random.uniform(20, 40), 2)
+    humidity = round(random.uniform(30, 80), 2)
+    soil = random.randint(400, 800)
+    rain = 1 if (temperature < 25.0 or humidity > 70.0 or soil > 600) else 0
+    return temperature, humidity, soil, rain
+
+
+def wire_size(samples):
+    text = sum(len(f"{t:.2f},{h:.2f},{s},{r}\n") for t, h, s, r in samples) / len(samples)
+    binary = uart_protocol.READING_FRAME_SIZE
+    print(f"{'định dạng':10s} {'byte/lần đo':>12s} {'lần đo/giây @9600':>18s} {'@115200':>10s}")
+    for name, size in (('văn bản', text), ('nhị phân', binary)):
+        rates = [baud / BITS_PER_BYTE / size for baud in (9600, 115200)]
+        print(f"{name:10s} {size:12.1f} {rates[0]:18.0f} {rates[1]:10.0f}")
+
+
+def decode_speed(samples):
+    stream = b''.join(uart_protocol.encode_reading(i, *s) for i, s in enumerate(samples))
+    decoder = uart_protocol.FrameDecoder()
+    start = time.perf_counter()
+    frames = []
+    for i in range(0, len(stream), 4096):        # Đọc theo khối như os.read
+        frames.extend(decoder.feed(stream[i:i + 4096]))
+    split = time.perf_counter() - start
+    start = time.perf_counter()
+    rows = collector.readings_to_rows([p for _, _, p in frames], [0] * len(frames), 'bench', '')
+    bulk = time.perf_counter() - start
+    start = time.perf_counter()
+    for _, _, payload in frames:
+        uart_protocol.decode_reading(payload)
+    scalar = time.perf_counter() - start
+    n = len(samples)
+    print(f"\ntách khung: {n / split:,.0f} khung/giây | giải mã NumPy (kèm điểm sương): "
+          f"{n / bulk:,.0f} khung/giây | struct từng khung: {n / scalar:,.0f} khung/giây")
+    t, h, soil, rain = samples[-1]
+    got = rows[-1]
+    return len(frames) == n and abs(got[1] - t) < 1e-9 and abs(got[2] - h) < 1e-9 and got[4] == soil \
+        and got[8] is None and got[-1] == rain
+
+
+def oversized_length():
+    """Header có độ dài > MAX_PAYLOAD được đếm riêng ở length_errors, không phải crc_errors"""
+    bad = uart_protocol.SYNC + struct.pack(uart_protocol.HEADER_FORMAT, uart_protocol.READING, 1,
+                                           uart_protocol.MAX_PAYLOAD + 1)
+    decoder = uart_protocol.FrameDecoder()
+    frames = decoder.feed(bad + uart_protocol.encode_reading(2, 25.0, 60.0, 1500, 1))
+    ok = len(frames) == 1 and decoder.length_errors == 1 and decoder.crc_errors == 0
+    print(f"\n{'✅' if ok else '❌'} độ dài vượt MAX_PAYLOAD: length_errors={decoder.length_errors}, "
+          f"crc_errors={decoder.crc_errors}")
+    return ok
+
+
+def end_to_end(frames, corrupt_every, skip_every):
+    master, slave = os.openpty()
+    path = os.ttyname(slave)
+    fd = collector.open_port(path, 115200)
+    corrupted = skipped = sent = trailing = 0
+
+    def writer():
+        nonlocal corrupted, skipped, sent, trailing
+        last_sent = 0
+        seq = 0
+        out = [uart_protocol.encode_reset(seq), b'\x00\xff garbage']
+        seq += 1
+        for i in range(1, frames + 1):
+            if i % skip_every == 0:
+                seq += 1                 # Khung bị mất trên đường truyền
+                skipped += 1
+            frame = bytearray(uart_protocol.encode_reading(seq, *reading()))
+            if i % corrupt_every == 0:
+                frame[8] ^= 0x40         # Nhiễu một bit trong payload
+                corrupted += 1
+            else:
+                sent += 1
+                last_sent = seq
+            out.append(bytes(frame))
+            seq += 1
+            if len(out) >= 64:
+                os.write(master, b''.join(out))
+                out = []
+        os.write(master, b''.join(out))
+        # Khung mất sau khung hợp lệ cuối cùng: không có seq nào sau chúng nên không thể phát hiện
+        trailing = seq - 1 - last_sent
+
+    c = collector.Collector('uart-bench', batch_size=500, flush_interval=0.2)
+    thread = threading.Thread(target=writer)
+    start = time.perf_counter()
+    thread.start()
+    c.run(fd, idle_timeout=1.0)
+    elapsed = time.perf_counter() - start - 1.0
+    thread.join()
+    for f in (fd, slave, master):
+        os.close(f)
+
+    stats = c.stats()
+    with storage.connection() as conn:
+        stored = conn.execute("SELECT COUNT(*) FROM weather WHERE device_id = 'uart-bench'").fetchone()[0]
+        # Dự báo 0/1 của nút nằm ở rain_predicted, không ở cột xác suất
+        predicted = conn.execute('''SELECT COUNT(*) FROM weather WHERE device_id = 'uart-bench'
+                                    AND rain_predicted IN (0, 1) AND rain_probability IS NULL''').fetchone()[0]
+    print(f"\npty: gửi {frames} khung ({corrupted} hỏng CRC, {skipped} seq bị bỏ) trong {elapsed:.2f} giây "
+          f"({frames / elapsed:,.0f} khung/giây)")
+    print(f"    collector: {stats}")
+    print(f"    database: {stored} bản ghi")
+    ok = (stored == sent == stats['written'] == predicted and stats['crc_errors'] == corrupted
+          and stats['dropped'] == corrupted + skipped - trailing and stats['resets'] == 1)
+    print("    ✅ khớp" if ok else "    ❌ không khớp")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=20000)
+    parser.add_argument('--corrupt-every', type=int, default=100)
+    parser.add_argument('--skip-every', type=int, default=150)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    samples = [reading() for _ in range(args.frames)]
+    wire_size(samples)
+    ok = decode_speed(samples)
+    ok &= oversized_length()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.configure(os.path.join(tmp, 'uart.db'))
+        storage.migrate()
+        ok &= end_to_end(args.frames, args.corrupt_every, args.skip_every)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
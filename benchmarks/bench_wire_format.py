@@ -0,0 +1,91 @@
+"""So sánh số byte mỗi bản ghi và chi phí giải mã phía server: JSON và bản ghi nhị phân.
+
+Chạy: python benchmarks/bench_wire_format.py --readings 10000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wire_format  # noqa: E402
+
+
+def device_report(i):
+    """Báo cáo giống dict 'report' mà ban_phu.py tạo ra trong main()"""
+    temp = random.uniform(20, 35)
+    rain = random.random()
+    return {
+        'temperature': temp, 'humidity': random.uniform(40, 95),
+        'pressure': random.uniform(995, 1020), 'soil_moisture': random.uniform(1000, 3000),
+        'pressure_trend': random.uniform(-3, 3), 'dew_point': temp - random.uniform(0, 8),
+        'absolute_humidity': random.uniform(10, 20), 'rain_probability': rain,
+        'comfort_index': random.randint(0, 100),
+        'alerts': [wire_format.ALERTS[0], wire_format.ALERTS[4]] if rain > 0.8 else [],
+        'weather_description': random.choice(wire_format.DESCRIPTIONS[1:5]),
+        'temp_dew_diff': random.uniform(0, 8), 'rain_probability_percent': round(rain * 100, 1),
+        'device_id': '246f28a1b2c3', 'timestamp': 1700000000 + i * 110,
+    }
+
+
+def compact(report):
+    return {
+        'temp': report['temperature'], 'humi': report['humidity'], 'pres': report['pressure'],
+        'soil': report['soil_moisture'], 'ptrend': report['pressure_trend'],
+        'ah': report['absolute_humidity'], 'dew': report['dew_point'],
+        'rain': report['rain_probability'], 'comfort': report['comfort_index'],
+        'desc': report['weather_description'], 'alerts': report['alerts'],
+        'device_id': report['device_id'], 'timestamp': report['timestamp'],
+    }
+
+
+def per_reading_us(fn, items):
+    start = time.perf_counter()
+    for item in items:
+        fn(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--readings', type=int, default=10000)
+    args = parser.parse_args()
+
+    reports = [device_report(i) for i in range(args.readings)]
+    full_json = [json.dumps(r).encode() for r in reports]
+    compact_json = [json.dumps(compact(r)).encode() for r in reports]
+    binary = [wire_format.encode(compact(r)) for r in reports]
+
+    def avg(items):
+        return sum(len(b) for b in items) / len(items)
+
+    print(f"readings={args.readings}")
+    print("Số byte mỗi bản ghi (body HTTP):")
+    print(f"  JSON report đầy đủ (hiện tại): {avg(full_json):7.1f}")
+    print(f"  JSON rút gọn                 : {avg(compact_json):7.1f}")
+    print(f"  nhị phân v{wire_format.SCHEMA_VERSION}                 : {avg(binary):7.1f}")
+
+    print("Chi phí giải mã mỗi bản ghi (µs):")
+    print(f"  json.loads (đầy đủ)          : {per_reading_us(json.loads, full_json):7.2f}")
+    print(f"  json.loads (rút gọn)         : {per_reading_us(json.loads, compact_json):7.2f}")
+    print(f"  wire_format.decode           : {per_reading_us(wire_format.decode, binary):7.2f}")
+
+    batch_json = b'[' + b','.join(compact_json) + b']'
+    batch_binary = b''.join(binary)
+    start = time.perf_counter()
+    json.loads(batch_json)
+    json_batch_us = (time.perf_counter() - start) / args.readings * 1e6
+    start = time.perf_counter()
+    wire_format.decode_many(batch_binary)
+    binary_batch_us = (time.perf_counter() - start) / args.readings * 1e6
+    print("Giải mã theo lô, mỗi bản ghi (µs):")
+    print(f"  mảng JSON                    : {json_batch_us:7.2f}")
+    print(f"  wire_format.decode_many      : {binary_batch_us:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
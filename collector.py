@@ -0,0 +1,182 @@
+"""Nhận khung UART nhị phân từ do_an.py và ghi vào bảng weather.
+
+Đọc cổng serial (hoặc pty khi thử nghiệm) ở chế độ raw, tách khung bằng
+uart_protocol.FrameDecoder, giải mã các khung READING hàng loạt bằng NumPy
+và ghi theo lô (một giao dịch mỗi lô) qua storage.insert_readings.
+Khung sai CRC bị bỏ; khung mất được suy ra từ seq và báo trong thống kê.
+
+Ví dụ:
+    python collector.py --port /dev/ttyUSB0 --baud 115200 --device-id do-an-1
+    python collector.py --port /dev/pts/3 --db /data/weather_data.db
+"""
+import argparse
+import os
+import select
+import termios
+import time
+import tty
+from datetime import datetime
+
+import numpy as np
+
+import reanalysis
+import storage
+import uart_protocol
+
+# Bố cục payload READING (uart_protocol.READING_FORMAT)
+READING_DTYPE = np.dtype([('temperature', '<i2'), ('humidity', '<u2'),
+                          ('soil_moisture', '<u2'), ('rain', 'u1')])
+
+# Cột phân vùng ngoài storage.ROW_COLUMNS mà readings_to_rows nối vào cuối mỗi dòng
+PREDICTION_COLUMNS = ('rain_predicted',)
+
+BAUD_RATES = {
+    9600: termios.B9600,
+    19200: termios.B19200,
+    38400: termios.B38400,
+    57600: termios.B57600,
+    115200: termios.B115200,
+    230400: termios.B230400,
+    460800: termios.B460800,
+    921600: termios.B921600,
+}
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0     # Giây tối đa một bản ghi nằm chờ trong bộ nhớ
+STATS_INTERVAL = 60.0
+
+
+def open_port(path, baud):
+    """Mở cổng serial/pty ở chế độ raw, không chặn"""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        tty.setraw(fd)
+        attrs = termios.tcgetattr(fd)
+        attrs[4] = attrs[5] = BAUD_RATES[baud]
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+def readings_to_rows(payloads, timestamps, device_id, created_at):
+    """Giải mã hàng loạt các payload READING thành bộ giá trị INSERT"""
+    data = np.frombuffer(b''.join(payloads), dtype=READING_DTYPE)
+    temperature = data['temperature'] / 100.0
+    humidity = data['humidity'] / 100.0
+    dew = reanalysis.dew_point(temperature, humidity)
+    ah = reanalysis.absolute_humidity(temperature, humidity)
+    # do_an.py không đo áp suất; rain là dự báo 0/1 của nút, lưu ở cột rain_predicted
+    # (nối cuối dòng, xem PREDICTION_COLUMNS), không phải xác suất rain_probability
+    return [(device_id, t, h, None, soil, None, a, d, None, None, None, ts, created_at, rain)
+            for t, h, soil, a, d, rain, ts in zip(
+                temperature.tolist(), humidity.tolist(), data['soil_moisture'].tolist(),
+                ah.tolist(), dew.tolist(), data['rain'].tolist(), timestamps)]
+
+
+class Collector:
+    """Gom khung từ luồng byte, ghi theo lô"""
+
+    def __init__(self, device_id, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.device_id = device_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.decoder = uart_protocol.FrameDecoder()
+        self._payloads = []
+        self._timestamps = []
+        self._oldest = None
+        self.written = 0
+        self.resets = 0
+
+    def feed(self, data, now=None):
+        """Thêm byte nhận được; ghi lô khi đủ batch_size bản ghi"""
+        now = time.time() if now is None else now
+        for ftype, _, payload in self.decoder.feed(data):
+            if ftype == uart_protocol.READING and len(payload) == uart_protocol.READING_SIZE:
+                self._payloads.append(payload)
+                self._timestamps.append(int(now))
+            elif ftype == uart_protocol.RESET:
+                self.resets += 1
+                print("🔄 Nút đã reset hệ thống")
+        if self._payloads and self._oldest is None:
+            self._oldest = now
+        if len(self._payloads) >= self.batch_size:
+            self.flush()
+
+    def due(self, now):
+        return self._oldest is not None and now - self._oldest >= self.flush_interval
+
+    def flush(self):
+        """Ghi các bản ghi đang chờ trong một giao dịch, trả về số bản ghi"""
+        if not self._payloads:
+            return 0
+        rows = readings_to_rows(self._payloads, self._timestamps, self.device_id,
+                                datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        storage.insert_readings(rows, extra_columns=PREDICTION_COLUMNS)
+        self._payloads = []
+        self._timestamps = []
+        self._oldest = None
+        self.written += len(rows)
+        return len(rows)
+
+    def stats(self):
+        d = self.decoder
+        return {'frames': d.frames, 'written': self.written, 'dropped': d.dropped,
+                'crc_errors': d.crc_errors, 'length_errors': d.length_errors,
+                'skipped_bytes': d.skipped_bytes, 'resets': self.resets}
+
+    def run(self, fd, stop=None, idle_timeout=None):
+        """Đọc fd tới khi stop() trả về True, hoặc không có dữ liệu trong idle_timeout giây"""
+        last_data = last_stats = time.time()
+        while stop is None or not stop():
+            ready, _, _ = select.select([fd], [], [], self.flush_interval)
+            now = time.time()
+            if ready:
+                try:
+                    data = os.read(fd, 65536)
+                except BlockingIOError:
+                    data = b''
+                except OSError:
+                    break     # Cổng bị rút / pty đã đóng
+                if data:
+                    self.feed(data, now)
+                    last_data = now
+            if self.due(now):
+                self.flush()
+            if idle_timeout is not None and now - last_data >= idle_timeout:
+                break
+            if now - last_stats >= STATS_INTERVAL:
+                print("📊", self.stats())
+                last_stats = now
+        self.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nhận dữ liệu UART nhị phân từ do_an.py")
+    parser.add_argument('--port', required=True, help="Cổng serial hoặc pty, vd: /dev/ttyUSB0")
+    parser.add_argument('--baud', type=int, default=115200, choices=sorted(BAUD_RATES))
+    parser.add_argument('--device-id', help="device_id lưu trong database (mặc định: uart-<tên cổng>)")
+    parser.add_argument('--db', help="Đường dẫn database (mặc định: WEATHER_DB)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--flush-interval', type=float, default=DEFAULT_FLUSH_INTERVAL)
+    args = parser.parse_args(argv)
+
+    if args.db:
+        storage.configure(args.db)
+    storage.migrate()
+    device_id = args.device_id or 'uart-' + os.path.basename(args.port)
+    collector = Collector(device_id, args.batch_size, args.flush_interval)
+    fd = open_port(args.port, args.baud)
+    print(f"📡 Đang nhận từ {args.port} ({args.baud} baud) cho thiết bị {device_id}")
+    try:
+        collector.run(fd)
+    except KeyboardInterrupt:
+        collector.flush()
+    finally:
+        os.close(fd)
+        print("📊", collector.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Trạng thái thiết bị giữ lại qua deep sleep.
+
+RAM bị xóa mỗi lần deepsleep() nên lịch sử áp suất, giá trị đọc hợp lệ cuối
+cùng và số liệu năng lượng được lưu dưới dạng JSON:
+
+- 'rtc': RTC memory (tối đa RTC_MEMORY_BYTES, giữ qua deep sleep, mất khi
+  mất nguồn, không làm mòn flash)
+- 'flash': file trên hệ thống file (giữ cả khi mất nguồn)
+
+Với 'rtc', trạng thái lớn hơn RTC_MEMORY_BYTES được ghi vào file flash (có
+cảnh báo) thay vì bị bỏ; load() đọc lại từ flash khi RTC memory không có gì.
+"""
+import json
+
+try:
+    import uos as os
+except ImportError:
+    import os
+try:
+    from machine import RTC
+except ImportError:
+    RTC = None
+
+MAGIC = b'WST1'
+RTC_MEMORY_BYTES = 2048
+
+
+class DeviceState:
+    def __init__(self, store='rtc', path='state.json'):
+        if store == 'rtc' and RTC is None:
+            store = 'flash'
+        self.store = store
+        self.path = path
+        self._on_flash = False       # 'rtc': bản mới nhất đang nằm trên flash
+
+    def _read_flash(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return b''
+
+    def _write_flash(self, data):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.rename(tmp, self.path)
+
+    def _read(self):
+        if self.store == 'rtc':
+            data = RTC().memory()
+            if data.startswith(MAGIC):
+                return data
+            # Lần lưu trước quá lớn cho RTC memory nên nằm trên flash
+            data = self._read_flash()
+            self._on_flash = data.startswith(MAGIC)
+            return data
+        return self._read_flash()
+
+    def load(self):
+        """Trạng thái đã lưu, hoặc {} nếu chưa có / bị hỏng (khởi động nguội)"""
+        data = self._read()
+        if not data.startswith(MAGIC):
+            return {}
+        try:
+            return json.loads(data[len(MAGIC):])
+        except ValueError:
+            print("⚠️ Trạng thái đã lưu bị hỏng, bắt đầu lại")
+            return {}
+
+    def save(self, state):
+        data = MAGIC + json.dumps(state).encode()
+        if self.store != 'rtc':
+            self._write_flash(data)
+            return
+        if len(data) <= RTC_MEMORY_BYTES:
+            RTC().memory(data)
+            if self._on_flash:
+                # Bản trên flash đã cũ: không được dùng lại sau khi mất nguồn
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
+                self._on_flash = False
+            return
+        print("⚠️ Trạng thái %d byte vượt RTC memory (%d byte), lưu vào flash" % (len(data), RTC_MEMORY_BYTES))
+        # Xóa RTC memory trước để load() không đọc bản cũ hơn bản trên flash
+        RTC().memory(b'')
+        self._write_flash(data)
+        self._on_flash = True
@@ -2,6 +2,9 @@ from machine import Pin, ADC, UART
 import time
 import dht
 import random
+import lstsq
+import uart_protocol
+from sliding_rls import SlidingRLS
 
 DHT_PIN = 2
 dht_sensor = dht.DHT22(Pin(DHT_PIN))
@@ -9,7 +12,18 @@ dht_sensor = dht.DHT22(Pin(DHT_PIN))
 soil_adc = ADC(Pin(33))
 soil_adc.atten(ADC.ATTN_11DB)
 
-uart = UART(1, baudrate=9600, tx=17, rx=16)
+# Định dạng gửi qua UART: 'binary' (khung uart_protocol, 15 byte, đọc bằng collector.py)
+# hoặc 'text' (dòng "nhiệt độ,độ ẩm,đất,mưa")
+UART_FORMAT = 'binary'
+UART_BAUD = 115200
+
+# Thời gian giữa hai lần đo (giây)
+SAMPLE_INTERVAL = 2
+
+uart = UART(1, baudrate=UART_BAUD, tx=17, rx=16)
+
+# Số thứ tự khung UART kế tiếp (về 0 khi reset)
+uart_seq = 0
 
 TOUCH_PIN = 5
 touch_sensor = Pin(TOUCH_PIN, Pin.IN)
@@ -21,19 +35,50 @@ SOIL_MOISTURE_THRESHOLD = 600
 X_data = []
 y_data = []
 
-MAX_DATA_SIZE = 20
+# Cách tính hệ số hồi quy: 'rls' (cập nhật tăng dần trên cửa sổ trượt, O(k²) mỗi lần đo)
+# hoặc 'lstsq' (chuẩn hóa + QR trên toàn bộ cửa sổ mỗi lần đo)
+SOLVER = 'rls'
+
+# Ridge cho 'lstsq' (trên đặc trưng đã chuẩn hóa) và ngưỡng cảnh báo số điều kiện
+RIDGE = 0.0
+CONDITION_WARNING = 1000
+
+MAX_DATA_SIZE = 200 if SOLVER == 'rls' else 20
+
+# 'rls' học trên đặc trưng đã chuẩn hóa (x - tâm) / thang theo khoảng đo của cảm
+# biến, như lstsq.fit: X^T X từ giá trị thô (1, ~30°C, ~60%, ~600) kém điều kiện
+# tới mức float 32 bit mất gần hết chữ số. Hệ số được đổi lại theo giá trị thô.
+FEATURE_CENTER = (0.0, 30.0, 55.0, 600.0)
+FEATURE_SCALE = (1.0, 10.0, 25.0, 200.0)
+
+rls = SlidingRLS(4, MAX_DATA_SIZE)
 
 is_reset = False
 
 def handle_touch(pin):
-    global is_reset
+    global is_reset, uart_seq
     time.sleep(0.5)
     is_reset = True
     print("Ngắt: Cảm ứng được kích hoạt, chuẩn bị reset hệ thống.")
-    uart.write("RESET\n")
+    if UART_FORMAT == 'binary':
+        uart.write(uart_protocol.encode_reset(0))
+        uart_seq = 1
+    else:
+        uart.write("RESET\n")
 
 touch_sensor.irq(trigger=Pin.IRQ_RISING, handler=handle_touch)
 
+def send_reading(temperature, humidity, soil_moisture, rain):
+    """Gửi một lần đo qua UART, trả về dòng văn bản để in ra"""
+    global uart_seq
+    text = f"{temperature:.2f},{humidity:.2f},{soil_moisture},{rain}\n"
+    if UART_FORMAT == 'binary':
+        uart.write(uart_protocol.encode_reading(uart_seq, temperature, humidity, soil_moisture, rain))
+        uart_seq = (uart_seq + 1) & 0xFFFF
+    else:
+        uart.write(text)
+    return text
+
 def read_dht22():
     temperature = random.uniform(20, 40)
     humidity = random.uniform(30, 80)
@@ -43,7 +88,20 @@ def read_soil_sensor():
     soil_moisture = random.randint(400, 800)
     return soil_moisture
 
+def standardize(x):
+    """Đặc trưng thô [1, x1, x2, x3] -> [1, (x1 - tâm) / thang, ...]"""
+    return [(v - c) / s for v, c, s in zip(x, FEATURE_CENTER, FEATURE_SCALE)]
+
+def unstandardize(b):
+    """Hệ số trên đặc trưng chuẩn hóa -> hệ số trên giá trị thô (b[0] là hệ số chặn)"""
+    raw = [bi / s for bi, s in zip(b, FEATURE_SCALE)]
+    raw[0] = b[0] - sum(bi * c / s for bi, c, s in zip(b[1:], FEATURE_CENTER[1:], FEATURE_SCALE[1:]))
+    return raw
+
 def store_data(X_data, y_data, new_X, new_y):
+    if SOLVER == 'rls':
+        rls.add(standardize(new_X), new_y)
+        return
     X_data.append(new_X)
     y_data.append(new_y)
     if len(X_data) > MAX_DATA_SIZE:
@@ -55,59 +113,24 @@ def calculate_regression_coefficients(X, y):
         print("Không đủ dữ liệu để tính hồi quy!")
         return [0, 0, 0, 0]
 
-    def transpose(matrix):
-        return list(map(list, zip(*matrix)))
-
-    def matmul(A, B):
-        result = [[0] * len(B[0]) for _ in range(len(A))]
-        for i in range(len(A)):
-            for j in range(len(B[0])):
-                for k in range(len(B)):
-                    result[i][j] += A[i][k] * B[k][j]
-        return result
-
-    def inverse(matrix):
-        n = len(matrix)
-        identity_matrix = [[float(i == j) for i in range(n)] for j in range(n)]
-        augmented_matrix = [row[:] for row in matrix]
-
-        for i in range(n):
-            if augmented_matrix[i][i] == 0:
-                for j in range(i + 1, n):
-                    if augmented_matrix[j][i] != 0:
-                        augmented_matrix[i], augmented_matrix[j] = augmented_matrix[j], augmented_matrix[i]
-                        identity_matrix[i], identity_matrix[j] = identity_matrix[j], identity_matrix[i]
-                        break
-                else:
-                    raise ValueError("Matrix is not invertible")
-
-            diag = augmented_matrix[i][i]
-            for j in range(n):
-                augmented_matrix[i][j] /= diag
-                identity_matrix[i][j] /= diag
-
-            for j in range(n):
-                if i != j:
-                    factor = augmented_matrix[j][i]
-                    for k in range(n):
-                        augmented_matrix[j][k] -= factor * augmented_matrix[i][k]
-                        identity_matrix[j][k] -= factor * identity_matrix[i][k]
-
-        return identity_matrix
-
-    X_T = transpose(X)
-    X_T_X = matmul(X_T, X)
-    X_T_y = matmul(X_T, [[yi] for yi in y])
-    X_T_X_inv = inverse(X_T_X)
-    b = matmul(X_T_X_inv, X_T_y)
-    b = [row[0] for row in b]
-
+    b, condition = lstsq.fit(X, y, ridge=RIDGE)
+    if condition > CONDITION_WARNING:
+        print(f"Cảnh báo: dữ liệu kém điều kiện (cond = {condition:.0f}), hệ số kém tin cậy")
     return b
 
+def current_coefficients():
+    if SOLVER == 'rls':
+        if len(rls) < 4:
+            print("Không đủ dữ liệu để tính hồi quy!")
+            return [0, 0, 0, 0]
+        return unstandardize(rls.coefficients())
+    return calculate_regression_coefficients(X_data, y_data)
+
 def reset_system():
     global X_data, y_data, is_reset
     X_data.clear()
     y_data.clear()
+    rls.reset()
     is_reset = False
     print("Hệ thống đã được reset!")
 
@@ -127,13 +150,12 @@ def send_initial_data():
         new_X = [1, temperature, humidity, soil_moisture]
         store_data(X_data, y_data, new_X, rain_status)
 
-        data_to_send = f"{temperature:.2f},{humidity:.2f},{soil_moisture},{rain_status}\n"
-        uart.write(data_to_send)
+        data_to_send = send_reading(temperature, humidity, soil_moisture, rain_status)
         print(f"Lần đo {i+1}: {data_to_send}")
 
-        time.sleep(2)
+        time.sleep(SAMPLE_INTERVAL)
 
-    b = calculate_regression_coefficients(X_data, y_data)
+    b = current_coefficients()
     print(f"Phương trình hồi quy tuyến tính sau 10 lần đo: y = {b[0]} + {b[1]}*x1 + {b[2]}*x2 + {b[3]}*x3")
 
 def main_workflow():
@@ -146,7 +168,7 @@ def main_workflow():
         send_initial_data()
 
         try:
-            b = calculate_regression_coefficients(X_data, y_data)
+            b = current_coefficients()
             print(f"Hệ số hồi quy: {b}")
         except ValueError as e:
             print(f"Lỗi: {e}")
@@ -162,19 +184,21 @@ def main_workflow():
             soil_moisture = read_soil_sensor()
             rain_prediction = 1 if (b[0] + b[1] * temperature + b[2] * humidity + b[3] * soil_moisture) >= 0.5 else 0
 
-            data_to_send = f"{temperature:.2f},{humidity:.2f},{soil_moisture},{rain_prediction}\n"
-            uart.write(data_to_send)
+            data_to_send = send_reading(temperature, humidity, soil_moisture, rain_prediction)
             print(f"Gửi dữ liệu: {data_to_send}")
 
             new_X = [1, temperature, humidity, soil_moisture]
             store_data(X_data, y_data, new_X, rain_prediction)
 
-            b = calculate_regression_coefficients(X_data, y_data)
+            b = current_coefficients()
             print(f"Phương trình hồi quy tuyến tính: y = {b[0]} + {b[1]}*x1 + {b[2]}*x2 + {b[3]}*x3")
-            print(f"Mảng X sau khi cập nhật: {X_data}")
-            print(f"Mảng Y sau khi cập nhật: {y_data}")
+            if SOLVER == 'rls':
+                print(f"Số mẫu trong cửa sổ: {len(rls)}/{MAX_DATA_SIZE}")
+            else:
+                print(f"Mảng X sau khi cập nhật: {X_data}")
+                print(f"Mảng Y sau khi cập nhật: {y_data}")
 
-            time.sleep(2)
+            time.sleep(SAMPLE_INTERVAL)
 
 while True:
     main_workflow()
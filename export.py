@@ -0,0 +1,173 @@
+"""Xuất dữ liệu thô của bảng weather ra CSV, Arrow IPC (stream) hoặc Parquet.
+
+Dữ liệu được đọc theo khối từ cursor (storage.iter_export_chunks) và mỗi khối
+được mã hóa rồi trả ra ngay dưới dạng bytes, nên bộ nhớ chỉ phụ thuộc
+chunk_size chứ không phụ thuộc khoảng thời gian xuất. Arrow/Parquet cần
+pyarrow; CSV chỉ dùng thư viện chuẩn.
+
+Ví dụ:
+    for data in export.export('parquet', start=1700000000, end=1710000000):
+        f.write(data)
+"""
+import csv
+import io
+
+import storage
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Cột xuất mặc định: các cột của bản ghi cộng nhãn mưa thực tế và dự báo 0/1 của nút collector
+COLUMNS = storage.ROW_COLUMNS + ('rain_observed', 'rain_predicted')
+
+# Kiểu dữ liệu Arrow/Parquet của từng cột
+COLUMN_TYPES = {
+    'device_id': 'string',
+    'temperature': 'float64',
+    'humidity': 'float64',
+    'pressure': 'float64',
+    'soil_moisture': 'float64',     # Cột INTEGER vẫn giữ được giá trị lẻ
+    'pressure_trend': 'float64',
+    'absolute_humidity': 'float64',
+    'dew_point': 'float64',
+    'rain_probability': 'float64',
+    'comfort_index': 'float64',     # Như soil_moisture: thiết bị có thể gửi số lẻ
+    'weather_description': 'string',
+    'timestamp': 'float64',         # validate_reading nhận cả giây lẻ
+    'created_at': 'string',
+    'rain_observed': 'int64',
+    'rain_predicted': 'int64',
+}
+
+# Định dạng -> (Content-Type, đuôi file)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+DEFAULT_CHUNK_SIZE = 10000
+PARQUET_COMPRESSION = 'zstd'
+
+
+def available_formats():
+    return [f for f in FORMATS if f == 'csv' or pa is not None]
+
+
+def parse_columns(value):
+    """Danh sách cột từ chuỗi 'a,b,c' (None: mọi cột); ValueError nếu có cột lạ"""
+    if not value:
+        return list(COLUMNS)
+    columns = [c.strip() for c in value.split(',') if c.strip()]
+    invalid = [c for c in columns if c not in COLUMN_TYPES]
+    if invalid or not columns:
+        raise ValueError(f"Cột không hợp lệ: {', '.join(invalid) or value}")
+    return columns
+
+
+class _Sink:
+    """File chỉ ghi trong bộ nhớ cho pyarrow; drain() lấy ra các byte đã ghi"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def iter_csv(chunks, columns):
+    """Dòng tiêu đề rồi mỗi khối thành một đoạn CSV (UTF-8)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    data = buffer.getvalue()
+    if data:
+        yield data.encode('utf-8')
+
+
+def column_array(values, arrow_type):
+    """pa.array của một cột; giá trị lẻ ở cột số nguyên báo lỗi thay vì bị cắt
+    (pa.array chuyển 50.5 thành 50 mà không báo)"""
+    if pa.types.is_integer(arrow_type):
+        return pa.array(values, type=pa.float64()).cast(arrow_type, safe=True)
+    return pa.array(values, type=arrow_type)
+
+
+def iter_arrow(chunks, columns, parquet=False):
+    """Mỗi khối thành một RecordBatch (Arrow IPC stream) hoặc một row group (Parquet)"""
+    schema = pa.schema([(c, COLUMN_TYPES[c]) for c in columns])
+    types = [field.type for field in schema]
+    sink = _Sink()
+    stream = pa.PythonFile(sink, mode='w')
+    if parquet:
+        writer = pq.ParquetWriter(stream, schema, compression=PARQUET_COMPRESSION)
+    else:
+        writer = pa.ipc.new_stream(stream, schema)
+    for chunk in chunks:
+        arrays = [column_array(values, t) for values, t in zip(zip(*chunk), types)]
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        data = sink.drain()
+        if data:
+            yield data
+    writer.close()
+    yield sink.drain()
+
+
+def export(fmt, columns=None, start=None, end=None, device_ids=None, chunk_size=DEFAULT_CHUNK_SIZE,
+           on_chunk=None):
+    """Các đoạn bytes của file xuất theo định dạng fmt ('csv', 'arrow', 'parquet').
+
+    Bản ghi trong [start, end) theo thứ tự (timestamp, id), lọc theo danh sách
+    device_ids nếu có. on_chunk(số dòng) được gọi sau mỗi khối đọc từ database.
+    ValueError nếu định dạng/cột không hợp lệ, RuntimeError nếu thiếu pyarrow.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Định dạng không hợp lệ: {fmt} (hỗ trợ: {', '.join(FORMATS)})")
+    if fmt != 'csv' and pa is None:
+        raise RuntimeError(f"Xuất {fmt} cần pyarrow")
+    columns = list(COLUMNS) if columns is None else list(columns)
+    invalid = [c for c in columns if c not in COLUMN_TYPES]
+    if invalid or not columns:
+        raise ValueError(f"Cột không hợp lệ: {', '.join(invalid)}")
+    if device_ids:
+        device_ids = list(dict.fromkeys(device_ids))
+
+    chunks = storage.iter_export_chunks(columns, chunk_size, start, end, device_ids)
+    if on_chunk is not None:
+        chunks = _counted(chunks, on_chunk)
+    if fmt == 'csv':
+        return iter_csv(chunks, columns)
+    return iter_arrow(chunks, columns, parquet=fmt == 'parquet')
+
+
+def _counted(chunks, on_chunk):
+    for chunk in chunks:
+        on_chunk(len(chunk))
+        yield chunk
@@ -0,0 +1,150 @@
+"""Client HTTP/1.1 tối giản giữ kết nối (keep-alive) cho ESP32.
+
+urequests mở một kết nối TCP mới cho mỗi request và đóng sau khi đọc xong.
+HttpClient giữ một socket tới server qua nhiều request (và nhiều chu kỳ đo
+nếu không ngủ sâu), tự kết nối lại khi socket hỏng. Chạy được cả trên
+MicroPython (usocket) và CPython (để đo đạc).
+
+Nếu request gửi trên socket cũ thất bại trước khi nhận được byte phản hồi
+nào (server đã đóng kết nối nhàn rỗi), request được gửi lại một lần trên
+kết nối mới.
+"""
+try:
+    import usocket as socket
+except ImportError:
+    import socket
+
+
+def parse_url(url):
+    """'http://host:port/path' -> (host, port, path)"""
+    scheme, _, rest = url.partition('://')
+    if scheme != 'http':
+        raise ValueError('Only http:// URLs are supported')
+    hostport, slash, path = rest.partition('/')
+    host, _, port = hostport.partition(':')
+    return host, int(port) if port else 80, slash + path or '/'
+
+
+class HttpError(OSError):
+    """Phản hồi không đúng định dạng HTTP"""
+
+
+class HttpClient:
+    """Một kết nối HTTP/1.1 dùng lại cho mọi request tới cùng một server"""
+
+    def __init__(self, url, timeout=10):
+        self.host, self.port, self.path = parse_url(url)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._responded = False
+        self.connects = 0        # Số lần mở kết nối TCP
+        self.requests = 0
+
+    def _connect(self):
+        addr = socket.getaddrinfo(self.host, self.port)[0][-1]
+        sock = socket.socket()
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(addr)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        # MicroPython trả về chính socket; CPython trả về file đọc có bộ đệm
+        self._reader = sock.makefile('rb')
+        self.connects += 1
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                if self._reader is not self._sock:
+                    self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._reader = None
+
+    def _read_exact(self, size):
+        chunks = []
+        while size > 0:
+            chunk = self._reader.read(size)
+            if not chunk:
+                raise HttpError('Connection closed mid-body')
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+    def _read_response(self):
+        status_line = self._reader.readline()
+        if not status_line:
+            raise HttpError('Connection closed before response')
+        self._responded = True
+        parts = status_line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith(b'HTTP/'):
+            raise HttpError('Bad status line')
+        version, status = parts[0], int(parts[1])
+
+        headers = {}
+        while True:
+            line = self._reader.readline()
+            if not line or line in (b'\r\n', b'\n'):
+                break
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == b'HTTP/1.1'
+        connection = headers.get(b'connection', b'').lower()
+        if connection == b'close':
+            keep_alive = False
+        elif connection == b'keep-alive':
+            keep_alive = True
+
+        if status in (204, 304) or 100 <= status < 200:
+            body = b''  # Không bao giờ có body
+        elif headers.get(b'transfer-encoding', b'').lower() == b'chunked':
+            chunks = []
+            while True:
+                size = int(self._reader.readline().split(b';')[0], 16)
+                if size == 0:
+                    self._reader.readline()
+                    break
+                chunks.append(self._read_exact(size))
+                self._reader.readline()
+            body = b''.join(chunks)
+        elif b'content-length' in headers:
+            body = self._read_exact(int(headers[b'content-length']))
+        else:
+            body = self._reader.read()
+            keep_alive = False
+
+        if not keep_alive:
+            self.close()
+        return status, body
+
+    def request(self, method, body=b'', content_type='application/octet-stream', path=None):
+        """Gửi một request, trả về (mã HTTP, body phản hồi)"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        head = ('%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: %s\r\n'
+                'Content-Length: %d\r\nConnection: keep-alive\r\n\r\n'
+                % (method, path or self.path, self.host, content_type, len(body)))
+        for attempt in range(2):
+            reused = self._sock is not None
+            if not reused:
+                self._connect()
+            self._responded = False
+            try:
+                self._sock.sendall(head.encode() + body)
+                self.requests += 1
+                return self._read_response()
+            except OSError:
+                responded = self._responded
+                self.close()
+                # Chỉ thử lại khi socket cũ hỏng trước khi có phản hồi
+                if attempt or not reused or responded:
+                    raise
+
+    def post(self, body, content_type, path=None):
+        return self.request('POST', body, content_type, path)
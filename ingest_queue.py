@@ -0,0 +1,227 @@
+"""Hàng đợi ghi bất đồng bộ: request chỉ kiểm tra dữ liệu và xếp hàng,
+một luồng ghi riêng gom bản ghi thành lô và ghi vào SQLite.
+
+Hàng đợi có giới hạn; khi đầy, submit() trả về False để route trả 429 cho
+thiết bị thay vì để request chờ đĩa.
+
+Lô ghi lỗi được ghi lại từng bản ghi; bản ghi vẫn lỗi được chuyển vào dead
+letter. Luồng ghi xử lý bản ghi đúng thứ tự và chỉ sang bản ghi sau khi bản
+ghi trước đã được ghi hoặc đã vào dead letter, nên mốc seq của spool không
+bao giờ vượt qua bản ghi chưa được lưu ở đâu cả.
+"""
+import collections
+import threading
+import time
+
+# Số bản ghi tối đa đang chờ ghi
+DEFAULT_MAX_PENDING = 20000
+
+# Số bản ghi tối đa trong một giao dịch
+DEFAULT_BATCH_SIZE = 1000
+
+# Số lần thử lại một lô khi ghi lỗi, và thời gian chờ giữa các lần
+WRITE_RETRIES = 3
+RETRY_DELAY = 0.5
+
+# Thời gian chờ tối đa giữa hai lần thử khi cả ghi lẫn dead letter đều lỗi
+# (database không ghi được): luồng ghi dừng lại, hàng đợi đầy thì route trả 429
+MAX_RETRY_DELAY = 30.0
+
+# Số mẫu độ trễ giữ lại để tính p50/p99
+LATENCY_SAMPLES = 2048
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class IngestQueue:
+    """Hàng đợi có giới hạn + luồng ghi theo lô"""
+
+    def __init__(self, write_batch, on_written=None, dead_letter=None,
+                 max_pending=DEFAULT_MAX_PENDING, batch_size=DEFAULT_BATCH_SIZE):
+        self.write_batch = write_batch      # Hàm ghi một danh sách dòng trong một giao dịch
+        self.on_written = on_written        # Gọi sau khi lô đã commit
+        self.dead_letter = dead_letter      # dead_letter(dòng, lỗi): lưu các dòng không ghi được
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._writing = 0
+        self._thread = None
+
+        self.started_at = time.time()
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.batches = 0
+        self.max_depth = 0
+        self._batch_ms = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._queue_ms = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, rows, prepare=None):
+        """Xếp hàng cả lô; False nếu hàng đợi không đủ chỗ (không nhận phần nào).
+
+        prepare(rows), nếu có, được gọi sau khi chắc chắn còn chỗ và trước khi
+        xếp hàng, trong cùng khóa, nên thứ tự xếp hàng trùng với thứ tự gọi
+        prepare (dùng để nối vào spool theo đúng thứ tự seq).
+        """
+        now = time.perf_counter()
+        with self._cond:
+            if self._stopping or len(self._items) + len(rows) > self.max_pending:
+                self.rejected += len(rows)
+                return False
+            if prepare is not None:
+                rows = prepare(rows)
+            self._items.extend((now, row) for row in rows)
+            self.accepted += len(rows)
+            self.max_depth = max(self.max_depth, len(self._items))
+            self._cond.notify()
+        return True
+
+    def _take_batch(self):
+        with self._cond:
+            while not self._items and not self._stopping:
+                self._cond.wait()
+            count = min(len(self._items), self.batch_size)
+            batch = [self._items.popleft() for _ in range(count)]
+            self._writing = count
+            return batch
+
+    def _attempt(self, function, *args, retries=0):
+        """Gọi function, thử lại tới retries lần; trả về lỗi cuối cùng hoặc None"""
+        for attempt in range(retries + 1):
+            try:
+                function(*args)
+                return None
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    print(f"❌ Lỗi ghi lô {len(args[0])} bản ghi (lần {attempt + 1}):", str(e))
+                    time.sleep(RETRY_DELAY)
+        return error
+
+    def _write(self, rows):
+        """Ghi một lô; nếu vẫn lỗi sau WRITE_RETRIES lần thì ghi từng bản ghi.
+
+        Trả về (các dòng đã ghi, các dòng đã vào dead letter, các dòng chưa xử
+        lý được). Còn dòng chưa xử lý chỉ khi đang dừng mà database không ghi được.
+        """
+        error = self._attempt(self.write_batch, rows, retries=WRITE_RETRIES)
+        if error is None:
+            return rows, [], []
+        print(f"❌ Lỗi ghi lô {len(rows)} bản ghi, ghi lại từng bản ghi:", str(error))
+
+        written, dead = [], []
+        for index, row in enumerate(rows):
+            delay = RETRY_DELAY
+            while True:
+                error = self._attempt(self.write_batch, [row])
+                if error is None:
+                    written.append(row)
+                    break
+                if self.dead_letter is None:
+                    print("❌ Bỏ bản ghi không ghi được:", str(error))
+                    self.failed += 1
+                    break
+                dead_error = self._attempt(self.dead_letter, [row], str(error))
+                if dead_error is None:
+                    print("⚠️ Chuyển bản ghi vào dead letter:", str(error))
+                    dead.append(row)
+                    break
+                # Không ghi được cả vào dead letter: chờ rồi thử lại, không bỏ qua bản ghi
+                print(f"❌ Lỗi ghi dead letter, thử lại sau {delay:g}s:", str(dead_error))
+                with self._cond:
+                    if self._stopping:
+                        return written, dead, rows[index:]
+                    self._cond.wait(delay)     # stop() đánh thức ngay
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+        return written, dead, []
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return   # Đang dừng và đã ghi hết
+            start = time.perf_counter()
+            rows, dead, remaining = self._write([row for _, row in batch])
+            done = time.perf_counter()
+
+            with self._cond:
+                self._writing = 0
+                self.written += len(rows)
+                self.dead_lettered += len(dead)
+                if rows:
+                    self.batches += 1
+                    self._batch_ms.append((done - start) * 1000)
+                    self._queue_ms.extend((done - queued) * 1000 for queued, _ in batch)
+                if remaining:
+                    # Đưa lại vào hàng đợi để stop() báo còn bản ghi chưa ghi (spool nạp lại sau)
+                    self._items.extendleft((time.perf_counter(), row) for row in reversed(remaining))
+                self._cond.notify_all()
+
+            if rows and self.on_written is not None:
+                try:
+                    self.on_written(rows)
+                except Exception as e:
+                    print("❌ Lỗi xử lý sau khi ghi:", str(e))
+            if remaining:
+                return
+
+    def wait_idle(self, timeout=None):
+        """Chờ tới khi mọi bản ghi đã xếp hàng được ghi xong"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._items or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=30.0):
+        """Ngừng nhận bản ghi mới và ghi nốt phần còn lại"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        pending = len(self._items)
+        if pending:
+            print(f"⚠️ Còn {pending} bản ghi chưa ghi khi dừng")
+        return pending == 0
+
+    def metrics(self):
+        """Số liệu thông lượng và độ trễ của hàng đợi"""
+        with self._cond:
+            uptime = max(time.time() - self.started_at, 1e-9)
+            batch_ms = list(self._batch_ms)
+            queue_ms = list(self._queue_ms)
+            return {
+                'queue_depth': len(self._items),
+                'max_depth': self.max_depth,
+                'max_pending': self.max_pending,
+                'accepted_rows': self.accepted,
+                'rejected_rows': self.rejected,
+                'written_rows': self.written,
+                'failed_rows': self.failed,
+                'dead_letter_rows': self.dead_lettered,
+                'batches': self.batches,
+                'avg_batch_size': self.written / self.batches if self.batches else 0,
+                'rows_per_sec': self.written / uptime,
+                'batch_write_ms_p50': percentile(batch_ms, 50),
+                'batch_write_ms_p99': percentile(batch_ms, 99),
+                'ingest_latency_ms_p50': percentile(queue_ms, 50),
+                'ingest_latency_ms_p99': percentile(queue_ms, 99),
+            }
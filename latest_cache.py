@@ -0,0 +1,58 @@
+"""Bộ nhớ đệm bản ghi mới nhất của từng thiết bị cho /get_current.
+
+Mỗi mục giữ sẵn nội dung JSON đã tuần tự hóa và ETag tương ứng, nên một lần
+poll của dashboard khi không có dữ liệu mới chỉ cần so sánh ETag (304).
+"""
+import hashlib
+import json
+import threading
+
+
+class LatestCache:
+    """Bản ghi mới nhất theo device_id, an toàn khi dùng từ nhiều luồng"""
+
+    def __init__(self):
+        self._entries = {}
+        self._newest = None   # device_id nhận dữ liệu gần nhất
+        self._lock = threading.Lock()
+
+    def put(self, device_id, timestamp, payload):
+        """Lưu payload nếu không cũ hơn bản ghi đang có của thiết bị.
+
+        Trả về True nếu bộ nhớ đệm được cập nhật (False cả khi nội dung không đổi).
+        """
+        current = self._entries.get(device_id)
+        if current is not None and current['payload'] == payload:
+            return False      # Bản ghi đã có (vd: đọc lại từ database), không cần tuần tự hóa lại
+        body = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        with self._lock:
+            current = self._entries.get(device_id)
+            if current is not None and (timestamp < current['timestamp'] or etag == current['etag']):
+                return False
+            self._entries[device_id] = {
+                'timestamp': timestamp,
+                'payload': payload,
+                'body': body,
+                'etag': etag,
+            }
+            newest = self._entries.get(self._newest)
+            if newest is None or newest is current or timestamp >= newest['timestamp']:
+                self._newest = device_id
+        return True
+
+    def get(self, device_id=None):
+        """Mục của một thiết bị, hoặc của thiết bị gửi dữ liệu gần nhất"""
+        with self._lock:
+            if device_id is None:
+                device_id = self._newest
+            return self._entries.get(device_id)
+
+    def devices(self):
+        with self._lock:
+            return sorted(self._entries, key=lambda d: (d is None, d or ''))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._newest = None
@@ -0,0 +1,104 @@
+"""Phát bản ghi mới tới các dashboard đang mở qua Server-Sent Events.
+
+Mỗi client có một hàng đợi giới hạn; client đọc chậm chỉ mất các bản ghi cũ
+nhất của chính nó, không làm chậm việc nhận dữ liệu từ thiết bị.
+"""
+import queue
+import threading
+
+# Số sự kiện tối đa chờ gửi cho mỗi client
+DEFAULT_QUEUE_SIZE = 32
+
+# Số client tối đa trên một tiến trình
+DEFAULT_MAX_SUBSCRIBERS = 1000
+
+# Gửi dòng chú thích định kỳ để proxy/trình duyệt không đóng kết nối
+HEARTBEAT_SECONDS = 15
+
+
+class Subscription:
+    def __init__(self, device_id=None, maxsize=DEFAULT_QUEUE_SIZE):
+        self.device_id = device_id
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        """Đưa sự kiện vào hàng đợi, bỏ sự kiện cũ nhất nếu đầy"""
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Lấy sự kiện tiếp theo, None nếu hết thời gian chờ"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Phân phối sự kiện trong tiến trình tới mọi Subscription"""
+
+    def __init__(self, max_subscribers=DEFAULT_MAX_SUBSCRIBERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, device_id=None):
+        """Đăng ký nhận sự kiện (của một thiết bị hoặc tất cả), None nếu đã đầy"""
+        sub = Subscription(device_id, self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def publish(self, device_id, event):
+        """Gửi sự kiện tới các client quan tâm tới device_id"""
+        with self._lock:
+            targets = list(self._subscribers)
+        for sub in targets:
+            if sub.device_id is None or sub.device_id == device_id:
+                sub.offer(event)
+        self.published += 1
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+
+def sse_format(data, event=None):
+    """Đóng gói một sự kiện theo định dạng text/event-stream"""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    lines = [f"event: {event}"] if event else []
+    lines.extend(f"data: {line}" for line in data.splitlines())
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+def event_stream(broker, sub, initial=None, heartbeat=HEARTBEAT_SECONDS):
+    """Generator cho response SSE; tự hủy đăng ký khi client ngắt kết nối"""
+    try:
+        if initial is not None:
+            yield sse_format(initial, 'reading')
+        while True:
+            event = sub.get(timeout=heartbeat)
+            if event is None:
+                yield b": keep-alive\n\n"
+            else:
+                yield sse_format(event, 'reading')
+    finally:
+        broker.unsubscribe(sub)
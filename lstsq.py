@@ -0,0 +1,198 @@
+"""Bình phương tối thiểu ổn định số, chạy được trên ESP32 (MicroPython) và CPython.
+
+Đường cũ của do_an.py dựng X^T X từ đặc trưng thô (1, ~30°C, ~60%, ~600 đơn
+vị đất) rồi nghịch đảo trực tiếp: số điều kiện của X^T X là bình phương số
+điều kiện của X và lên tới hàng tỷ, nên float 32 bit mất gần hết chữ số, và
+chỉ khi pivot đúng bằng 0 mới báo lỗi (bỏ cả cửa sổ).
+
+fit() thay thế bằng:
+- chuẩn hóa từng cột (trừ trung bình, chia độ lệch chuẩn), hệ số chặn tách
+  riêng; cột không đổi trong cửa sổ được bỏ qua (hệ số 0) thay vì báo lỗi;
+- giải bằng QR Householder trên [Z; sqrt(ridge)·I] (không bình phương số
+  điều kiện) hoặc Cholesky của Z^T Z + ridge·I;
+- nếu ma trận vẫn suy biến (hai cột thẳng hàng), tự thêm ridge nhỏ;
+- trả về số điều kiện của bài toán đã chuẩn hóa để bên gọi biết độ tin cậy.
+"""
+EPS = 1e-12
+# Ngưỡng tương đối, đủ lớn so với sai số làm tròn của float 32 bit:
+PIVOT_TOL = 1e-6       # Pivot Cholesky / R_ii² nhỏ hơn mức này coi là suy biến
+CONSTANT_TOL = 1e-6    # Cột có độ lệch chuẩn nhỏ hơn mức này (so với trung bình) coi là không đổi
+AUTO_RIDGE = 1e-6      # Ridge tự thêm khi suy biến, theo đơn vị Z^T Z (đường chéo = n)
+METHODS = ('qr', 'cholesky')
+
+
+def _cholesky(a, p):
+    """L (tam giác dưới, mảng phẳng) với L·L^T = a, hoặc None nếu không xác định dương"""
+    L = [0.0] * (p * p)
+    scale = max(a[i * p + i] for i in range(p))
+    for i in range(p):
+        for j in range(i + 1):
+            s = a[i * p + j]
+            for m in range(j):
+                s -= L[i * p + m] * L[j * p + m]
+            if i == j:
+                if s <= PIVOT_TOL * scale:
+                    return None
+                L[i * p + i] = s ** 0.5
+            else:
+                L[i * p + j] = s / L[j * p + j]
+    return L
+
+
+def _solve_cholesky(Z, yc, p, ridge):
+    """(g, Z^T Z + ridge·I) hoặc (None, _) nếu suy biến"""
+    a = [0.0] * (p * p)
+    b = [0.0] * p
+    for row, yi in zip(Z, yc):
+        for i in range(p):
+            zi = row[i]
+            b[i] += zi * yi
+            for j in range(i + 1):
+                a[i * p + j] += zi * row[j]
+    for i in range(p):
+        a[i * p + i] += ridge
+        for j in range(i):
+            a[j * p + i] = a[i * p + j]
+    L = _cholesky(a, p)
+    if L is None:
+        return None, a
+    z = [0.0] * p
+    for i in range(p):
+        s = b[i]
+        for m in range(i):
+            s -= L[i * p + m] * z[m]
+        z[i] = s / L[i * p + i]
+    g = [0.0] * p
+    for i in range(p - 1, -1, -1):
+        s = z[i]
+        for m in range(i + 1, p):
+            s -= L[m * p + i] * g[m]
+        g[i] = s / L[i * p + i]
+    return g, a
+
+
+def _solve_qr(Z, yc, p, ridge):
+    """Householder QR trên [Z; sqrt(ridge)·I]; (g, R^T R) hoặc (None, _) nếu suy biến"""
+    A = [list(row) for row in Z]
+    rhs = list(yc)
+    if ridge > 0:
+        root = ridge ** 0.5
+        for i in range(p):
+            A.append([root if j == i else 0.0 for j in range(p)])
+            rhs.append(0.0)
+    m = len(A)
+    for j in range(p):
+        norm = sum(A[i][j] * A[i][j] for i in range(j, m)) ** 0.5
+        if norm == 0:
+            continue
+        alpha = -norm if A[j][j] >= 0 else norm
+        v = [A[i][j] for i in range(j, m)]
+        v[0] -= alpha
+        vv = sum(x * x for x in v)
+        if vv == 0:
+            continue
+        for c in range(j, p):
+            f = 2 * sum(v[i - j] * A[i][c] for i in range(j, m)) / vv
+            for i in range(j, m):
+                A[i][c] -= f * v[i - j]
+        f = 2 * sum(v[i - j] * rhs[i] for i in range(j, m)) / vv
+        for i in range(j, m):
+            rhs[i] -= f * v[i - j]
+
+    diag = max(A[i][i] * A[i][i] for i in range(p))
+    rtr = [0.0] * (p * p)
+    for i in range(p):
+        for j in range(p):
+            rtr[i * p + j] = sum(A[r][i] * A[r][j] for r in range(min(i, j) + 1))
+    if any(A[i][i] * A[i][i] <= PIVOT_TOL * diag for i in range(p)):
+        return None, rtr
+    g = [0.0] * p
+    for i in range(p - 1, -1, -1):
+        s = rhs[i]
+        for c in range(i + 1, p):
+            s -= A[i][c] * g[c]
+        g[i] = s / A[i][i]
+    return g, rtr
+
+
+def eigenvalues(a, p, sweeps=30):
+    """Trị riêng của ma trận đối xứng p×p (mảng phẳng), phương pháp Jacobi"""
+    a = list(a)
+    for _ in range(sweeps):
+        off = sum(a[i * p + j] ** 2 for i in range(p) for j in range(p) if i != j)
+        if off <= EPS * EPS * sum(a[i * p + i] ** 2 for i in range(p)):
+            break
+        for q in range(p):
+            for r in range(q + 1, p):
+                aqr = a[q * p + r]
+                if abs(aqr) <= EPS * (abs(a[q * p + q]) + abs(a[r * p + r])):
+                    continue
+                theta = (a[r * p + r] - a[q * p + q]) / (2 * aqr)
+                if abs(theta) > 1e4:
+                    t = 0.5 / theta      # Tránh tràn số khi tính theta²
+                else:
+                    t = (1 if theta >= 0 else -1) / (abs(theta) + (theta * theta + 1) ** 0.5)
+                c = 1 / (t * t + 1) ** 0.5
+                s = t * c
+                for k in range(p):
+                    akq, akr = a[k * p + q], a[k * p + r]
+                    a[k * p + q] = c * akq - s * akr
+                    a[k * p + r] = s * akq + c * akr
+                for k in range(p):
+                    aqk, ark = a[q * p + k], a[r * p + k]
+                    a[q * p + k] = c * aqk - s * ark
+                    a[r * p + k] = s * aqk + c * ark
+    return [a[i * p + i] for i in range(p)]
+
+
+def condition_number(gram, p):
+    """Số điều kiện (chuẩn 2) của X khi gram = X^T X"""
+    values = eigenvalues(gram, p)
+    low, high = min(values), max(values)
+    return (high / low) ** 0.5 if low > 0 else float('inf')
+
+
+def raw_condition(X):
+    """Số điều kiện của X như đưa vào (không chuẩn hóa), để so sánh"""
+    k = len(X[0])
+    gram = [sum(row[i] * row[j] for row in X) for i in range(k) for j in range(k)]
+    return condition_number(gram, k)
+
+
+def fit(X, y, ridge=0.0, method='qr'):
+    """Hệ số beta theo thang gốc sao cho X·beta ≈ y, và số điều kiện.
+
+    X là các dòng [1, x1, ..., xp] (cột đầu là hệ số chặn, như do_an.py);
+    ridge phạt các hệ số đã chuẩn hóa (không phạt hệ số chặn).
+    Trả về (beta, condition); condition = 1.0 nếu không còn cột nào thay đổi.
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown method: %s' % method)
+    n = len(X)
+    k = len(X[0])
+    ybar = sum(y) / n
+    means = [0.0] * k
+    stds = [0.0] * k
+    for j in range(1, k):
+        mean = sum(row[j] for row in X) / n
+        var = sum((row[j] - mean) * (row[j] - mean) for row in X) / n
+        means[j] = mean
+        stds[j] = var ** 0.5
+    active = [j for j in range(1, k) if stds[j] > CONSTANT_TOL * max(1.0, abs(means[j]))]
+    beta = [0.0] * k
+    beta[0] = ybar
+    p = len(active)
+    if not p:
+        return beta, 1.0
+
+    Z = [[(row[j] - means[j]) / stds[j] for j in active] for row in X]
+    yc = [yi - ybar for yi in y]
+    solve = _solve_qr if method == 'qr' else _solve_cholesky
+    g, gram = solve(Z, yc, p, ridge)
+    if g is None:
+        ridge = max(ridge, AUTO_RIDGE * n)
+        g, gram = solve(Z, yc, p, ridge)
+    for g_i, j in zip(g, active):
+        beta[j] = g_i / stds[j]
+        beta[0] -= g_i * means[j] / stds[j]
+    return beta, condition_number(gram, p)
@@ -0,0 +1,269 @@
+"""Các lệnh quản trị database của backend.
+
+Ví dụ:
+    python manage.py migrate
+    python manage.py backfill-rollups
+    python manage.py rebuild-ptrend [--device 246f28a1b2c3]
+    python manage.py reanalyze --params coeffs.json [--from 1700000000 --to 1710000000]
+    python manage.py label-rain --device 246f28a1b2c3 --from 1700000000 --to 1700003600 --value 1
+    python manage.py train --link logistic [--dry-run]
+    python manage.py expire --days 90
+    python manage.py export --format parquet --from 1700000000 --to 1710000000 -o weather.parquet
+    python manage.py partitions
+    python manage.py --db /data/weather_data.db migrate
+"""
+import argparse
+import json
+import sys
+import time
+
+import storage
+from pressure_trend import PressureTrend
+
+
+def cmd_migrate(args):
+    applied = storage.migrate(args.target)
+    with storage.connection() as conn:
+        version = storage.schema_version(conn)
+    if applied:
+        print(f"✅ Đã áp dụng migration {applied}, schema hiện tại: v{version}")
+    else:
+        print(f"✅ Schema đã ở phiên bản mới nhất (v{version})")
+
+
+def cmd_backfill_rollups(args):
+    print("⏳ Đang tính lại bảng tổng hợp theo giờ/ngày...")
+    storage.migrate()
+    storage.rebuild_rollups()
+    print("✅ Đã tính lại bảng tổng hợp")
+
+
+def cmd_rebuild_ptrend(args):
+    """Tính lại pressure_trend từ lịch sử áp suất đã lưu, cùng thuật toán với thiết bị"""
+    storage.migrate()
+    print("⏳ Đang tính lại xu hướng áp suất...")
+    updates = []
+    count = 0
+    tracker = None
+    device = object()
+    for row_id, device_id, timestamp, pressure, _ in storage.iter_pressure_rows(args.device):
+        if device_id != device:
+            device = device_id
+            tracker = PressureTrend()
+        tracker.add(timestamp, pressure)
+        updates.append((tracker.trend(), row_id))
+        if len(updates) >= args.batch_size:
+            storage.update_pressure_trends(updates)
+            count += len(updates)
+            updates = []
+    if updates:
+        storage.update_pressure_trends(updates)
+        count += len(updates)
+    storage.rebuild_rollups(args.device)
+    storage.rebuild_latest()
+    print(f"✅ Đã tính lại pressure_trend cho {count} bản ghi")
+
+
+def cmd_reanalyze(args):
+    import reanalysis
+
+    storage.migrate()
+    params = None
+    if args.params:
+        with open(args.params, encoding='utf-8') as f:
+            params = json.load(f)
+    print("⏳ Đang tính lại các cột dẫn xuất...")
+    rows, seconds = reanalysis.reanalyze(
+        params, args.device, args.start, args.end, args.chunk_size, args.dry_run,
+        progress=lambda done: print(f"   {done} bản ghi"))
+    action = "Đã tính thử" if args.dry_run else "Đã tính lại"
+    print(f"✅ {action} {rows} bản ghi trong {seconds:.1f}s "
+          f"({rows / seconds if seconds else 0:.0f} bản ghi/giây)")
+
+
+def cmd_label_rain(args):
+    storage.migrate()
+    count = storage.set_rain_observed(None if args.clear else args.value,
+                                      args.device, args.start, args.end)
+    print(f"✅ Đã gán nhãn rain_observed cho {count} bản ghi")
+
+
+def cmd_train(args):
+    import reanalysis
+    import training
+
+    storage.migrate()
+    print(f"⏳ Đang huấn luyện mô hình dự báo mưa (link={args.link})...")
+    result = training.fit(
+        args.link, args.device, args.start, args.end, args.chunk_size, args.ridge, args.max_iter,
+        progress=lambda i, rows: print(f"   vòng {i}: {rows} bản ghi"))
+    print(f"✅ Huấn luyện xong trên {result['rows']} bản ghi sau {result['iterations']} vòng "
+          f"({result['seconds']:.1f}s)")
+    for name, value in result['coeffs'].items():
+        print(f"   {name:20s} {value: .6g}")
+    for name, value in result['metrics'].items():
+        print(f"   {name:20s} {value}")
+    if args.dry_run:
+        return
+    version = training.publish(result)
+    print(f"✅ Đã phát hành hệ số phiên bản {version}")
+    if args.reanalyze:
+        reanalysis.reanalyze({'regression_coeffs': result['coeffs'], 'rain_link': result['link']},
+                             args.device, args.start, args.end)
+        print("✅ Đã tính lại rain_probability với hệ số mới")
+
+
+def cmd_expire(args):
+    storage.migrate()
+    days = args.days if args.days is not None else storage.retention_days()
+    if days is None:
+        print("⚠️ Chưa cấu hình số ngày giữ dữ liệu thô (--days hoặc WEATHER_RETENTION_DAYS)")
+        return
+    dropped = storage.apply_retention(days)
+    if dropped:
+        print(f"✅ Đã xóa {len(dropped)} phân vùng cũ hơn {days:g} ngày: {', '.join(dropped)}")
+    else:
+        print(f"✅ Không có phân vùng nào cũ hơn {days:g} ngày")
+
+
+def cmd_partitions(args):
+    storage.migrate()
+    with storage.connection() as conn:
+        for key in storage.list_partitions(conn):
+            name = storage.partition_name(key)
+            count, first, last = conn.execute(
+                f"SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM {name}").fetchone()
+            print(f"{name}: {count} bản ghi ({first} .. {last})")
+
+
+def cmd_dead_letter(args):
+    storage.migrate()
+    entries = storage.fetch_dead_letters(args.limit)
+    if not args.retry:
+        for id_, row, error, created_at in entries:
+            print(f"#{id_} {created_at} {error}: {row}")
+        print(f"✅ {len(entries)} bản ghi trong dead letter")
+        return
+    retried = 0
+    for id_, row, error, created_at in entries:
+        try:
+            storage.insert_readings([row])
+        except Exception as e:
+            print(f"❌ #{id_} vẫn lỗi:", str(e))
+            continue
+        storage.delete_dead_letters([id_])
+        retried += 1
+    print(f"✅ Đã ghi lại {retried}/{len(entries)} bản ghi từ dead letter")
+
+
+def cmd_export(args):
+    import export
+
+    storage.migrate()
+    columns = export.parse_columns(args.columns)
+    device_ids = [d for value in args.device or () for d in value.split(',') if d] or None
+    rows = 0
+
+    def count(n):
+        nonlocal rows
+        rows += n
+
+    started = time.perf_counter()
+    chunks = export.export(args.format, columns, args.start, args.end, device_ids, args.chunk_size,
+                           on_chunk=count)
+    if args.output == '-':
+        out = sys.stdout.buffer
+        for data in chunks:
+            out.write(data)
+        out.flush()
+        return
+    with open(args.output, 'wb') as out:
+        for data in chunks:
+            out.write(data)
+        size = out.tell()
+    seconds = time.perf_counter() - started
+    print(f"✅ Đã xuất {rows} bản ghi ({size / 1e6:.1f} MB) ra {args.output} trong {seconds:.1f}s "
+          f"({rows / seconds if seconds else 0:.0f} bản ghi/giây)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Quản trị database trạm thời tiết")
+    parser.add_argument('--db', help="Đường dẫn database (mặc định: WEATHER_DB)")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('migrate', help="Nâng cấp schema tại chỗ")
+    p.add_argument('--target', type=int, help="Phiên bản đích (mặc định: mới nhất)")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser('backfill-rollups',
+                       help="Tính lại bảng tổng hợp theo giờ/ngày từ dữ liệu thô")
+    p.set_defaults(func=cmd_backfill_rollups)
+
+    p = sub.add_parser('rebuild-ptrend',
+                       help="Tính lại pressure_trend (hPa/3h) từ lịch sử áp suất đã lưu")
+    p.add_argument('--device', help="Chỉ tính cho một thiết bị")
+    p.add_argument('--batch-size', type=int, default=5000)
+    p.set_defaults(func=cmd_rebuild_ptrend)
+
+    p = sub.add_parser('reanalyze',
+                       help="Tính lại điểm sương, ẩm tuyệt đối, xác suất mưa, chỉ số thoải mái, mô tả")
+    p.add_argument('--params', help="File JSON ghi đè regression_coeffs/weather_thresholds/pressure_thresholds")
+    p.add_argument('--device', help="Chỉ tính cho một thiết bị")
+    p.add_argument('--from', dest='start', type=int, help="Từ timestamp (giây)")
+    p.add_argument('--to', dest='end', type=int, help="Tới timestamp (giây, không gồm)")
+    p.add_argument('--chunk-size', type=int, default=50000)
+    p.add_argument('--dry-run', action='store_true', help="Chỉ tính, không ghi lại")
+    p.set_defaults(func=cmd_reanalyze)
+
+    p = sub.add_parser('label-rain', help="Gán nhãn mưa thực tế (rain_observed) cho dữ liệu huấn luyện")
+    p.add_argument('--device', help="Chỉ gán cho một thiết bị")
+    p.add_argument('--from', dest='start', type=int, help="Từ timestamp (giây)")
+    p.add_argument('--to', dest='end', type=int, help="Tới timestamp (giây, không gồm)")
+    group = p.add_mutually_exclusive_group(required=True)
+    group.add_argument('--value', type=int, choices=(0, 1), help="1: có mưa, 0: không mưa")
+    group.add_argument('--clear', action='store_true', help="Xóa nhãn")
+    p.set_defaults(func=cmd_label_rain)
+
+    p = sub.add_parser('train', help="Huấn luyện regression_coeffs từ dữ liệu có nhãn và phát hành cho thiết bị")
+    p.add_argument('--link', choices=('identity', 'logistic'), default='identity')
+    p.add_argument('--device', help="Chỉ dùng dữ liệu của một thiết bị")
+    p.add_argument('--from', dest='start', type=int, help="Từ timestamp (giây)")
+    p.add_argument('--to', dest='end', type=int, help="Tới timestamp (giây, không gồm)")
+    p.add_argument('--chunk-size', type=int, default=50000)
+    p.add_argument('--ridge', type=float, default=0.0, help="Hệ số ridge (không phạt hệ số chặn)")
+    p.add_argument('--max-iter', type=int, default=25, help="Số vòng IRLS tối đa (link logistic)")
+    p.add_argument('--dry-run', action='store_true', help="Chỉ huấn luyện, không phát hành")
+    p.add_argument('--reanalyze', action='store_true',
+                   help="Tính lại rain_probability đã lưu bằng hệ số mới")
+    p.set_defaults(func=cmd_train)
+
+    p = sub.add_parser('expire', help="Xóa các phân vùng tháng đã quá hạn giữ dữ liệu thô")
+    p.add_argument('--days', type=float, help="Số ngày giữ dữ liệu thô (mặc định: WEATHER_RETENTION_DAYS)")
+    p.set_defaults(func=cmd_expire)
+
+    p = sub.add_parser('partitions', help="Liệt kê các phân vùng tháng của bảng weather")
+    p.set_defaults(func=cmd_partitions)
+
+    p = sub.add_parser('dead-letter', help="Liệt kê (hoặc ghi lại) các bản ghi luồng ghi không lưu được")
+    p.add_argument('--limit', type=int, help="Số bản ghi tối đa")
+    p.add_argument('--retry', action='store_true', help="Ghi lại vào weather, xóa khỏi dead letter nếu thành công")
+    p.set_defaults(func=cmd_dead_letter)
+
+    p = sub.add_parser('export', help="Xuất dữ liệu thô ra CSV/Arrow/Parquet theo luồng")
+    p.add_argument('--format', choices=('csv', 'arrow', 'parquet'), default='csv')
+    p.add_argument('--device', action='append', help="Thiết bị (lặp lại hoặc cách nhau bởi dấu phẩy)")
+    p.add_argument('--from', dest='start', type=int, help="Từ timestamp (giây)")
+    p.add_argument('--to', dest='end', type=int, help="Tới timestamp (giây, không gồm)")
+    p.add_argument('--columns', help="Các cột, cách nhau bởi dấu phẩy (mặc định: tất cả)")
+    p.add_argument('--chunk-size', type=int, default=10000)
+    p.add_argument('-o', '--output', default='-', help="File đích ('-': stdout)")
+    p.set_defaults(func=cmd_export)
+
+    args = parser.parse_args(argv)
+    if args.db:
+        storage.configure(args.db)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Hàng đợi báo cáo chưa gửi trên flash (store-and-forward) cho ESP32.
+
+Bộ đệm vòng gồm các ô cố định wire_format.RECORD_SIZE byte trong một file:
+
+    <MAGIC: 4s> <kích thước record: H> <sức chứa: I> <head: I> <count: I>
+    <ô 0> <ô 1> ... <ô sức chứa-1>
+
+head là ô cũ nhất, count là số record đang chờ. Khi đầy, record mới ghi đè
+record cũ nhất. Ô được ghi trước, header sau, nên mất điện giữa chừng chỉ làm
+mất tối đa một record chứ không làm hỏng hàng đợi.
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+import wire_format
+
+MAGIC = b'WOB1'
+HEADER_FORMAT = '<4sHIII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+
+class Outbox:
+    """Bộ đệm vòng có giới hạn; xóa record cũ nhất khi đầy"""
+
+    def __init__(self, path, capacity, record_size=wire_format.RECORD_SIZE):
+        self.path = path
+        self.capacity = capacity
+        self.record_size = record_size
+        self.head = 0
+        self.count = 0
+        self.dropped = 0       # Số record bị ghi đè từ lúc khởi động
+        self._file = None
+        self._open()
+
+    def _open(self):
+        try:
+            f = open(self.path, 'r+b')
+        except OSError:
+            f = None
+        if f is not None:
+            header = f.read(HEADER_SIZE)
+            if len(header) == HEADER_SIZE:
+                magic, record_size, capacity, head, count = struct.unpack(HEADER_FORMAT, header)
+                if (magic == MAGIC and record_size == self.record_size
+                        and capacity == self.capacity and head < capacity and count <= capacity):
+                    self._file = f
+                    self.head = head
+                    self.count = count
+                    return
+            print("⚠️ Outbox: định dạng/sức chứa thay đổi, tạo lại hàng đợi")
+            f.close()
+        self._file = open(self.path, 'w+b')
+        self._write_header()
+
+    def _write_header(self):
+        self._file.seek(0)
+        self._file.write(struct.pack(HEADER_FORMAT, MAGIC, self.record_size,
+                                     self.capacity, self.head, self.count))
+        self._file.flush()
+
+    def _slot_offset(self, index):
+        return HEADER_SIZE + ((self.head + index) % self.capacity) * self.record_size
+
+    def __len__(self):
+        return self.count
+
+    def append(self, record):
+        """Thêm một record vào cuối; nếu đầy thì ghi đè record cũ nhất"""
+        if len(record) != self.record_size:
+            raise ValueError('Record must be %d bytes' % self.record_size)
+        self._file.seek(self._slot_offset(self.count % self.capacity))
+        self._file.write(record)
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.head = (self.head + 1) % self.capacity
+            self.dropped += 1
+        self._write_header()
+
+    def peek(self, limit):
+        """Trả về tối đa limit record cũ nhất (nối liền nhau) mà không xóa"""
+        limit = min(limit, self.count)
+        chunks = []
+        index = 0
+        while index < limit:
+            # Đọc liền một đoạn tới cuối file rồi quay vòng về ô 0
+            slot = (self.head + index) % self.capacity
+            run = min(limit - index, self.capacity - slot)
+            self._file.seek(HEADER_SIZE + slot * self.record_size)
+            chunks.append(self._file.read(run * self.record_size))
+            index += run
+        return b''.join(chunks)
+
+    def drop(self, count):
+        """Xóa count record cũ nhất (sau khi server đã nhận)"""
+        count = min(count, self.count)
+        self.head = (self.head + count) % self.capacity
+        self.count -= count
+        if self.count == 0:
+            self.head = 0
+        self._write_header()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
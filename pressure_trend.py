@@ -0,0 +1,103 @@
+"""Xu hướng áp suất (hPa/3h) theo thời gian thực, dùng chung cho ESP32 và server.
+
+Các mẫu (timestamp, áp suất) được gom vào các ô BIN_SECONDS giây trong một
+bộ đệm vòng cố định phủ WINDOW_SECONDS gần nhất; mỗi ô giữ tổng áp suất và
+tổng độ lệch thời gian trong ô, nên bộ nhớ không phụ thuộc tần suất lấy mẫu.
+Xu hướng là hệ số góc bình phương tối thiểu qua trung bình các ô, quy ra
+hPa trên 3 giờ. Khi dữ liệu chưa phủ đủ MIN_SPAN_SECONDS thì trả về 0.0.
+
+Thiết bị nạp từng báo cáo khi đo; server nạp lại lịch sử đã lưu theo cùng thứ
+tự thời gian và nhận được cùng kết quả (sai khác chỉ do làm tròn khi truyền).
+"""
+from array import array
+
+WINDOW_SECONDS = 3 * 3600
+BIN_SECONDS = 600
+MIN_SPAN_SECONDS = 1800
+TREND_SECONDS = 3 * 3600   # Đơn vị kết quả: hPa / 3 giờ
+
+
+class PressureTrend:
+    def __init__(self, window=WINDOW_SECONDS, bin_seconds=BIN_SECONDS):
+        self.bin_seconds = bin_seconds
+        self.slots = window // bin_seconds
+        self.bins = array('l', [-1] * self.slots)      # Chỉ số ô (timestamp // bin_seconds)
+        self.counts = array('l', [0] * self.slots)
+        self.sum_p = array('d', [0.0] * self.slots)
+        self.sum_dt = array('d', [0.0] * self.slots)   # Tổng (timestamp - đầu ô)
+        self.last_bin = -1
+
+    def add(self, timestamp, pressure):
+        """Thêm một mẫu; bỏ qua NaN/None và mẫu cũ hơn cửa sổ"""
+        if pressure is None or pressure != pressure:
+            return
+        timestamp = int(timestamp)
+        b = timestamp // self.bin_seconds
+        if b <= self.last_bin - self.slots:
+            return
+        slot = b % self.slots
+        if self.bins[slot] != b:
+            self.bins[slot] = b
+            self.counts[slot] = 0
+            self.sum_p[slot] = 0.0
+            self.sum_dt[slot] = 0.0
+        self.counts[slot] += 1
+        self.sum_p[slot] += pressure
+        self.sum_dt[slot] += timestamp - b * self.bin_seconds
+        if b > self.last_bin:
+            self.last_bin = b
+
+    def _points(self):
+        """(x, y) của các ô trong cửa sổ: x là giây so với đầu ô mới nhất
+        (số nhỏ, đủ chính xác với số thực 32 bit), y là áp suất trung bình"""
+        oldest = self.last_bin - self.slots + 1
+        for slot in range(self.slots):
+            b, count = self.bins[slot], self.counts[slot]
+            if b >= oldest and count:
+                yield ((b - self.last_bin) * self.bin_seconds + self.sum_dt[slot] / count,
+                       self.sum_p[slot] / count)
+
+    def trend(self):
+        """Xu hướng áp suất (hPa/3h) tới mẫu mới nhất"""
+        n = 0
+        sx = sy = 0.0
+        lo = hi = 0.0
+        for x, y in self._points():
+            if not n or x < lo:
+                lo = x
+            if not n or x > hi:
+                hi = x
+            sx += x
+            sy += y
+            n += 1
+        if n < 2 or hi - lo < MIN_SPAN_SECONDS:
+            return 0.0
+        mx, my = sx / n, sy / n
+        sxy = sxx = 0.0
+        for x, y in self._points():
+            sxy += (x - mx) * (y - my)
+            sxx += (x - mx) * (x - mx)
+        return sxy / sxx * TREND_SECONDS
+
+    def to_state(self):
+        """Dạng JSON để giữ qua deep sleep"""
+        return {'bins': list(self.bins), 'counts': list(self.counts),
+                'sum_p': list(self.sum_p), 'sum_dt': list(self.sum_dt)}
+
+    def load_state(self, state):
+        if not state or len(state.get('bins', ())) != self.slots:
+            return
+        for i in range(self.slots):
+            self.bins[i] = state['bins'][i]
+            self.counts[i] = state['counts'][i]
+            self.sum_p[i] = state['sum_p'][i]
+            self.sum_dt[i] = state['sum_dt'][i]
+        self.last_bin = max(self.bins)
+
+
+def trend_from_samples(samples):
+    """Xu hướng từ các (timestamp, áp suất) theo thứ tự thời gian (dùng ở server)"""
+    tracker = PressureTrend()
+    for timestamp, pressure in samples:
+        tracker.add(timestamp, pressure)
+    return tracker.trend()
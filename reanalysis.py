@@ -0,0 +1,299 @@
+"""Tính lại các cột dẫn xuất (điểm sương, ẩm tuyệt đối, xác suất mưa, chỉ số
+thoải mái, mô tả) cho dữ liệu đã lưu, bằng NumPy theo từng khối.
+
+Các công thức là bản vector hóa của WeatherAnalyzer trong ban_phu.py, kể cả
+cách xử lý NaN và làm tròn, nên khi đổi regression_coeffs/weather_thresholds
+có thể tính lại toàn bộ lịch sử. DEFAULT_PARAMS sao chép CONFIG của thiết bị
+(ban_phu.py chỉ chạy trên MicroPython nên không import được); truyền params
+để thử bộ hệ số khác.
+"""
+import copy
+import os
+import threading
+import time
+
+import numpy as np
+
+import storage
+
+DEFAULT_PARAMS = {
+    'regression_coeffs': {
+        'intercept': -5.0,
+        'ah': 0.3,
+        'temp_dew_reciprocal': 2.5,
+        'soil': -0.002,
+        'pressure': -0.02,
+        'pressure_trend': 0.5,
+    },
+    # 'identity': xác suất = tổ hợp tuyến tính; 'logistic': qua hàm sigmoid
+    'rain_link': 'identity',
+    'weather_thresholds': [
+        {'ah_min': 17, 'temp_dew_max': 1, 'rain_prob': 0.95, 'description': 'Chắc chắn có mưa'},
+        {'ah_min': 15, 'temp_dew_max': 2, 'rain_prob': 0.75, 'description': 'Khả năng cao có mưa'},
+        {'ah_min': 12, 'temp_dew_max': 5, 'rain_prob': 0.30, 'description': 'Ít khả năng có mưa'},
+        {'ah_min': 0, 'temp_dew_max': 99, 'rain_prob': 0.05, 'description': 'Chắc chắn không mưa'},
+    ],
+    'pressure_thresholds': {
+        'high': 1020,
+        'low': 1000,
+    },
+}
+
+UNKNOWN_DESCRIPTION = 'Không thể xác định'
+DEFAULT_DESCRIPTION = 'Thời tiết ổn định'
+
+# Cột đầu vào và cột được ghi lại
+INPUT_COLUMNS = ('temperature', 'humidity', 'pressure', 'soil_moisture', 'pressure_trend')
+DERIVED_COLUMNS = ('dew_point', 'absolute_humidity', 'rain_probability',
+                   'comfort_index', 'weather_description')
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+THRESHOLD_KEYS = ('ah_min', 'temp_dew_max', 'rain_prob', 'description')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _merge_group(key, default, value):
+    """Ghi đè một nhóm dict (chỉ khóa đã có, giá trị là số)"""
+    if not isinstance(value, dict):
+        raise ValueError(f"{key} phải là object")
+    for name, number in value.items():
+        if name not in default:
+            raise ValueError(f"Tham số không hợp lệ: {key}.{name}")
+        if not _is_number(number):
+            raise ValueError(f"{key}.{name} phải là số")
+    return {**default, **value}
+
+
+def _check_thresholds(value):
+    """weather_thresholds: danh sách object đủ THRESHOLD_KEYS, description là chuỗi"""
+    if not isinstance(value, list) or not value:
+        raise ValueError("weather_thresholds phải là danh sách không rỗng")
+    for i, threshold in enumerate(value):
+        if not isinstance(threshold, dict) or set(threshold) != set(THRESHOLD_KEYS):
+            raise ValueError(f"weather_thresholds[{i}] phải có đúng các khóa {', '.join(THRESHOLD_KEYS)}")
+        if not isinstance(threshold['description'], str):
+            raise ValueError(f"weather_thresholds[{i}].description phải là chuỗi")
+        for name in THRESHOLD_KEYS[:-1]:
+            if not _is_number(threshold[name]):
+                raise ValueError(f"weather_thresholds[{i}].{name} phải là số")
+    return copy.deepcopy(value)
+
+
+def merge_params(overrides=None):
+    """DEFAULT_PARAMS với các mục được ghi đè (theo từng nhóm).
+
+    Kiểm tra kiểu từng mục; tham số sai báo ValueError (endpoint trả 400).
+    """
+    if overrides is not None and not isinstance(overrides, dict):
+        raise ValueError("params phải là object")
+    params = copy.deepcopy(DEFAULT_PARAMS)
+    for key, value in (overrides or {}).items():
+        if key not in params:
+            raise ValueError(f"Tham số không hợp lệ: {key}")
+        if key == 'rain_link':
+            if value not in ('identity', 'logistic'):
+                raise ValueError(f"rain_link không hợp lệ: {value}")
+            params[key] = value
+        elif key == 'weather_thresholds':
+            params[key] = _check_thresholds(value)
+        else:
+            params[key] = _merge_group(key, params[key], value)
+    return params
+
+
+def dew_point(temp, hum):
+    """Điểm sương (°C); NaN nếu thiếu nhiệt độ/độ ẩm"""
+    a, b = 17.27, 237.7
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = (a * temp) / (b + temp) + np.log(hum / 100.0)
+        return (b * alpha) / (a - alpha)
+
+
+def absolute_humidity(temp, hum):
+    """Ẩm tuyệt đối (g/m³)"""
+    mw, r = 18.016, 8.3144
+    pws = 6.116441 * 10 ** ((7.591386 * temp) / (temp + 240.7263))
+    return ((hum / 100.0) * pws * 100 * mw) / (r * (temp + 273.15))
+
+
+def rain_probability(ah, temp_dew_diff, soil, pressure, pressure_trend, coeffs, link='identity'):
+    """Xác suất mưa 0-1; NaN nếu thiếu ah/chênh lệch điểm sương/đất/áp suất"""
+    with np.errstate(invalid='ignore'):
+        prob = (coeffs['intercept']
+                + coeffs['ah'] * ah
+                + coeffs['temp_dew_reciprocal'] / np.where(temp_dew_diff > 0.1, temp_dew_diff, 0.1)
+                + coeffs['soil'] * soil
+                + coeffs['pressure'] * (1013 - pressure)
+                # min(0, trend) của Python: NaN được coi như 0
+                + coeffs['pressure_trend'] * np.where(pressure_trend < 0, pressure_trend, 0.0))
+    if link == 'logistic':
+        prob = 1.0 / (1.0 + np.exp(-np.clip(prob, -50.0, 50.0)))
+    prob = np.clip(prob, 0.0, 1.0)
+    missing = np.isnan(ah) | np.isnan(temp_dew_diff) | np.isnan(soil) | np.isnan(pressure)
+    prob[missing] = np.nan
+    return prob
+
+
+def comfort_index(ah, temp_dew_diff, pressure, thresholds, pressure_thresholds):
+    """Chỉ số thoải mái 0-100 (số nguyên)"""
+    comfort = np.full(ah.shape, 50.0)
+    chosen = np.zeros(ah.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        # Ngưỡng đầu tiên thỏa mãn được chọn, như vòng for ... break trên thiết bị
+        for threshold in thresholds:
+            match = ~chosen & (ah >= threshold['ah_min']) & (temp_dew_diff <= threshold['temp_dew_max'])
+            if threshold['ah_min'] == 17:
+                value = 10 + np.minimum(20, temp_dew_diff * 10)
+            elif threshold['ah_min'] == 15:
+                value = 30 + np.minimum(30, (temp_dew_diff + 2) * 10)
+            elif threshold['ah_min'] == 12:
+                value = 60 + np.minimum(30, temp_dew_diff * 6)
+            else:
+                value = 90 - np.minimum(20, ah)
+            comfort = np.where(match, value, comfort)
+            chosen |= match
+        comfort = comfort - 15 * (pressure < pressure_thresholds['low'])
+        comfort = comfort + 5 * (~(pressure < pressure_thresholds['low'])
+                                 & (pressure > pressure_thresholds['high']))
+    # round() của Python và np.rint đều làm tròn nửa về số chẵn
+    return np.clip(np.rint(comfort), 0, 100).astype(np.int64)
+
+
+def weather_description(rain_prob, thresholds):
+    """Mô tả theo ngưỡng xác suất mưa cao nhất đạt được"""
+    result = np.full(rain_prob.shape, DEFAULT_DESCRIPTION, dtype=object)
+    decided = np.zeros(rain_prob.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        for threshold in sorted(thresholds, key=lambda t: t['rain_prob'], reverse=True):
+            match = ~decided & (rain_prob >= threshold['rain_prob'])
+            result[match] = threshold['description']
+            decided |= match
+    result[np.isnan(rain_prob)] = UNKNOWN_DESCRIPTION
+    return result
+
+
+def derive(temperature, humidity, pressure, soil_moisture, pressure_trend, params=None):
+    """Tính các cột dẫn xuất cho các mảng đầu vào, trả về dict theo DERIVED_COLUMNS"""
+    params = params or DEFAULT_PARAMS
+    dew = dew_point(temperature, humidity)
+    temp_dew_diff = temperature - dew
+    ah = absolute_humidity(temperature, humidity)
+    rain = rain_probability(ah, temp_dew_diff, soil_moisture, pressure, pressure_trend,
+                            params['regression_coeffs'], params['rain_link'])
+    return {
+        'dew_point': dew,
+        'absolute_humidity': ah,
+        'rain_probability': rain,
+        'comfort_index': comfort_index(ah, temp_dew_diff, pressure, params['weather_thresholds'],
+                                       params['pressure_thresholds']),
+        'weather_description': weather_description(rain, params['weather_thresholds']),
+    }
+
+
+def column_values(rows, index):
+    """Cột số từ các dòng SQLite; NULL -> NaN"""
+    return np.array([np.nan if r[index] is None else r[index] for r in rows], dtype=np.float64)
+
+
+def _sql_values(values):
+    """Đổi NaN về NULL như khi thiết bị gửi giá trị không đo được"""
+    if values.dtype == object:
+        return values.tolist()
+    out = values.tolist()
+    if values.dtype.kind == 'f':
+        return [None if v != v else v for v in out]
+    return out
+
+
+def reanalyze(params=None, device_id=None, start=None, end=None,
+              chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, progress=None):
+    """Tính lại DERIVED_COLUMNS cho các bản ghi (lọc theo thiết bị/khoảng thời gian).
+
+    Đọc và ghi theo khối chunk_size dòng (mỗi khối một giao dịch), rồi tính lại
+    các khung của bảng tổng hợp bị ảnh hưởng. progress(rows_done) được gọi sau mỗi khối.
+    Bỏ qua dòng không có áp suất (dòng của collector.py, nút do_an.py không đo áp
+    suất): công thức cần áp suất, tính lại sẽ xóa dự báo nút đã lưu.
+    Trả về (số dòng, số giây).
+    """
+    params = merge_params(params)
+    started = time.perf_counter()
+    done = 0
+    for rows in storage.iter_weather_chunks(INPUT_COLUMNS, chunk_size, device_id, start, end,
+                                             require=('pressure',)):
+        ids = [r[0] for r in rows]
+        derived = derive(*(column_values(rows, 1 + i) for i in range(len(INPUT_COLUMNS))), params=params)
+        if not dry_run:
+            storage.update_columns(DERIVED_COLUMNS, ids,
+                                   [_sql_values(derived[c]) for c in DERIVED_COLUMNS])
+        done += len(rows)
+        if progress is not None:
+            progress(done)
+    if done and not dry_run:
+        # Chỉ các khung của thiết bị/khoảng thời gian vừa tính lại
+        storage.rebuild_rollups(device_id, start, end)
+        storage.rebuild_latest()
+    return done, time.perf_counter() - started
+
+
+class ReanalysisJob:
+    """Chạy reanalyze() trong luồng nền, mỗi lúc chỉ một lần (dùng cho endpoint).
+
+    Trạng thái lưu trong bảng job_status nên mọi tiến trình worker cùng thấy
+    một lần chạy, và hai worker không thể chạy song song.
+    """
+
+    def __init__(self, on_done=None, name='reanalysis'):
+        self.on_done = on_done      # Gọi sau khi chạy xong (vd: nạp lại bộ nhớ đệm)
+        self.name = name
+        self._lock = threading.Lock()
+        self._thread = None
+        self._started_at = None
+
+    @property
+    def status(self):
+        status = storage.fetch_job_status(self.name)
+        if status is None:
+            return {'state': 'idle'}
+        if status.get('state') == 'running' and not storage.pid_alive(status['pid']):
+            return {'state': 'failed', 'error': 'Worker stopped while running',
+                    'rows': status.get('rows', 0)}
+        return status
+
+    def start(self, **kwargs):
+        """Bắt đầu chạy; False nếu đang có lần chạy khác"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            merge_params(kwargs.get('params'))     # Báo lỗi tham số ngay trong request
+            self._started_at = time.time()
+            if not storage.claim_job(self.name, self._running(0)):
+                return False
+            self._thread = threading.Thread(target=self._run, kwargs=kwargs,
+                                            name='reanalysis', daemon=True)
+            self._thread.start()
+            return True
+
+    def _running(self, rows):
+        return {'state': 'running', 'rows': rows, 'started_at': self._started_at, 'pid': os.getpid()}
+
+    def _progress(self, rows):
+        storage.save_job_status(self.name, self._running(rows))
+
+    def _run(self, **kwargs):
+        try:
+            rows, seconds = reanalyze(progress=self._progress, **kwargs)
+            storage.save_job_status(self.name, {
+                'state': 'done', 'rows': rows, 'seconds': round(seconds, 3),
+                'rows_per_sec': round(rows / seconds) if seconds else None,
+                'finished_at': time.time()})
+            if self.on_done is not None and not kwargs.get('dry_run'):
+                self.on_done()
+        except Exception as e:
+            print("❌ Lỗi khi tính lại dữ liệu:", str(e))
+            storage.save_job_status(self.name, {'state': 'failed', 'error': str(e),
+                                                'finished_at': time.time()})
@@ -0,0 +1,99 @@
+"""Cửa sổ mẫu dung lượng cố định cho ESP32: lọc IQR và lấy trung bình tại chỗ.
+
+Mảng array được cấp phát một lần; thêm mẫu, tìm tứ phân vị (quickselect tại
+chỗ) và tính trung bình sau lọc đều không tạo list mới, nên sample_count có
+thể lên hàng trăm mà không làm phân mảnh heap MicroPython.
+
+Kết quả giống cách lọc cũ (DataProcessor.filter_outliers rồi lấy trung bình):
+q1 là trung vị của nửa đầu các mẫu theo thứ tự đọc, q3 là trung vị của nửa
+sau; giữ các mẫu trong [q1 - 1.5*IQR, q3 + 1.5*IQR]. Quickselect chỉ hoán vị
+bên trong từng nửa nên không ảnh hưởng kết quả.
+"""
+from array import array
+
+IQR_FACTOR = 1.5
+
+
+def _select(a, lo, hi, k):
+    """Sắp xếp một phần a[lo:hi] để a[k] đúng vị trí sau khi sắp xếp (thuật toán Wirth)"""
+    left, right = lo, hi - 1
+    while left < right:
+        pivot = a[(left + right) // 2]
+        i, j = left, right
+        while i <= j:
+            while a[i] < pivot:
+                i += 1
+            while a[j] > pivot:
+                j -= 1
+            if i <= j:
+                a[i], a[j] = a[j], a[i]
+                i += 1
+                j -= 1
+        if k <= j:
+            right = j
+        elif k >= i:
+            left = i
+        else:
+            break
+    return a[k]
+
+
+def _median(a, lo, hi):
+    """Trung vị của a[lo:hi] (hoán vị đoạn này tại chỗ)"""
+    n = hi - lo
+    mid = lo + n // 2
+    upper = _select(a, lo, hi, mid)
+    if n % 2:
+        return upper
+    # Sau _select, a[lo:mid] đều <= a[mid]; phần tử lớn nhất trong đó là trung vị dưới
+    lower = a[lo]
+    for i in range(lo + 1, mid):
+        if a[i] > lower:
+            lower = a[i]
+    return (lower + upper) / 2
+
+
+class SampleWindow:
+    """Tối đa capacity mẫu số thực; bỏ qua NaN"""
+
+    def __init__(self, capacity, typecode='d'):
+        self.capacity = capacity
+        self.values = array(typecode, (0 for _ in range(capacity)))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        self.count = 0
+
+    def add(self, value):
+        """Thêm một mẫu; False nếu là NaN hoặc cửa sổ đã đầy"""
+        if value != value or self.count >= self.capacity:
+            return False
+        self.values[self.count] = value
+        self.count += 1
+        return True
+
+    def filtered_mean(self):
+        """Trung bình các mẫu sau lọc IQR; None nếu không còn mẫu nào"""
+        n = self.count
+        if n == 0:
+            return None
+        a = self.values
+        lower = upper = None
+        if n >= 4:
+            q1 = _median(a, 0, n // 2)
+            q3 = _median(a, n // 2, n)
+            iqr = q3 - q1
+            lower = q1 - IQR_FACTOR * iqr
+            upper = q3 + IQR_FACTOR * iqr
+
+        total = 0.0
+        kept = 0
+        for i in range(n):
+            v = a[i]
+            if lower is None or lower <= v <= upper:
+                total += v
+                kept += 1
+        return total / kept if kept else None
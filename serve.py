@@ -0,0 +1,116 @@
+"""Chạy backend bằng nhiều tiến trình worker (gunicorn) cho môi trường thật.
+
+Tiến trình chính chạy webserver3.startup() đúng một lần (migration, xóa phân
+vùng quá hạn, nạp lại spool còn sót) rồi mới tạo worker; mỗi worker gọi
+webserver3.create_app(run_startup=False, slot=<số thứ tự>).
+
+Trạng thái dùng chung giữa các worker nằm trong database:
+- bảng latest_readings: bản ghi mới nhất của từng thiết bị, ghi cùng giao dịch
+  với INSERT; mỗi worker theo dõi PRAGMA data_version để cập nhật bộ nhớ đệm
+  /get_current và đẩy SSE cho dashboard đang nối vào nó;
+- bảng job_status: trạng thái /api/reanalyze, chỉ một worker chạy mỗi lúc.
+Mỗi dashboard /stream giữ một luồng gthread, nên số /stream mỗi worker bị giới
+hạn dưới số luồng (--max-streams); vượt giới hạn thì nhận 503.
+Số thứ tự worker được giữ bằng khóa file ('<database>-workers/slot-<n>.lock'),
+worker bị khởi động lại nhận lại số cũ cùng spool '<spool>/worker-<n>' của nó.
+
+Cần gunicorn (pip install gunicorn; không chạy trên Windows). Ví dụ:
+    python serve.py --bind 0.0.0.0:5000 --workers 4 --threads 16
+"""
+import argparse
+import fcntl
+import itertools
+import os
+import sys
+
+import storage
+import webserver3
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = object
+
+# Mỗi worker gthread phục vụ nhiều kết nối (SSE giữ một luồng mỗi dashboard)
+DEFAULT_THREADS = 16
+
+# Khóa file của số thứ tự worker, giữ mở đến khi tiến trình thoát
+_slot_locks = []
+
+
+def claim_slot(directory):
+    """Giành số thứ tự worker nhỏ nhất chưa có tiến trình nào giữ"""
+    os.makedirs(directory, exist_ok=True)
+    for slot in itertools.count():
+        fd = os.open(os.path.join(directory, f'slot-{slot}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        _slot_locks.append(fd)
+        return slot
+
+
+class WeatherServer(BaseApplication):
+    """Ứng dụng gunicorn nhúng: cấu hình lấy từ dòng lệnh, không đọc file cấu hình"""
+
+    def __init__(self, options, max_streams):
+        self.options = options
+        self.max_streams = max_streams
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Chạy trong từng worker sau khi fork (preload_app tắt)
+        slot = claim_slot(storage.db_path() + '-workers')
+        webserver3.broker.max_subscribers = self.max_streams
+        return webserver3.create_app(run_startup=False, slot=slot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bind', default='0.0.0.0:5000')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Số tiến trình worker (mặc định: số CPU)")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help="Số luồng mỗi worker")
+    parser.add_argument('--max-streams', type=int,
+                        help="Số kết nối /stream (SSE) tối đa mỗi worker, phải nhỏ hơn --threads "
+                             "(mặc định: một nửa số luồng)")
+    parser.add_argument('--timeout', type=int, default=30,
+                        help="Giây trước khi worker không phản hồi bị khởi động lại")
+    parser.add_argument('--access-log', action='store_true', help="Ghi log từng request ra stdout")
+    args = parser.parse_args()
+
+    if BaseApplication is object:
+        print("❌ Cần gunicorn: pip install gunicorn (hoặc chạy thử một tiến trình: python webserver3.py)")
+        sys.exit(1)
+
+    # Mặc định một nửa số luồng cho /stream: phần còn lại luôn rảnh cho thiết bị
+    # gửi dữ liệu và /get_current
+    max_streams = args.threads // 2 if args.max_streams is None else args.max_streams
+    if not 0 <= max_streams < args.threads:
+        # Mỗi dashboard SSE giữ một luồng: đủ dashboard sẽ chiếm hết worker
+        parser.error("--max-streams phải nhỏ hơn --threads")
+
+    webserver3.startup()
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'preload_app': False,
+    }
+    if args.access_log:
+        options['accesslog'] = '-'
+    print(f"🚀 {args.workers} worker x {args.threads} luồng (tối đa {max_streams} /stream) tại {args.bind}")
+    WeatherServer(options, max_streams).run()
+
+
+if __name__ == '__main__':
+    main()
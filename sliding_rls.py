@@ -0,0 +1,182 @@
+"""Hồi quy tuyến tính trên cửa sổ trượt, cập nhật tăng dần (RLS) cho ESP32.
+
+Thay vì dựng lại X^T X từ toàn bộ cửa sổ rồi nghịch đảo mỗi lần đo (O(n·k²+k³)),
+SlidingRLS giữ P = (X^T X + delta·I)^-1 và X^T y, cập nhật hạng 1 theo công thức
+Sherman-Morrison khi thêm mẫu mới và khi bỏ mẫu cũ nhất ra khỏi cửa sổ:
+mỗi lần đo chỉ tốn O(k²), không phụ thuộc kích thước cửa sổ.
+
+- delta nhỏ giữ P xác định cả khi cửa sổ suy biến (vd: độ ẩm đất không đổi),
+  nên không bao giờ báo lỗi; khi cửa sổ đủ hạng, hệ số khớp bình phương tối
+  thiểu thông thường trong sai số làm tròn.
+- Sai số tích lũy của các lần cập nhật (nhất là với float 32 bit của
+  MicroPython) được xóa bằng cách tính lại P từ bộ đệm sau mỗi resync_every
+  lần cập nhật, hoặc ngay khi bỏ mẫu làm P mất ổn định.
+
+Mẫu được giữ trong array cấp phát một lần (bộ đệm vòng), không dùng list.pop(0).
+"""
+from array import array
+
+DEFAULT_DELTA = 1e-9
+
+
+def _cholesky_inverse(a, k):
+    """Nghịch đảo ma trận đối xứng xác định dương a (k×k, mảng phẳng) qua Cholesky.
+
+    Trả về array mới, hoặc None nếu a không xác định dương.
+    """
+    L = [0.0] * (k * k)
+    for i in range(k):
+        for j in range(i + 1):
+            s = a[i * k + j]
+            for m in range(j):
+                s -= L[i * k + m] * L[j * k + m]
+            if i == j:
+                if s <= 0.0:
+                    return None
+                L[i * k + i] = s ** 0.5
+            else:
+                L[i * k + j] = s / L[j * k + j]
+    # Giải L·L^T·X = I theo từng cột
+    inv = [0.0] * (k * k)
+    for col in range(k):
+        z = [0.0] * k
+        for i in range(k):
+            s = 1.0 if i == col else 0.0
+            for m in range(i):
+                s -= L[i * k + m] * z[m]
+            z[i] = s / L[i * k + i]
+        for i in range(k - 1, -1, -1):
+            s = z[i]
+            for m in range(i + 1, k):
+                s -= L[m * k + i] * inv[m * k + col]
+            inv[i * k + col] = s / L[i * k + i]
+    return inv
+
+
+class SlidingRLS:
+    """Hồi quy y ≈ x·beta trên capacity mẫu gần nhất, x có k thành phần"""
+
+    def __init__(self, k, capacity, delta=DEFAULT_DELTA, resync_every=None, typecode='d'):
+        self.k = k
+        self.capacity = capacity
+        self.initial_delta = delta     # delta cấu hình; self.delta là giá trị P đang dùng
+        self.delta = delta
+        self.resync_every = resync_every or capacity
+        self.xs = array(typecode, (0 for _ in range(k * capacity)))
+        self.ys = array(typecode, (0 for _ in range(capacity)))
+        self.P = array(typecode, (0 for _ in range(k * k)))
+        self.xty = array(typecode, (0 for _ in range(k)))
+        self._u = array(typecode, (0 for _ in range(k)))
+        self.resyncs = 0
+        self.reset()
+
+    def __len__(self):
+        return self.count
+
+    def reset(self):
+        """Xóa mọi mẫu"""
+        k = self.k
+        self.head = 0          # Vị trí mẫu cũ nhất trong bộ đệm vòng
+        self.count = 0
+        self.updates = 0       # Số lần cập nhật kể từ lần tính lại P gần nhất
+        self.delta = self.initial_delta
+        for i in range(k * k):
+            self.P[i] = (1.0 / self.delta) if i % (k + 1) == 0 else 0.0
+        for i in range(k):
+            self.xty[i] = 0.0
+
+    def _rank_one(self, x, base, sign):
+        """P <- (P^-1 + sign·x·x^T)^-1 với x = x[base:base+k].
+
+        False nếu phép bỏ mẫu làm P mất ổn định.
+        """
+        k, P, u = self.k, self.P, self._u
+        s = 0.0
+        for i in range(k):
+            acc = 0.0
+            for j in range(k):
+                acc += P[i * k + j] * x[base + j]
+            u[i] = acc
+            s += x[base + i] * acc
+        denom = 1.0 + sign * s
+        if denom <= 1e-9:
+            return False
+        scale = sign / denom
+        for i in range(k):
+            ui = u[i] * scale
+            for j in range(k):
+                P[i * k + j] -= ui * u[j]
+        return True
+
+    def add(self, x, y):
+        """Thêm mẫu (x, y); nếu cửa sổ đầy, bỏ mẫu cũ nhất"""
+        k = self.k
+        stable = True
+        if self.count == self.capacity:
+            base = self.head * k
+            old_y = self.ys[self.head]
+            stable = self._rank_one(self.xs, base, -1.0)
+            for i in range(k):
+                self.xty[i] -= old_y * self.xs[base + i]
+            slot = self.head
+            self.head = (self.head + 1) % self.capacity
+        else:
+            slot = (self.head + self.count) % self.capacity
+            self.count += 1
+
+        base = slot * k
+        for i in range(k):
+            self.xs[base + i] = x[i]
+            self.xty[i] += y * x[i]
+        self.ys[slot] = y
+        # Vài mẫu đầu tính thẳng từ bộ đệm (rẻ): tránh cập nhật từ P ban đầu = I/delta rất lớn
+        warmup = self.count <= 2 * k
+        if stable and not warmup:
+            stable = self._rank_one(self.xs, base, 1.0)
+
+        self.updates += 1
+        if warmup or not stable or self.updates >= self.resync_every:
+            self.resync()
+
+    def resync(self):
+        """Tính lại X^T y và P từ các mẫu trong bộ đệm.
+
+        Luôn bắt đầu từ delta cấu hình; delta chỉ được tăng tạm thời cho tới khi
+        X^T X + delta·I xác định dương, nên không bị kẹt ở giá trị lớn mãi.
+        """
+        k, xs, ys = self.k, self.xs, self.ys
+        gram = [0.0] * (k * k)
+        for i in range(k):
+            self.xty[i] = 0.0
+        for n in range(self.count):
+            slot = (self.head + n) % self.capacity
+            base = slot * k
+            y = ys[slot]
+            for i in range(k):
+                xi = xs[base + i]
+                self.xty[i] += y * xi
+                for j in range(i + 1):
+                    gram[i * k + j] += xi * xs[base + j]
+        for i in range(k):
+            for j in range(i):
+                gram[j * k + i] = gram[i * k + j]
+        delta = self.initial_delta
+        while True:
+            a = gram[:]
+            for i in range(k):
+                a[i * k + i] += delta
+            inv = _cholesky_inverse(a, k)
+            if inv is not None:
+                break
+            # Làm tròn khiến ma trận không còn xác định dương: tăng delta
+            delta = delta * 10 or DEFAULT_DELTA
+        self.delta = delta
+        for i in range(k * k):
+            self.P[i] = inv[i]
+        self.updates = 0
+        self.resyncs += 1
+
+    def coefficients(self):
+        """beta = P·X^T y (list k phần tử)"""
+        k, P, xty = self.k, self.P, self.xty
+        return [sum(P[i * k + j] * xty[j] for j in range(k)) for i in range(k)]
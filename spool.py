@@ -0,0 +1,261 @@
+"""Spool ghi trước (write-ahead) cho chế độ ghi bất đồng bộ.
+
+Mỗi bản ghi được nối vào file spool trước khi server trả 202, nên nếu tiến
+trình chết khi bản ghi còn trong hàng đợi bộ nhớ thì lúc khởi động lại vẫn
+nạp lại được vào bảng weather.
+
+Định dạng: thư mục chứa các segment 'segment-<seq đầu>.log'. Mỗi segment bắt
+đầu bằng MAGIC, sau đó là các record:
+
+    <độ dài payload: uint32> <crc32(seq + payload): uint32> <seq: uint64> <payload>
+
+payload là JSON của một dòng bản ghi. seq tăng dần; số seq đã được ghi vào
+database nằm trong bảng spool_state (cập nhật cùng giao dịch với INSERT),
+nên phát lại không bao giờ ghi trùng. Record cuối bị ghi dở (độ dài/CRC sai)
+được cắt bỏ khi mở lại.
+
+fsync được gom nhóm: nhiều request cùng chờ một lần fsync (group commit).
+"""
+import json
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b'WSPOOL01'
+RECORD_HEADER = struct.Struct('<IIQ')
+
+# Mở segment mới khi segment hiện tại vượt quá kích thước này
+SEGMENT_BYTES = 4 * 1024 * 1024
+
+# Chỉ chấp nhận payload nhỏ hơn giới hạn này khi đọc lại (chống đọc rác)
+MAX_RECORD_BYTES = 1024 * 1024
+
+
+def _segment_name(first_seq):
+    return f'segment-{first_seq:016d}.log'
+
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def read_segment(path):
+    """Đọc các record hợp lệ của một segment.
+
+    Trả về (danh sách (seq, payload), vị trí kết thúc record hợp lệ cuối cùng).
+    """
+    records = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        return records, 0
+    offset = len(MAGIC)
+    while offset + RECORD_HEADER.size <= len(data):
+        length, crc, seq = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        end = start + length
+        if length > MAX_RECORD_BYTES or end > len(data):
+            break
+        payload = data[start:end]
+        if zlib.crc32(struct.pack('<Q', seq) + payload) != crc:
+            break
+        records.append((seq, payload))
+        offset = end
+    return records, offset
+
+
+class Spool:
+    """Spool nối thêm theo segment, an toàn khi nhiều luồng cùng ghi"""
+
+    def __init__(self, directory, fsync=True, segment_bytes=SEGMENT_BYTES):
+        self.directory = directory
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._syncing = False
+        self._file = None
+        self._size = 0
+        self._segments = []          # [(seq đầu, seq cuối, đường dẫn)] theo thứ tự
+        self.last_seq = 0
+        self.synced_seq = 0
+        self.applied_seq = 0
+        self._failed_seq = 0         # Các record tới seq này fsync thất bại
+        self._sync_error = None
+        self._scan()
+
+    # --- Khởi động / phát lại ---
+
+    def _segment_paths(self):
+        names = sorted(n for n in os.listdir(self.directory)
+                       if n.startswith('segment-') and n.endswith('.log'))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def _scan(self):
+        """Tìm seq lớn nhất và cắt bỏ phần ghi dở ở cuối segment cuối cùng"""
+        paths = self._segment_paths()
+        for index, path in enumerate(paths):
+            records, valid_end = read_segment(path)
+            if valid_end < os.path.getsize(path):
+                if index == len(paths) - 1:
+                    print(f"⚠️ Spool: cắt bỏ record ghi dở ở cuối {os.path.basename(path)}")
+                    with open(path, 'r+b') as f:
+                        f.truncate(valid_end)
+                        if valid_end == 0:
+                            f.write(MAGIC)
+                else:
+                    print(f"⚠️ Spool: segment {os.path.basename(path)} bị hỏng sau vị trí {valid_end}")
+            first = int(os.path.basename(path)[8:24])
+            last = records[-1][0] if records else first - 1
+            self._segments.append((first, last, path))
+            self.last_seq = max(self.last_seq, last)
+        self.synced_seq = self.last_seq
+
+    def pending(self, applied_seq):
+        """Duyệt (seq, dòng) của các record có seq > applied_seq, theo thứ tự"""
+        for first, last, path in list(self._segments):
+            if last <= applied_seq:
+                continue
+            records, _ = read_segment(path)
+            for seq, payload in records:
+                if seq > applied_seq:
+                    yield seq, tuple(json.loads(payload))
+
+    def replay(self, applied_seq, apply_batch, batch_size=1000):
+        """Nạp lại các record chưa ghi vào database.
+
+        apply_batch(items) nhận danh sách (seq, dòng) và phải ghi chúng cùng
+        với seq lớn nhất trong một giao dịch. Trả về số record đã phát lại.
+        """
+        self.last_seq = max(self.last_seq, applied_seq)
+        self.synced_seq = self.last_seq
+        count = 0
+        batch = []
+        for item in self.pending(applied_seq):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                apply_batch(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            apply_batch(batch)
+            count += len(batch)
+        self.mark_applied(self.last_seq)
+        return count
+
+    # --- Ghi ---
+
+    def _open_segment(self, first_seq):
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._file.close()
+        path = os.path.join(self.directory, _segment_name(first_seq))
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        self._segments.append((first_seq, first_seq - 1, path))
+        if self.fsync:
+            _fsync_dir(self.directory)
+
+    def append(self, rows):
+        """Nối các dòng vào spool, trả về danh sách seq tương ứng (chưa chắc đã fsync)"""
+        with self._lock:
+            if self._file is None or self._size >= self.segment_bytes:
+                # Không đóng segment khi một luồng khác đang fsync nó
+                while self._syncing:
+                    self._synced.wait()
+                self._open_segment(self.last_seq + 1)
+            seqs = []
+            chunks = []
+            for seq, row in enumerate(rows, self.last_seq + 1):
+                payload = json.dumps(row, ensure_ascii=False).encode('utf-8')
+                crc = zlib.crc32(struct.pack('<Q', seq) + payload)
+                chunks.append(RECORD_HEADER.pack(len(payload), crc, seq))
+                chunks.append(payload)
+                seqs.append(seq)
+            data = b''.join(chunks)
+            # Chỉ tăng last_seq khi đã ghi xong (write lỗi thì không có seq nào được cấp)
+            self._file.write(data)
+            self._size += len(data)
+            if seqs:
+                self.last_seq = seqs[-1]
+            first, _, path = self._segments[-1]
+            self._segments[-1] = (first, self.last_seq, path)
+            return seqs
+
+    def wait_durable(self, seq):
+        """Chờ tới khi record seq đã nằm trên đĩa.
+
+        Luồng đầu tiên tới sẽ fsync cho mọi record đã nối tới lúc đó; các luồng
+        khác chỉ chờ kết quả (group commit). Nếu flush/fsync lỗi, mọi luồng chờ
+        record thuộc lần fsync đó đều nhận OSError (không biết record nào đã
+        lên đĩa); record nối sau đó sẽ fsync lại.
+        """
+        with self._lock:
+            while True:
+                if seq <= self._failed_seq:
+                    raise OSError(f"Spool fsync thất bại: {self._sync_error}") from self._sync_error
+                if self.synced_seq >= seq:
+                    return
+                if self._syncing:
+                    self._synced.wait()
+                    continue
+                self._syncing = True
+                target = self.last_seq
+                f = self._file
+                error = None
+                self._lock.release()
+                try:
+                    f.flush()
+                    if self.fsync:
+                        os.fsync(f.fileno())
+                except Exception as e:
+                    error = e
+                finally:
+                    self._lock.acquire()
+                    self._syncing = False
+                    self._synced.notify_all()
+                if error is not None:
+                    self._failed_seq = max(self._failed_seq, target)
+                    self._sync_error = error
+                else:
+                    self.synced_seq = max(self.synced_seq, target)
+
+    def mark_applied(self, seq):
+        """Ghi nhận các record tới seq đã vào database; xóa segment không còn cần"""
+        with self._lock:
+            self.applied_seq = max(self.applied_seq, seq)
+            keep = []
+            for first, last, path in self._segments:
+                is_active = self._file is not None and path == self._file.name
+                if last <= self.applied_seq and not is_active:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                else:
+                    keep.append((first, last, path))
+            self._segments = keep
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -0,0 +1,1200 @@
+"""Lớp lưu trữ SQLite dùng chung cho backend Flask.
+
+Mọi route đọc/ghi database đi qua module này thay vì tự gọi sqlite3.connect().
+Kết nối được giữ trong một pool có giới hạn, bật WAL để thiết bị ghi không
+chặn dashboard đọc, và dùng lại các câu lệnh đã biên dịch (statement cache
+của sqlite3) giữa các request.
+
+Bảng weather được chia theo tháng (weather_pYYYYMM) sau một VIEW cùng tên;
+WEATHER_RETENTION_DAYS đặt số ngày giữ dữ liệu thô, dữ liệu cũ hơn chỉ còn
+trong bảng tổng hợp theo giờ/ngày (xem apply_retention()). Bảng latest_readings
+giữ bản ghi mới nhất của từng thiết bị để nhiều tiến trình worker dùng chung.
+
+Đường dẫn database lấy từ biến môi trường WEATHER_DB hoặc gọi configure().
+"""
+import calendar
+import heapq
+import itertools
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_DB_PATH = 'weather_data.db'
+
+# Kích thước pool mặc định (số kết nối tối đa mở đồng thời)
+DEFAULT_POOL_SIZE = 8
+
+# Các PRAGMA áp dụng cho mọi kết nối mới
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # Đọc và ghi đồng thời
+    "PRAGMA synchronous=NORMAL",      # Đủ an toàn với WAL, bớt fsync mỗi commit
+    "PRAGMA cache_size=-16000",       # ~16 MB page cache cho mỗi kết nối
+    "PRAGMA mmap_size=268435456",     # Đọc qua mmap tối đa 256 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",       # Chờ khóa thay vì báo "database is locked"
+)
+
+# Số câu lệnh đã biên dịch được giữ lại trên mỗi kết nối
+STATEMENT_CACHE_SIZE = 256
+
+SCHEMA_SQL = '''CREATE TABLE IF NOT EXISTS weather
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 device_id TEXT,
+                 temperature REAL,
+                 humidity REAL,
+                 pressure REAL,
+                 soil_moisture INTEGER,
+                 pressure_trend REAL,
+                 absolute_humidity REAL,
+                 dew_point REAL,
+                 rain_probability REAL,
+                 comfort_index INTEGER,
+                 weather_description TEXT,
+                 timestamp INTEGER,
+                 created_at TEXT)'''
+
+# Các cột số được tổng hợp sẵn theo giờ/ngày, kèm vị trí trong bộ giá trị INSERT
+ROLLUP_METRICS = {
+    'temperature': 1,
+    'humidity': 2,
+    'pressure': 3,
+    'soil_moisture': 4,
+    'pressure_trend': 5,
+    'absolute_humidity': 6,
+    'dew_point': 7,
+    'rain_probability': 8,
+    'comfort_index': 9,
+}
+ROW_DEVICE = 0
+ROW_TIMESTAMP = 11
+
+# Bảng tổng hợp: tên bảng -> độ dài khung (giây)
+ROLLUP_TABLES = {
+    'weather_rollup_hourly': 3600,
+    'weather_rollup_daily': 86400,
+}
+
+# Độ dài mỗi đoạn (một giao dịch) khi tính lại bảng tổng hợp, bội số của một ngày
+REBUILD_CHUNK_SECONDS = 7 * 86400
+
+ROLLUP_SCHEMA_SQL = '''CREATE TABLE IF NOT EXISTS {table}
+                       (metric TEXT NOT NULL,
+                        device_id TEXT NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        min REAL,
+                        max REAL,
+                        sum REAL,
+                        sum_sq REAL,
+                        PRIMARY KEY (metric, device_id, bucket)) WITHOUT ROWID'''
+
+ROLLUP_UPSERT_SQL = '''INSERT INTO {table}
+                        (metric, device_id, bucket, count, min, max, sum, sum_sq)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (metric, device_id, bucket) DO UPDATE SET
+                            count = count + excluded.count,
+                            min = MIN(min, excluded.min),
+                            max = MAX(max, excluded.max),
+                            sum = sum + excluded.sum,
+                            sum_sq = sum_sq + excluded.sum_sq'''
+
+
+def rollup_rebuild_statements():
+    """Các câu lệnh tính lại toàn bộ bảng tổng hợp từ bảng weather (schema v3-5).
+
+    Từ v6 dùng rebuild_rollups: tính lại theo từng phân vùng, từng đoạn ngắn.
+    """
+    hourly, daily = 'weather_rollup_hourly', 'weather_rollup_daily'
+    statements = [f"DELETE FROM {hourly}"]
+    for metric in ROLLUP_METRICS:
+        statements.append(f'''
+            INSERT INTO {hourly}
+                (metric, device_id, bucket, count, min, max, sum, sum_sq)
+            SELECT '{metric}', COALESCE(device_id, ''),
+                   CAST(timestamp / 3600 AS INTEGER) * 3600 AS b,
+                   COUNT({metric}), MIN({metric}), MAX({metric}),
+                   SUM({metric}), SUM({metric} * {metric})
+            FROM weather
+            WHERE {metric} IS NOT NULL AND timestamp IS NOT NULL
+            GROUP BY COALESCE(device_id, ''), b''')
+    # Bảng theo ngày gộp lại từ bảng theo giờ
+    statements.append(f"DELETE FROM {daily}")
+    statements.append(f'''
+        INSERT INTO {daily}
+            (metric, device_id, bucket, count, min, max, sum, sum_sq)
+        SELECT metric, device_id, bucket / 86400 * 86400 AS b,
+               SUM(count), MIN(min), MAX(max), SUM(sum), SUM(sum_sq)
+        FROM {hourly}
+        GROUP BY metric, device_id, b''')
+    return statements
+
+
+def rebuild_rollup_range(conn, source, start, end, device_id=None):
+    """Tính lại các khung giờ và khung ngày trong [start, end) từ bảng source
+    (trong giao dịch của conn), chỉ của device_id nếu có.
+
+    start/end phải là bội số của một ngày (UTC) để khung ngày gộp đủ 24 khung giờ.
+    """
+    hourly, daily = 'weather_rollup_hourly', 'weather_rollup_daily'
+    params = {'start': start, 'end': end, 'device': device_id}
+    scope = "bucket >= :start AND bucket < :end"
+    where = "timestamp >= :start AND timestamp < :end"
+    if device_id is not None:
+        scope += " AND device_id = :device"
+        where += " AND device_id = :device"
+    conn.execute(f"DELETE FROM {hourly} WHERE {scope}", params)
+    for metric in ROLLUP_METRICS:
+        conn.execute(f'''
+            INSERT INTO {hourly}
+                (metric, device_id, bucket, count, min, max, sum, sum_sq)
+            SELECT '{metric}', COALESCE(device_id, ''),
+                   CAST(timestamp / 3600 AS INTEGER) * 3600 AS b,
+                   COUNT({metric}), MIN({metric}), MAX({metric}),
+                   SUM({metric}), SUM({metric} * {metric})
+            FROM {source}
+            WHERE {metric} IS NOT NULL AND {where}
+            GROUP BY COALESCE(device_id, ''), b''', params)
+    conn.execute(f"DELETE FROM {daily} WHERE {scope}", params)
+    conn.execute(f'''
+        INSERT INTO {daily}
+            (metric, device_id, bucket, count, min, max, sum, sum_sq)
+        SELECT metric, device_id, bucket / 86400 * 86400 AS b,
+               SUM(count), MIN(min), MAX(max), SUM(sum), SUM(sum_sq)
+        FROM {hourly}
+        WHERE {scope}
+        GROUP BY metric, device_id, b''', params)
+
+
+# Phân vùng theo tháng (UTC): mỗi tháng một bảng weather_pYYYYMM cùng cấu trúc,
+# còn weather là VIEW gộp (UNION ALL) mọi phân vùng nên các truy vấn đọc không
+# đổi; SQLite đẩy điều kiện WHERE vào từng phân vùng và trộn kết quả đã sắp xếp.
+# Ghi/cập nhật đi thẳng vào phân vùng. id của phân vùng tháng k (năm*12 + tháng-1)
+# bắt đầu từ k << PARTITION_ID_SHIFT, nên id vẫn duy nhất và tăng theo tháng, và
+# suy ra được phân vùng từ id. Cột mới phải thêm vào PARTITION_COLUMNS và ALTER
+# mọi phân vùng đang có.
+PARTITION_PREFIX = 'weather_p'
+PARTITION_ID_SHIFT = 32
+
+PARTITION_COLUMNS = ('id', 'device_id', 'temperature', 'humidity', 'pressure', 'soil_moisture',
+                     'pressure_trend', 'absolute_humidity', 'dew_point', 'rain_probability',
+                     'comfort_index', 'weather_description', 'timestamp', 'created_at',
+                     'rain_observed', 'rain_predicted')
+
+PARTITION_SCHEMA_SQL = [
+    '''CREATE TABLE IF NOT EXISTS {table}
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id TEXT,
+        temperature REAL,
+        humidity REAL,
+        pressure REAL,
+        soil_moisture INTEGER,
+        pressure_trend REAL,
+        absolute_humidity REAL,
+        dew_point REAL,
+        rain_probability REAL,
+        comfort_index INTEGER,
+        weather_description TEXT,
+        timestamp INTEGER,
+        created_at TEXT,
+        rain_observed INTEGER,
+        rain_predicted INTEGER)''',
+    "CREATE INDEX IF NOT EXISTS idx_{table}_timestamp ON {table} (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_device_ts ON {table} (device_id, timestamp)",
+]
+
+# Số ngày giữ dữ liệu thô (None: giữ mãi). Dữ liệu cũ hơn chỉ còn trong bảng tổng hợp.
+DEFAULT_RETENTION_DAYS = None
+
+
+# Khoảng timestamp lưu được (giây, UTC): năm 1970-9999, để tên phân vùng luôn
+# có đúng 6 chữ số YYYYMM như PARTITION_GLOB. Timestamp mili giây bị loại.
+MIN_TIMESTAMP = 0
+MAX_TIMESTAMP = calendar.timegm((9999, 12, 31, 23, 59, 59)) + 1
+
+PARTITION_GLOB = PARTITION_PREFIX + '[0-9]' * 6
+
+
+def valid_timestamp(timestamp):
+    """timestamp (giây) nằm trong [MIN_TIMESTAMP, MAX_TIMESTAMP) không (NaN/inf: không)"""
+    return MIN_TIMESTAMP <= timestamp < MAX_TIMESTAMP
+
+
+def partition_key(timestamp):
+    """Số thứ tự tháng (năm*12 + tháng-1, UTC) chứa timestamp; ValueError nếu ngoài khoảng"""
+    if not valid_timestamp(timestamp):
+        raise ValueError(f"Timestamp ngoài khoảng hợp lệ: {timestamp}")
+    t = time.gmtime(timestamp)
+    return t.tm_year * 12 + t.tm_mon - 1
+
+
+def partition_name(key):
+    return f"{PARTITION_PREFIX}{key // 12:04d}{key % 12 + 1:02d}"
+
+
+def partition_range(key):
+    """[start, end) của phân vùng theo giây"""
+    start = calendar.timegm((key // 12, key % 12 + 1, 1, 0, 0, 0))
+    end = calendar.timegm(((key + 1) // 12, (key + 1) % 12 + 1, 1, 0, 0, 0))
+    return start, end
+
+
+def list_partitions(conn):
+    """Các phân vùng đang có (số thứ tự tháng), theo thứ tự thời gian"""
+    names = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+                         (PARTITION_GLOB,)).fetchall()
+    return sorted(int(name[len(PARTITION_PREFIX):-2]) * 12 + int(name[-2:]) - 1 for name, in names)
+
+
+def rebuild_view(conn, keys=None):
+    """Tạo lại VIEW weather gộp các phân vùng"""
+    keys = list_partitions(conn) if keys is None else keys
+    columns = ', '.join(PARTITION_COLUMNS)
+    if keys:
+        body = ' UNION ALL '.join(f"SELECT {columns} FROM {partition_name(k)}" for k in keys)
+    else:
+        body = 'SELECT ' + ', '.join(f"NULL AS {c}" for c in PARTITION_COLUMNS) + ' WHERE 0'
+    conn.execute("DROP VIEW IF EXISTS weather")
+    conn.execute(f"CREATE VIEW weather AS {body}")
+
+
+def create_partition(conn, key):
+    """Tạo bảng phân vùng (chưa cập nhật VIEW), id bắt đầu từ key << PARTITION_ID_SHIFT"""
+    table = partition_name(key)
+    for sql in PARTITION_SCHEMA_SQL:
+        conn.execute(sql.format(table=table))
+    if conn.execute("SELECT 1 FROM sqlite_sequence WHERE name = ?", (table,)).fetchone() is None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)",
+                     (table, key << PARTITION_ID_SHIFT))
+
+
+def partition_legacy_table(conn):
+    """Migration: chia bảng weather đơn (schema v1-5) thành các phân vùng tháng.
+
+    Các bản ghi được chép theo thứ tự id cũ và nhận id mới theo phân vùng;
+    bản ghi không có timestamp (hoặc timestamp ngoài khoảng MIN_TIMESTAMP..MAX_TIMESTAMP,
+    vd: mili giây) vào phân vùng của tháng hiện tại.
+    """
+    month = ("CAST(strftime('%Y', {ts}, 'unixepoch') AS INTEGER) * 12"
+             " + CAST(strftime('%m', {ts}, 'unixepoch') AS INTEGER) - 1")
+    valid = f"timestamp >= {MIN_TIMESTAMP} AND timestamp < {MAX_TIMESTAMP}"
+    now = int(time.time())
+    keys = [k for k, in conn.execute(
+        f"SELECT DISTINCT {month.format(ts=f'CASE WHEN {valid} THEN timestamp ELSE :now END')} FROM weather",
+        {'now': now})]
+    # Cột thêm sau schema v5 (vd: rain_predicted) chưa có trong bảng cũ
+    legacy = {row[1] for row in conn.execute("PRAGMA table_info(weather)")}
+    columns = ', '.join(c for c in PARTITION_COLUMNS[1:] if c in legacy)
+    for key in keys:
+        create_partition(conn, key)
+        start, end = partition_range(key)
+        where = "timestamp >= ? AND timestamp < ?"
+        if key == partition_key(now):
+            where = f"({where} OR timestamp IS NULL OR NOT ({valid}))"
+        conn.execute(f'''INSERT INTO {partition_name(key)} ({columns})
+                         SELECT {columns} FROM weather WHERE {where} ORDER BY id''', (start, end))
+    conn.execute("DROP TABLE weather")
+    rebuild_view(conn, sorted(keys))
+
+
+def add_partition_column(column, sql_type):
+    """Migration: thêm cột vào mọi phân vùng đang có (phân vùng tạo sau khi đổi
+    PARTITION_SCHEMA_SQL đã có sẵn cột) rồi tạo lại VIEW weather"""
+    def migration(conn):
+        for key in list_partitions(conn):
+            table = partition_name(key)
+            if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}")
+        rebuild_view(conn)
+    return migration
+
+
+# Bản ghi mới nhất của từng thiết bị (device_id NULL lưu thành ''), cập nhật
+# cùng giao dịch với INSERT để mọi tiến trình worker đọc chung một nguồn
+LATEST_SCHEMA_SQL = '''CREATE TABLE IF NOT EXISTS latest_readings
+                       (device_id TEXT PRIMARY KEY NOT NULL,
+                        temperature REAL,
+                        humidity REAL,
+                        pressure REAL,
+                        soil_moisture INTEGER,
+                        pressure_trend REAL,
+                        absolute_humidity REAL,
+                        dew_point REAL,
+                        rain_probability REAL,
+                        comfort_index INTEGER,
+                        weather_description TEXT,
+                        timestamp INTEGER NOT NULL,
+                        created_at TEXT) WITHOUT ROWID'''
+
+
+def refresh_latest(conn):
+    """Tính lại bảng latest_readings từ các phân vùng (migration, sau khi sửa cột dẫn xuất).
+
+    Đọc từng phân vùng từ mới đến cũ theo chỉ mục (device_id, timestamp); thiết
+    bị đã có bản ghi ở phân vùng mới hơn thì bỏ qua các phân vùng cũ hơn.
+    """
+    latest = {}
+    for key in reversed(list_partitions(conn)):
+        cursor = conn.execute(f'''
+            SELECT {', '.join('w.' + c for c in ROW_COLUMNS)}
+            FROM (SELECT device_id, MAX(timestamp) AS ts
+                  FROM {partition_name(key)} GROUP BY device_id) AS newest
+            JOIN {partition_name(key)} AS w
+              ON w.device_id IS newest.device_id AND w.timestamp = newest.ts
+            ORDER BY w.id ASC
+        ''')
+        found = {}
+        # Nếu trùng timestamp, giữ bản ghi được ghi sau cùng
+        for row in cursor:
+            found[row[ROW_DEVICE]] = row
+        for device_id, row in found.items():
+            latest.setdefault(device_id, row)
+    conn.execute("DELETE FROM latest_readings")
+    conn.executemany(LATEST_INSERT_SQL, [latest_row(row) for row in latest.values()])
+
+
+# Danh sách migration theo thứ tự: (phiên bản, mô tả, các câu lệnh SQL).
+# Phiên bản hiện tại của database lưu trong PRAGMA user_version.
+MIGRATIONS = [
+    (1, 'create weather table', [SCHEMA_SQL]),
+    (2, 'time-series indexes', [
+        "CREATE INDEX IF NOT EXISTS idx_weather_timestamp ON weather (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_weather_device_ts ON weather (device_id, timestamp)",
+    ]),
+    (3, 'hourly/daily rollup tables', [
+        ROLLUP_SCHEMA_SQL.format(table='weather_rollup_hourly'),
+        ROLLUP_SCHEMA_SQL.format(table='weather_rollup_daily'),
+        "CREATE INDEX IF NOT EXISTS idx_rollup_hourly_bucket ON weather_rollup_hourly (metric, bucket)",
+        "CREATE INDEX IF NOT EXISTS idx_rollup_daily_bucket ON weather_rollup_daily (metric, bucket)",
+    ] + rollup_rebuild_statements()),
+    (4, 'ingest spool checkpoint', [
+        '''CREATE TABLE IF NOT EXISTS spool_state
+           (name TEXT PRIMARY KEY,
+            applied_seq INTEGER NOT NULL)''',
+    ]),
+    (5, 'rain labels and published model coefficients', [
+        "ALTER TABLE weather ADD COLUMN rain_observed INTEGER",
+        '''CREATE TABLE IF NOT EXISTS model_coeffs
+           (version INTEGER PRIMARY KEY AUTOINCREMENT,
+            link TEXT NOT NULL,
+            coeffs TEXT NOT NULL,
+            metrics TEXT,
+            rows INTEGER NOT NULL,
+            created_at TEXT NOT NULL)''',
+    ]),
+    (6, 'monthly partitions behind the weather view', [partition_legacy_table]),
+    (7, 'latest reading per device and background job status', [
+        LATEST_SCHEMA_SQL,
+        '''CREATE TABLE IF NOT EXISTS job_status
+           (name TEXT PRIMARY KEY,
+            status TEXT NOT NULL)''',
+        refresh_latest,
+    ]),
+    (8, 'change sequence for latest readings', [
+        "ALTER TABLE latest_readings ADD COLUMN seq INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_latest_seq ON latest_readings (seq)",
+    ]),
+    (9, 'dead letter for rows the ingest writer could not store', [
+        '''CREATE TABLE IF NOT EXISTS dead_letter
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            row TEXT NOT NULL,
+            error TEXT NOT NULL,
+            created_at TEXT NOT NULL)''',
+    ]),
+    (10, 'rain prediction (0/1) from collector nodes', [add_partition_column('rain_predicted', 'INTEGER')]),
+]
+
+# Thứ tự cột trong bộ giá trị INSERT (một dòng bản ghi)
+ROW_COLUMNS = ('device_id', 'temperature', 'humidity', 'pressure', 'soil_moisture',
+               'pressure_trend', 'absolute_humidity', 'dew_point', 'rain_probability',
+               'comfort_index', 'weather_description', 'timestamp', 'created_at')
+
+# INSERT vào bảng weather đơn (schema v1-5); từ v6 dùng PARTITION_INSERT_SQL
+INSERT_SQL = '''INSERT INTO weather
+                (device_id, temperature, humidity, pressure, soil_moisture,
+                 pressure_trend, absolute_humidity, dew_point, rain_probability,
+                 comfort_index, weather_description, timestamp, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+
+PARTITION_INSERT_SQL = INSERT_SQL.replace('INTO weather', 'INTO {table}')
+
+LATEST_INSERT_SQL = INSERT_SQL.replace('INTO weather', 'INTO latest_readings')
+
+# Chỉ thay bản ghi mới nhất bằng bản ghi không cũ hơn. seq tăng theo mỗi giao
+# dịch ghi, để các worker chỉ đọc lại những thiết bị vừa đổi (seq > seq đã đọc)
+LATEST_UPSERT_SQL = '''INSERT INTO latest_readings ({}, seq)
+                       VALUES ({}, ?)
+                       ON CONFLICT (device_id) DO UPDATE SET
+                           {}
+                       WHERE excluded.timestamp >= latest_readings.timestamp'''.format(
+    ', '.join(ROW_COLUMNS), ', '.join('?' * len(ROW_COLUMNS)),
+    ', '.join(f'{c} = excluded.{c}' for c in ROW_COLUMNS[1:] + ('seq',)))
+
+
+def next_latest_seq(conn):
+    """seq cho các thay đổi của giao dịch ghi hiện tại (giữ khóa ghi nên tăng dần)"""
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM latest_readings").fetchone()[0]
+
+
+# Cột INTEGER trong bộ giá trị INSERT (các cột số còn lại là REAL)
+INTEGER_COLUMNS = ('soil_moisture', 'comfort_index', 'timestamp')
+REAL_COLUMNS = tuple(c for c in ROLLUP_METRICS if c not in INTEGER_COLUMNS)
+
+
+def stored_row(row):
+    """Dòng bản ghi với kiểu số như khi đọc lại từ database (25 -> 25.0 ở cột REAL).
+
+    Nhờ vậy bản ghi vừa nhận và bản ghi đọc lại cho cùng nội dung JSON/ETag.
+    """
+    values = list(row)
+    for index, column in enumerate(ROW_COLUMNS):
+        value = values[index]
+        if column in REAL_COLUMNS and isinstance(value, int):
+            values[index] = float(value)
+        elif column in INTEGER_COLUMNS and isinstance(value, (bool, float)) and float(value).is_integer():
+            values[index] = int(value)
+    return tuple(values)
+
+
+def latest_row(row):
+    """Dòng bản ghi cho bảng latest_readings (device_id None -> '')"""
+    if row[ROW_DEVICE] is None:
+        return ('',) + tuple(row[1:])
+    return tuple(row)
+
+
+def newest_rows(rows):
+    """Bản ghi mới nhất của mỗi thiết bị trong lô (trùng timestamp: bản ghi sau cùng)"""
+    newest = {}
+    for row in rows:
+        if row[ROW_TIMESTAMP] is None:
+            continue
+        current = newest.get(row[ROW_DEVICE])
+        if current is None or row[ROW_TIMESTAMP] >= current[ROW_TIMESTAMP]:
+            newest[row[ROW_DEVICE]] = row
+    return list(newest.values())
+
+
+def connect(path):
+    """Mở một kết nối mới đã được tinh chỉnh PRAGMA"""
+    conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE,
+                           isolation_level=None)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Pool kết nối có giới hạn, an toàn khi dùng từ nhiều luồng"""
+
+    def __init__(self, path, size=DEFAULT_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=10.0):
+        """Lấy một kết nối rảnh, mở thêm nếu pool chưa đầy"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Hết kết nối database trong pool")
+
+    def release(self, conn):
+        """Trả kết nối về pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Đóng mọi kết nối đang rảnh"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_config = {
+    'path': os.environ.get('WEATHER_DB', DEFAULT_DB_PATH),
+    'pool_size': int(os.environ.get('WEATHER_DB_POOL_SIZE', DEFAULT_POOL_SIZE)),
+    'retention_days': (float(os.environ['WEATHER_RETENTION_DAYS'])
+                       if os.environ.get('WEATHER_RETENTION_DAYS') else DEFAULT_RETENTION_DAYS),
+}
+
+# Phân vùng đã biết là tồn tại (tránh hỏi sqlite_master mỗi lần ghi)
+_known_partitions = set()
+
+
+def close():
+    """Đóng các kết nối của pool (vd: trước khi fork các tiến trình worker)"""
+    configure()
+
+
+def configure(path=None, pool_size=None, retention_days=None):
+    """Đổi đường dẫn database / kích thước pool / số ngày giữ dữ liệu thô (đóng pool cũ)"""
+    global _pool
+    with _pool_lock:
+        if path is not None:
+            _config['path'] = path
+            _known_partitions.clear()
+        if pool_size is not None:
+            _config['pool_size'] = pool_size
+        if retention_days is not None:
+            _config['retention_days'] = retention_days
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+def db_path():
+    return _config['path']
+
+
+def retention_days():
+    return _config['retention_days']
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_config['path'], _config['pool_size'])
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Mượn một kết nối từ pool trong phạm vi khối with"""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction():
+    """Mở giao dịch ghi (BEGIN IMMEDIATE), commit khi thoát khối with"""
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(target=None):
+    """Nâng cấp schema tại chỗ lên phiên bản target (mặc định: mới nhất).
+
+    Mỗi migration chạy trong một giao dịch riêng cùng với việc tăng
+    user_version, nên có thể chạy lại an toàn nếu bị ngắt giữa chừng.
+    Trả về danh sách các phiên bản đã áp dụng.
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        with transaction() as conn:
+            if schema_version(conn) >= version:
+                continue
+            print(f"🛠️ Migration {version}: {description}")
+            for sql in statements:
+                if callable(sql):
+                    sql(conn)
+                else:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(version)
+    _known_partitions.clear()
+    return applied
+
+
+def init_db():
+    """Tạo bảng và nâng cấp schema lên phiên bản mới nhất"""
+    return migrate()
+
+
+def rollup_deltas(rows, bucket_seconds):
+    """Tính count/min/max/sum/sum_sq của một lô bản ghi theo từng khung"""
+    groups = {}
+    for row in rows:
+        ts = row[ROW_TIMESTAMP]
+        if ts is None:
+            continue
+        bucket = int(ts // bucket_seconds * bucket_seconds)
+        device_id = row[ROW_DEVICE] or ''
+        for metric, index in ROLLUP_METRICS.items():
+            value = row[index]
+            if value is None or value != value:   # Bỏ qua NULL/NaN
+                continue
+            key = (metric, device_id, bucket)
+            agg = groups.get(key)
+            if agg is None:
+                groups[key] = [1, value, value, value, value * value]
+            else:
+                agg[0] += 1
+                if value < agg[1]:
+                    agg[1] = value
+                if value > agg[2]:
+                    agg[2] = value
+                agg[3] += value
+                agg[4] += value * value
+    return [key + tuple(agg) for key, agg in groups.items()]
+
+
+def update_rollups(conn, rows):
+    """Cộng dồn một lô bản ghi vào các bảng tổng hợp (trong giao dịch của conn)"""
+    for table, bucket_seconds in ROLLUP_TABLES.items():
+        conn.executemany(ROLLUP_UPSERT_SQL.format(table=table),
+                         rollup_deltas(rows, bucket_seconds))
+
+
+def rebuild_rollups(device_id=None, start=None, end=None):
+    """Tính lại bảng tổng hợp từ dữ liệu thô của các phân vùng đang có, chỉ cho
+    device_id và khoảng [start, end) nếu có (mở rộng ra trọn ngày UTC).
+
+    Mỗi đoạn REBUILD_CHUNK_SECONDS của một phân vùng là một giao dịch riêng, nên
+    luồng ghi chỉ phải chờ một đoạn ngắn. Khung của các tháng đã hết hạn không
+    còn dữ liệu thô nên được giữ nguyên.
+    """
+    low = None if start is None else int(start // 86400 * 86400)
+    high = None if end is None else int(-(-end // 86400) * 86400)
+    with connection() as conn:
+        keys = list_partitions(conn)
+    for key in keys:
+        chunk_start, partition_end = partition_range(key)
+        if low is not None:
+            chunk_start = max(chunk_start, low)
+        if high is not None:
+            partition_end = min(partition_end, high)
+        while chunk_start < partition_end:
+            chunk_end = min(chunk_start + REBUILD_CHUNK_SECONDS, partition_end)
+            try:
+                with transaction() as conn:
+                    rebuild_rollup_range(conn, partition_name(key), chunk_start, chunk_end, device_id)
+            except sqlite3.OperationalError as e:
+                # Phân vùng vừa bị apply_retention xóa: không còn gì để tính lại
+                if 'no such table' not in str(e):
+                    raise
+                break
+            chunk_start = chunk_end
+
+
+def ensure_partitions(conn, keys):
+    """Tạo các phân vùng còn thiếu trong keys (trong giao dịch của conn)"""
+    missing = set(keys) - _known_partitions
+    if not missing:
+        return
+    existing = list_partitions(conn)
+    created = missing.difference(existing)
+    for key in created:
+        create_partition(conn, key)
+    if created:
+        rebuild_view(conn, sorted(created.union(existing)))
+    _known_partitions.update(missing)
+
+
+def rows_by_partition(rows, index=ROW_TIMESTAMP):
+    """Nhóm các dòng theo phân vùng của timestamp (thiếu timestamp: tháng hiện tại)"""
+    groups = {}
+    now = None
+    for row in rows:
+        ts = row[index]
+        if ts is None:
+            ts = now = now or time.time()
+        groups.setdefault(partition_key(ts), []).append(row)
+    return groups
+
+
+def ids_by_partition(pairs):
+    """Nhóm các cặp (..., id) theo phân vùng suy ra từ id (phần tử cuối)"""
+    groups = {}
+    for pair in pairs:
+        groups.setdefault(pair[-1] >> PARTITION_ID_SHIFT, []).append(pair)
+    return groups
+
+
+def apply_retention(days=None, now=None):
+    """Xóa các phân vùng tháng đã nằm trọn ngoài cửa sổ giữ dữ liệu thô.
+
+    days mặc định lấy từ WEATHER_RETENTION_DAYS / configure(); None thì không
+    xóa gì. Xóa theo cả phân vùng (DROP TABLE) nên dữ liệu thô được giữ ít nhất
+    days ngày, nhiều nhất thêm một tháng. Bảng tổng hợp theo giờ/ngày không đổi.
+    Trang trống được SQLite dùng lại cho các phân vùng mới.
+    Trả về danh sách tên bảng đã xóa.
+    """
+    days = retention_days() if days is None else days
+    if days is None:
+        return []
+    cutoff = (time.time() if now is None else now) - days * 86400
+    with connection() as conn:
+        # Không ghi đè trang bị giải phóng (một số bản SQLite bật secure_delete
+        # mặc định), để DROP TABLE chỉ ghi danh sách trang trống vào WAL
+        secure_delete = conn.execute("PRAGMA secure_delete").fetchone()[0]
+        conn.execute("PRAGMA secure_delete = FAST")
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            keys = list_partitions(conn)
+            expired = [k for k in keys if partition_range(k)[1] <= cutoff]
+            for key in expired:
+                conn.execute(f"DROP TABLE {partition_name(key)}")
+            if expired:
+                rebuild_view(conn, [k for k in keys if k not in expired])
+            conn.commit()
+        finally:
+            conn.execute(f"PRAGMA secure_delete = {secure_delete}")
+    _known_partitions.difference_update(expired)
+    return [partition_name(k) for k in expired]
+
+
+def insert_readings(rows, spool_name=None, spool_seq=None, extra_columns=()):
+    """Ghi nhiều bản ghi và cập nhật bảng tổng hợp trong cùng một giao dịch.
+
+    Nếu có spool_name/spool_seq, mốc seq đã ghi của spool cũng được lưu trong
+    giao dịch này, để việc phát lại spool không bao giờ ghi trùng. extra_columns
+    là các cột phân vùng ngoài ROW_COLUMNS (vd: rain_predicted) có giá trị nối
+    thêm ở cuối mỗi dòng; latest_readings chỉ nhận phần ROW_COLUMNS.
+    """
+    invalid = [c for c in extra_columns if c not in PARTITION_COLUMNS or c in ROW_COLUMNS + ('id',)]
+    if invalid:
+        raise ValueError(f"Cột không hợp lệ: {', '.join(invalid)}")
+    insert_sql = PARTITION_INSERT_SQL
+    if extra_columns:
+        columns = ROW_COLUMNS + tuple(extra_columns)
+        insert_sql = (f"INSERT INTO {{table}} ({', '.join(columns)}) "
+                      f"VALUES ({', '.join('?' * len(columns))})")
+    groups = rows_by_partition(rows)
+    for attempt in range(2):
+        try:
+            with transaction() as conn:
+                ensure_partitions(conn, groups)
+                for key, group in groups.items():
+                    conn.executemany(insert_sql.format(table=partition_name(key)), group)
+                update_rollups(conn, rows)
+                seq = next_latest_seq(conn)
+                conn.executemany(LATEST_UPSERT_SQL, [latest_row(row[:len(ROW_COLUMNS)]) + (seq,)
+                                                     for row in newest_rows(rows)])
+                if spool_name is not None:
+                    save_spool_seq(conn, spool_name, spool_seq)
+            return
+        except sqlite3.OperationalError as e:
+            # Phân vùng trong _known_partitions đã bị tiến trình khác xóa (apply_retention)
+            if attempt or 'no such table' not in str(e):
+                raise
+            _known_partitions.clear()
+
+
+def save_spool_seq(conn, spool_name, spool_seq):
+    """Lưu mốc seq đã xử lý của spool (chỉ tăng, không bao giờ lùi)"""
+    conn.execute('''INSERT INTO spool_state (name, applied_seq) VALUES (?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        applied_seq = MAX(applied_seq, excluded.applied_seq)''',
+                 (spool_name, spool_seq))
+
+
+def insert_dead_letters(rows, error, spool_name=None, spool_seq=None):
+    """Lưu các dòng không ghi được vào bảng dead_letter (JSON của dòng, lỗi).
+
+    Mốc seq của spool được lưu cùng giao dịch như insert_readings: dòng chỉ
+    được coi là đã xử lý khi đã nằm trong weather hoặc dead_letter.
+    """
+    created_at = time.strftime("%Y-%m-%d %H:%M:%S")
+    with transaction() as conn:
+        conn.executemany("INSERT INTO dead_letter (row, error, created_at) VALUES (?, ?, ?)",
+                         [(json.dumps(row, ensure_ascii=False), error, created_at) for row in rows])
+        if spool_name is not None:
+            save_spool_seq(conn, spool_name, spool_seq)
+
+
+def fetch_dead_letters(limit=None):
+    """Các dòng trong dead_letter, cũ trước: [(id, dòng, lỗi, created_at)]"""
+    with connection() as conn:
+        rows = conn.execute("SELECT id, row, error, created_at FROM dead_letter ORDER BY id LIMIT ?",
+                            (-1 if limit is None else limit,)).fetchall()
+    return [(id_, tuple(json.loads(row)), error, created_at) for id_, row, error, created_at in rows]
+
+
+def delete_dead_letters(ids):
+    with transaction() as conn:
+        conn.executemany("DELETE FROM dead_letter WHERE id = ?", [(id_,) for id_ in ids])
+
+
+def spool_applied_seq(spool_name):
+    """seq lớn nhất của spool đã được ghi vào database (0 nếu chưa có)"""
+    with connection() as conn:
+        row = conn.execute("SELECT applied_seq FROM spool_state WHERE name = ?",
+                           (spool_name,)).fetchone()
+    return row[0] if row else 0
+
+
+def insert_reading(row):
+    """Ghi một bản ghi"""
+    insert_readings([row])
+
+
+def fetch_history(column, since, limit=100, device_id=None, until=None):
+    """Lấy lịch sử một cột từ thời điểm since, sắp xếp từ cũ đến mới.
+
+    Dùng chỉ mục (timestamp) hoặc (device_id, timestamp) nếu lọc theo thiết bị.
+    """
+    return fetch_history_multi([column], since, limit, device_id, until)
+
+
+def rollup_table_for(bucket):
+    """Chọn bảng tổng hợp thô nhất mà bucket chia hết, hoặc None"""
+    for table, seconds in sorted(ROLLUP_TABLES.items(), key=lambda t: -t[1]):
+        if bucket % seconds == 0:
+            return table, seconds
+    return None
+
+
+def fetch_buckets_multi(columns, start, end, bucket, device_id=None):
+    """Gộp nhiều cột cùng lúc theo khung thời gian bucket (giây) trong [start, end).
+
+    Trả về danh sách (bucket_start, {cột: (count, min, mean, max)}) theo thứ tự
+    thời gian, chỉ với một lần quét dữ liệu cho tất cả các cột.
+    Khung là bội của 1 giờ/1 ngày được đọc từ bảng tổng hợp, nên chi phí
+    không phụ thuộc số bản ghi thô trong khoảng (khung đầu tiên tính trọn giờ/ngày).
+    """
+    columns = list(columns)
+    rollup = rollup_table_for(bucket) if all(c in ROLLUP_METRICS for c in columns) else None
+    if rollup is not None:
+        table, seconds = rollup
+        where = [f"metric IN ({', '.join('?' * len(columns))})", "bucket >= ?", "bucket < ?"]
+        params = [bucket, bucket] + columns + [int(start // seconds * seconds), end]
+        if device_id is not None:
+            where.insert(1, "device_id = ?")
+            params.insert(2 + len(columns), device_id)
+        with connection() as conn:
+            rows = conn.execute(f'''
+                SELECT CAST(bucket / ? AS INTEGER) * ? AS b, metric,
+                       SUM(count), MIN(min), SUM(sum) / SUM(count), MAX(max)
+                FROM {table}
+                WHERE {' AND '.join(where)}
+                GROUP BY b, metric
+                ORDER BY b ASC
+            ''', params).fetchall()
+        result = []
+        for row in rows:
+            if not result or result[-1][0] != row[0]:
+                result.append((row[0], {}))
+            result[-1][1][row[1]] = row[2:]
+        return result
+
+    where = ["timestamp >= ?", "timestamp < ?"]
+    params = [bucket, bucket, start, end]
+    if device_id is not None:
+        where.insert(0, "device_id = ?")
+        params.insert(2, device_id)
+    aggregates = ', '.join(f"COUNT({c}), MIN({c}), AVG({c}), MAX({c})" for c in columns)
+    with connection() as conn:
+        rows = conn.execute(f'''
+            SELECT CAST(timestamp / ? AS INTEGER) * ? AS bucket, {aggregates}
+            FROM weather
+            WHERE {' AND '.join(where)}
+            GROUP BY bucket
+            ORDER BY bucket ASC
+        ''', params).fetchall()
+    return [(row[0], {c: row[1 + 4 * i:5 + 4 * i] for i, c in enumerate(columns)})
+            for row in rows]
+
+
+def fetch_buckets(column, start, end, bucket, device_id=None):
+    """Gộp một cột theo khung thời gian, trả về (bucket_start, count, min, mean, max)"""
+    return [(b, *stats[column])
+            for b, stats in fetch_buckets_multi([column], start, end, bucket, device_id)]
+
+
+def fetch_history_multi(columns, since, limit=100, device_id=None, until=None):
+    """Lấy dữ liệu thô của nhiều cột, trả về các dòng (timestamp, cột1, cột2, ...)"""
+    where = ["timestamp > ?"]
+    params = [since]
+    if device_id is not None:
+        where.insert(0, "device_id = ?")
+        params.insert(0, device_id)
+    if until is not None:
+        where.append("timestamp < ?")
+        params.append(until)
+    params.append(limit)
+    with connection() as conn:
+        return conn.execute(f'''
+            SELECT timestamp, {', '.join(columns)}
+            FROM weather
+            WHERE {' AND '.join(where)}
+            ORDER BY timestamp ASC
+            LIMIT ?
+        ''', params).fetchall()
+
+
+def fetch_pressure_series(device_id, start, end):
+    """(timestamp, pressure) của một thiết bị trong (start, end], theo thứ tự thời gian"""
+    with connection() as conn:
+        return conn.execute('''
+            SELECT timestamp, pressure
+            FROM weather
+            WHERE device_id = ? AND timestamp > ? AND timestamp <= ?
+            ORDER BY timestamp ASC, id ASC
+        ''', (device_id, start, end)).fetchall()
+
+
+def iter_pressure_rows(device_id=None):
+    """Duyệt (id, device_id, timestamp, pressure, pressure_trend) theo thiết bị rồi thời gian.
+
+    Đọc dần theo chỉ mục (device_id, timestamp), không nạp cả bảng vào bộ nhớ.
+    """
+    where, params = ("WHERE device_id = ?", (device_id,)) if device_id is not None else ("", ())
+    with connection() as conn:
+        yield from conn.execute(f'''
+            SELECT id, device_id, timestamp, pressure, pressure_trend
+            FROM weather
+            {where}
+            ORDER BY device_id ASC, timestamp ASC, id ASC
+        ''', params)
+
+
+def update_pressure_trends(updates):
+    """Ghi lại pressure_trend cho các cặp (giá trị, id) trong một giao dịch"""
+    update_columns(['pressure_trend'], [i for _, i in updates], [[v for v, _ in updates]])
+
+
+def iter_weather_chunks(columns, chunk_size, device_id=None, start=None, end=None, require=()):
+    """Duyệt bảng weather theo khối (id, cột1, cột2, ...), tối đa chunk_size dòng mỗi khối.
+
+    Chỉ lấy các dòng mà mọi cột trong require khác NULL.
+
+    Phân trang theo id (keyset) nên mỗi khối là một truy vấn ngắn, không giữ
+    giao dịch đọc mở trong lúc bên gọi ghi lại từng khối.
+    """
+    where = ["id > ?"]
+    params = []
+    if device_id is not None:
+        where.append("device_id = ?")
+        params.append(device_id)
+    if start is not None:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("timestamp < ?")
+        params.append(end)
+    where.extend(f"{c} IS NOT NULL" for c in require)
+    sql = f'''SELECT id, {', '.join(columns)} FROM weather
+              WHERE {' AND '.join(where)} ORDER BY id ASC LIMIT ?'''
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(sql, [last_id] + params + [chunk_size]).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def iter_export_chunks(columns, chunk_size, start=None, end=None, device_ids=None):
+    """Duyệt các cột của bảng weather trong [start, end) theo (timestamp, id), từng khối chunk_size dòng.
+
+    Đọc thẳng từ cursor, từng phân vùng một, trên một kết nối riêng ngoài pool
+    (client tải chậm không giữ kết nối của pool) và trong một giao dịch đọc,
+    nên kết quả là một ảnh chụp nhất quán dù đang có dữ liệu mới được ghi.
+    Lọc theo device_ids dùng chỉ mục (device_id, timestamp) của từng thiết bị
+    rồi trộn theo thời gian, không sắp xếp trong bộ nhớ. Bỏ qua dòng không có
+    timestamp.
+    """
+    select = ', '.join(columns)
+    conn = connect(db_path())
+    try:
+        # Trang đọc qua mmap được tính vào RSS và tăng theo lượng dữ liệu đã
+        # quét; đọc tuần tự qua page cache (giới hạn cache_size) là đủ nhanh
+        conn.execute("PRAGMA mmap_size=0")
+        conn.execute("BEGIN")
+        for key in list_partitions(conn):
+            first, last = partition_range(key)
+            if (start is not None and last <= start) or (end is not None and first >= end):
+                continue
+            table = partition_name(key)
+            where = ["timestamp >= ?", "timestamp < ?"]
+            bounds = [first if start is None else max(first, start),
+                      last if end is None else min(last, end)]
+            if not device_ids:
+                cursor = conn.execute(f'''SELECT {select} FROM {table} WHERE {' AND '.join(where)}
+                                         ORDER BY timestamp, id''', bounds)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+                continue
+            # Mỗi thiết bị một cursor đã sắp theo (timestamp, id), trộn lại
+            sql = f'''SELECT timestamp, id, {select} FROM {table}
+                      WHERE device_id = ? AND {' AND '.join(where)} ORDER BY timestamp, id'''
+            merged = heapq.merge(*(conn.execute(sql, [device_id] + bounds) for device_id in device_ids))
+            while True:
+                rows = [row[2:] for row in itertools.islice(merged, chunk_size)]
+                if not rows:
+                    break
+                yield rows
+    finally:
+        conn.close()
+
+
+def update_columns(columns, ids, values):
+    """Ghi lại các cột cho các dòng theo id trong một giao dịch.
+
+    values là danh sách theo cột, mỗi phần tử cùng độ dài với ids.
+    Bản ghi thuộc phân vùng đã hết hạn (bị xóa trong lúc đó) được bỏ qua.
+    """
+    assignments = ', '.join(f"{c} = ?" for c in columns)
+    with transaction() as conn:
+        existing = set(list_partitions(conn))
+        for key, group in ids_by_partition(zip(*values, ids)).items():
+            if key in existing:
+                conn.executemany(f"UPDATE {partition_name(key)} SET {assignments} WHERE id = ?",
+                                 group)
+
+
+def set_rain_observed(value, device_id=None, start=None, end=None):
+    """Gán nhãn mưa thực tế (1/0, None để xóa) cho các bản ghi trong [start, end)"""
+    where, params = [], [value]
+    if device_id is not None:
+        where.append("device_id = ?")
+        params.append(device_id)
+    if start is not None:
+        where.append("timestamp >= ?")
+        params.append(start)
+    if end is not None:
+        where.append("timestamp < ?")
+        params.append(end)
+    sql = "UPDATE {table} SET rain_observed = ?"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    count = 0
+    with transaction() as conn:
+        for key in list_partitions(conn):
+            first, last = partition_range(key)
+            if (start is None or last > start) and (end is None or first < end):
+                count += conn.execute(sql.format(table=partition_name(key)), params).rowcount
+    return count
+
+
+def save_model(link, coeffs, metrics, rows, created_at):
+    """Lưu một bộ hệ số mới, trả về số phiên bản"""
+    with transaction() as conn:
+        cursor = conn.execute('''INSERT INTO model_coeffs (link, coeffs, metrics, rows, created_at)
+                                VALUES (?, ?, ?, ?, ?)''',
+                             (link, json.dumps(coeffs), json.dumps(metrics), rows, created_at))
+        return cursor.lastrowid
+
+
+def fetch_model(version=None):
+    """Bộ hệ số theo phiên bản (mặc định: mới nhất) dạng dict, hoặc None"""
+    sql = "SELECT version, link, coeffs, metrics, rows, created_at FROM model_coeffs"
+    if version is None:
+        sql, params = sql + " ORDER BY version DESC LIMIT 1", ()
+    else:
+        sql, params = sql + " WHERE version = ?", (version,)
+    with connection() as conn:
+        row = conn.execute(sql, params).fetchone()
+    if row is None:
+        return None
+    return {'version': row[0], 'link': row[1], 'coeffs': json.loads(row[2]),
+            'metrics': json.loads(row[3]) if row[3] else {}, 'rows': row[4], 'created_at': row[5]}
+
+
+def fetch_latest_per_device(since=None):
+    """Bản ghi mới nhất (theo timestamp) của từng thiết bị, dạng dict theo tên cột kèm 'seq'.
+
+    since: chỉ các thiết bị đổi sau seq này (seq lớn nhất của lần đọc trước).
+    """
+    sql = f"SELECT {', '.join(ROW_COLUMNS)}, seq FROM latest_readings"
+    params = ()
+    if since is not None:
+        sql, params = sql + " WHERE seq > ?", (since,)
+    with connection() as conn:
+        rows = conn.execute(sql + " ORDER BY timestamp, device_id", params).fetchall()
+    latest = []
+    for row in rows:
+        record = dict(zip(ROW_COLUMNS + ('seq',), row))
+        if record['device_id'] == '':
+            record['device_id'] = None
+        latest.append(record)
+    return latest
+
+
+def rebuild_latest():
+    """Tính lại bảng latest_readings (sau khi sửa cột dẫn xuất của dữ liệu đã lưu)"""
+    with transaction() as conn:
+        seq = next_latest_seq(conn)       # Trước khi xóa, để seq không giảm
+        refresh_latest(conn)
+        conn.execute("UPDATE latest_readings SET seq = ?", (seq,))
+
+
+def pid_alive(pid):
+    """Tiến trình pid còn chạy trên máy này không"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fetch_job_status(name):
+    """Trạng thái gần nhất của tác vụ nền name (dict), hoặc None"""
+    with connection() as conn:
+        row = conn.execute("SELECT status FROM job_status WHERE name = ?", (name,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def save_job_status(name, status):
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO job_status (name, status) VALUES (?, ?)",
+                     (name, json.dumps(status)))
+
+
+def claim_job(name, status):
+    """Ghi status (phải có 'pid') nếu tác vụ name không đang chạy ở tiến trình khác.
+
+    Dùng chung giữa các worker: chỉ một tiến trình giành được tác vụ. Lần chạy
+    của tiến trình đã chết không còn giữ tác vụ. Trả về True nếu giành được.
+    """
+    with transaction() as conn:
+        row = conn.execute("SELECT status FROM job_status WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            current = json.loads(row[0])
+            pid = current.get('pid')
+            if current.get('state') == 'running' and pid and pid_alive(pid):
+                return False
+        conn.execute("INSERT OR REPLACE INTO job_status (name, status) VALUES (?, ?)",
+                     (name, json.dumps(status)))
+    return True
@@ -0,0 +1,177 @@
+"""Huấn luyện regression_coeffs của mô hình dự báo mưa từ lịch sử đã lưu.
+
+Đặc trưng giống hệt predict_rain_probability trên thiết bị (ah,
+1/max(0.1, temp-dew), soil, 1013-pressure, min(0, trend)), nhãn là cột
+rain_observed (mưa thực tế, 1/0). Bảng weather được đọc theo khối và chỉ
+cộng dồn phương trình chuẩn X^T W X, X^T W z (6x6), nên bộ nhớ không phụ
+thuộc số dòng:
+
+- link 'identity': bình phương tối thiểu, một lượt đọc;
+- link 'logistic': IRLS (Newton), mỗi vòng lặp một lượt đọc.
+
+Bộ hệ số được lưu thành phiên bản mới trong model_coeffs; thiết bị tải về
+qua /api/model/latest.
+"""
+import time
+from datetime import datetime
+
+import numpy as np
+
+import reanalysis
+import storage
+
+FEATURES = ('intercept', 'ah', 'temp_dew_reciprocal', 'soil', 'pressure', 'pressure_trend')
+LINKS = ('identity', 'logistic')
+LABEL_COLUMN = 'rain_observed'
+
+DEFAULT_CHUNK_SIZE = 50000
+MAX_ITERATIONS = 25
+TOLERANCE = 1e-8
+
+
+def design_matrix(temperature, humidity, pressure, soil_moisture, pressure_trend):
+    """Ma trận đặc trưng (n, len(FEATURES)) và mặt nạ các dòng thiết bị dự báo được"""
+    dew = reanalysis.dew_point(temperature, humidity)
+    diff = temperature - dew
+    ah = reanalysis.absolute_humidity(temperature, humidity)
+    with np.errstate(invalid='ignore'):
+        X = np.column_stack([
+            np.ones_like(ah),
+            ah,
+            1.0 / np.where(diff > 0.1, diff, 0.1),
+            soil_moisture,
+            1013 - pressure,
+            np.where(pressure_trend < 0, pressure_trend, 0.0),
+        ])
+    # Thiết bị trả về NaN khi thiếu ah/chênh lệch điểm sương/đất/áp suất
+    valid = np.isfinite(X).all(axis=1) & ~np.isnan(diff)
+    return X, valid
+
+
+def predict(X, beta, link):
+    """Xác suất mưa 0-1 như thiết bị tính với hệ số beta"""
+    eta = X @ beta
+    if link == 'logistic':
+        eta = 1.0 / (1.0 + np.exp(-np.clip(eta, -50.0, 50.0)))
+    return np.clip(eta, 0.0, 1.0)
+
+
+def coeffs_to_vector(coeffs):
+    return np.array([coeffs[name] for name in FEATURES], dtype=np.float64)
+
+
+def iter_training_chunks(device_id=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Duyệt (X, y) theo khối, chỉ các dòng đã có nhãn và đủ dữ liệu"""
+    columns = reanalysis.INPUT_COLUMNS + (LABEL_COLUMN,)
+    for rows in storage.iter_weather_chunks(columns, chunk_size, device_id, start, end,
+                                            require=(LABEL_COLUMN,)):
+        X, valid = design_matrix(*(reanalysis.column_values(rows, 1 + i)
+                                   for i in range(len(reanalysis.INPUT_COLUMNS))))
+        y = reanalysis.column_values(rows, len(columns))
+        if valid.any():
+            yield X[valid], y[valid]
+
+
+class NormalEquations:
+    """Cộng dồn X^T W X và X^T W z qua nhiều khối dữ liệu"""
+
+    def __init__(self, k):
+        self.xtx = np.zeros((k, k))
+        self.xtz = np.zeros(k)
+        self.rows = 0
+
+    def add(self, X, z, w=None):
+        Xw = X if w is None else X * w[:, None]
+        self.xtx += Xw.T @ X
+        self.xtz += Xw.T @ z
+        self.rows += len(X)
+
+    def solve(self, ridge=0.0):
+        """Nghiệm (X^T W X + ridge*I) beta = X^T W z; ridge không phạt hệ số chặn"""
+        a = self.xtx.copy()
+        a[np.arange(1, len(a)), np.arange(1, len(a))] += ridge
+        try:
+            return np.linalg.solve(a, self.xtz)
+        except np.linalg.LinAlgError:
+            # Ma trận suy biến (vd: một đặc trưng không đổi): nghiệm chuẩn nhỏ nhất
+            return np.linalg.lstsq(a, self.xtz, rcond=None)[0]
+
+
+def current_params():
+    """Hệ số thiết bị đang dùng: bản mới nhất đã phát hành, hoặc mặc định"""
+    model = storage.fetch_model()
+    if model is None:
+        return reanalysis.DEFAULT_PARAMS
+    return {'regression_coeffs': model['coeffs'], 'rain_link': model['link']}
+
+
+def evaluate(chunks, beta, link, baseline):
+    """Brier, log loss, độ chính xác (ngưỡng 0.5) của mô hình mới và của baseline"""
+    totals = {'brier': 0.0, 'log_loss': 0.0, 'accuracy': 0.0,
+              'baseline_brier': 0.0, 'baseline_accuracy': 0.0, 'positive_rate': 0.0}
+    n = 0
+    for X, y in chunks:
+        p = predict(X, beta, link)
+        q = predict(X, coeffs_to_vector(baseline['regression_coeffs']), baseline['rain_link'])
+        pc = np.clip(p, 1e-12, 1 - 1e-12)
+        totals['brier'] += np.sum((p - y) ** 2)
+        totals['log_loss'] -= np.sum(y * np.log(pc) + (1 - y) * np.log(1 - pc))
+        totals['accuracy'] += np.sum((p >= 0.5) == (y == 1))
+        totals['baseline_brier'] += np.sum((q - y) ** 2)
+        totals['baseline_accuracy'] += np.sum((q >= 0.5) == (y == 1))
+        totals['positive_rate'] += np.sum(y)
+        n += len(y)
+    return {name: round(float(value / n), 6) for name, value in totals.items()} if n else {}
+
+
+def fit(link='identity', device_id=None, start=None, end=None, chunk_size=DEFAULT_CHUNK_SIZE,
+        ridge=0.0, max_iterations=MAX_ITERATIONS, progress=None):
+    """Huấn luyện hệ số trên các bản ghi có nhãn (lọc theo thiết bị/khoảng thời gian).
+
+    Trả về dict link, coeffs (theo tên trong regression_coeffs), rows,
+    iterations, metrics (trên chính dữ liệu huấn luyện), seconds.
+    """
+    if link not in LINKS:
+        raise ValueError(f"link không hợp lệ: {link}")
+    started = time.perf_counter()
+
+    def chunks():
+        return iter_training_chunks(device_id, start, end, chunk_size)
+
+    beta = np.zeros(len(FEATURES))
+    iterations = 0
+    while iterations < (1 if link == 'identity' else max_iterations):
+        iterations += 1
+        equations = NormalEquations(len(FEATURES))
+        for X, y in chunks():
+            if link == 'identity':
+                equations.add(X, y)
+            else:
+                eta = X @ beta
+                p = 1.0 / (1.0 + np.exp(-np.clip(eta, -50.0, 50.0)))
+                w = np.maximum(p * (1 - p), 1e-10)
+                equations.add(X, eta + (y - p) / w, w)
+        if not equations.rows:
+            raise ValueError("Không có bản ghi nào có nhãn rain_observed và đủ dữ liệu")
+        new_beta = equations.solve(ridge)
+        step = np.max(np.abs(new_beta - beta))
+        beta = new_beta
+        if progress is not None:
+            progress(iterations, equations.rows)
+        if step <= TOLERANCE * (1 + np.max(np.abs(beta))):
+            break
+
+    return {
+        'link': link,
+        'coeffs': {name: float(value) for name, value in zip(FEATURES, beta)},
+        'rows': equations.rows,
+        'iterations': iterations,
+        'metrics': evaluate(chunks(), beta, link, current_params()),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def publish(result):
+    """Lưu kết quả fit() thành phiên bản mới, trả về số phiên bản"""
+    return storage.save_model(result['link'], result['coeffs'], result['metrics'], result['rows'],
+                              datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
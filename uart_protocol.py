@@ -0,0 +1,142 @@
+"""Giao thức khung nhị phân qua UART giữa do_an.py và máy chủ (collector.py).
+
+Mỗi khung:
+
+    AA 55 | type (1) | seq (2) | len (1) | payload (len) | crc (2)
+
+- seq: số thứ tự 16 bit (little-endian) tăng dần mỗi khung, để bên nhận
+  biết khung bị mất;
+- crc: CRC-16/CCITT (đa thức 0x1021, khởi tạo 0xFFFF) trên type..payload.
+
+Khung READING mang một lần đo trong 7 byte (nhiệt độ và độ ẩm x100, độ ẩm
+đất, trạng thái mưa), cả khung 15 byte so với ~18 byte dạng văn bản
+"{temperature:.2f},{humidity:.2f},{soil},{rain}\\n". Chạy được trên
+MicroPython và CPython; collector.py giải mã hàng loạt bằng NumPy.
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    from binascii import crc_hqx
+except ImportError:
+    crc_hqx = None
+
+SYNC = b'\xaa\x55'
+HEADER_FORMAT = '<BHB'            # type, seq, len
+HEADER_SIZE = 2 + 4               # sync + header
+CRC_SIZE = 2
+MAX_PAYLOAD = 64
+
+READING = 1
+RESET = 2
+
+READING_FORMAT = '<hHHB'          # temperature x100, humidity x100, soil, rain
+READING_SIZE = struct.calcsize(READING_FORMAT)
+READING_FRAME_SIZE = HEADER_SIZE + READING_SIZE + CRC_SIZE
+
+if crc_hqx is None:
+    _CRC_TABLE = []
+    for _i in range(256):
+        _c = _i << 8
+        for _ in range(8):
+            _c = ((_c << 1) ^ 0x1021) if _c & 0x8000 else (_c << 1)
+        _CRC_TABLE.append(_c & 0xFFFF)
+
+    def crc_hqx(data, crc):
+        for b in data:
+            crc = ((crc << 8) & 0xFFFF) ^ _CRC_TABLE[(crc >> 8) ^ b]
+        return crc
+
+
+def crc16(data):
+    return crc_hqx(data, 0xFFFF)
+
+
+def encode_frame(ftype, seq, payload=b''):
+    body = struct.pack(HEADER_FORMAT, ftype, seq & 0xFFFF, len(payload)) + payload
+    return SYNC + body + struct.pack('<H', crc16(body))
+
+
+def encode_reading(seq, temperature, humidity, soil_moisture, rain):
+    payload = struct.pack(READING_FORMAT, int(round(temperature * 100)), int(round(humidity * 100)),
+                          int(soil_moisture), int(rain))
+    return encode_frame(READING, seq, payload)
+
+
+def encode_reset(seq):
+    return encode_frame(RESET, seq)
+
+
+def decode_reading(payload):
+    """payload READING -> (temperature, humidity, soil_moisture, rain)"""
+    t, h, soil, rain = struct.unpack(READING_FORMAT, payload)
+    return t / 100, h / 100, soil, rain
+
+
+class FrameDecoder:
+    """Tách khung từ luồng byte bất kỳ (có thể bị cắt giữa khung hoặc lẫn rác).
+
+    Khung sai CRC bị bỏ và tìm lại từ byte đồng bộ kế tiếp. Đếm khung mất theo
+    khoảng trống của seq; khung RESET (thiết bị khởi động lại) bắt đầu đếm lại.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = None
+        self.frames = 0
+        self.crc_errors = 0
+        self.length_errors = 0    # Trường độ dài vượt MAX_PAYLOAD (SYNC giả hoặc header hỏng)
+        self.dropped = 0          # Khung mất, suy ra từ seq
+        self.skipped_bytes = 0    # Byte rác bị bỏ khi tìm lại đồng bộ
+
+    def feed(self, data):
+        """Thêm byte nhận được, trả về danh sách (type, seq, payload) các khung hợp lệ"""
+        buf = self.buffer
+        buf.extend(data)
+        frames = []
+        pos = 0
+        end = len(buf)
+        while True:
+            start = buf.find(SYNC, pos)
+            if start < 0:
+                # Giữ lại byte cuối nếu có thể là nửa đầu của SYNC
+                keep = end - 1 if end > pos and buf[end - 1] == SYNC[0] else end
+                self.skipped_bytes += keep - pos
+                pos = keep
+                break
+            self.skipped_bytes += start - pos
+            if end - start < HEADER_SIZE:
+                pos = start
+                break
+            ftype, seq, length = struct.unpack_from(HEADER_FORMAT, buf, start + 2)
+            if length > MAX_PAYLOAD:
+                self.length_errors += 1
+                pos = start + 1
+                continue
+            total = HEADER_SIZE + length + CRC_SIZE
+            if end - start < total:
+                pos = start
+                break
+            body = bytes(buf[start + 2:start + HEADER_SIZE + length])
+            crc = struct.unpack_from('<H', buf, start + HEADER_SIZE + length)[0]
+            if crc16(body) != crc:
+                self.crc_errors += 1
+                pos = start + 1
+                continue
+            self._track(ftype, seq)
+            frames.append((ftype, seq, body[4:]))
+            pos = start + total
+        del buf[:pos]
+        return frames
+
+    def _track(self, ftype, seq):
+        self.frames += 1
+        if ftype == RESET:
+            self.expected_seq = None
+        elif self.expected_seq is not None:
+            gap = (seq - self.expected_seq) & 0xFFFF
+            if gap < 0x8000:          # Lớn hơn: khung trùng/đến muộn, không tính là mất
+                self.dropped += gap
+        self.expected_seq = (seq + 1) & 0xFFFF
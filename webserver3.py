@@ -1,168 +1,757 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response
 from flask_cors import CORS
 from datetime import datetime
-import sqlite3
+import atexit
+import os
+import threading
 import time
+import json
+import storage
+import export
+import wire_format
+import pressure_trend
+from ingest_queue import IngestQueue
+from spool import Spool
+from latest_cache import LatestCache
+from live_stream import Broker, event_stream
+try:
+    import reanalysis   # Cần NumPy
+except ImportError:
+    reanalysis = None
 
+# Khởi tạo database, hàng đợi ghi... nằm trong create_app(), không chạy lúc import.
+# Chạy thử: python webserver3.py; chạy thật nhiều tiến trình: python serve.py
 app = Flask(__name__)
 CORS(app)  # Bật CORS để cho phép truy cập từ frontend
 
-# Cấu hình database
-def init_db():
-    conn = sqlite3.connect('weather_data.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS weather
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  device_id TEXT,
-                  temperature REAL,
-                  humidity REAL,
-                  pressure REAL,
-                  soil_moisture INTEGER,
-                  pressure_trend REAL,
-                  absolute_humidity REAL,
-                  dew_point REAL,
-                  rain_probability REAL,
-                  comfort_index INTEGER,
-                  weather_description TEXT,
-                  timestamp INTEGER,
-                  created_at TEXT)''')
-    conn.commit()
-    conn.close()
-
-init_db()
-
-# Biến lưu dữ liệu mới nhất
-latest_data = {
-    'last_updated': None,
-    'data': None
-}
+# Bản ghi mới nhất của từng thiết bị (nạp từ bảng latest_readings, đồng bộ giữa các worker)
+latest_cache = LatestCache()
+
+# Kênh đẩy bản ghi mới tới dashboard (SSE)
+broker = Broker()
+
+# Các trường trả về trong /get_current
+CURRENT_FIELDS = ['temperature', 'humidity', 'pressure', 'soil_moisture',
+                  'pressure_trend', 'absolute_humidity', 'dew_point',
+                  'rain_probability', 'comfort_index', 'weather_description',
+                  'device_id', 'timestamp']
+
+def update_latest(row, publish=True):
+    """Cập nhật bộ nhớ đệm từ một dòng bản ghi (cùng thứ tự cột với INSERT)
+    và đẩy bản ghi tới các dashboard đang theo dõi
+    """
+    record = dict(zip(storage.ROW_COLUMNS, storage.stored_row(row)))
+    payload = {field: record[field] for field in CURRENT_FIELDS}
+    payload['last_updated'] = record['created_at']
+    if latest_cache.put(record['device_id'], record['timestamp'], payload) and publish:
+        broker.publish(record['device_id'], latest_cache.get(record['device_id'])['body'])
+
+# seq lớn nhất của bảng latest_readings đã nạp (None: chưa nạp lần nào)
+latest_seq = None
+_load_lock = threading.Lock()
+
+def load_latest(publish=False):
+    """Nạp từ database bản ghi mới nhất của các thiết bị đã đổi kể từ lần nạp trước"""
+    global latest_seq
+    with _load_lock:
+        for record in storage.fetch_latest_per_device(since=latest_seq):
+            latest_seq = max(latest_seq or 0, record['seq'])
+            update_latest(tuple(record[c] for c in storage.ROW_COLUMNS), publish=publish)
+
+def publish_rows(rows):
+    """Cập nhật bộ nhớ đệm/SSE với bản ghi mới nhất của mỗi thiết bị trong lô"""
+    for row in storage.newest_rows(rows):
+        update_latest(row)
+
+# Số giây giữa hai lần kiểm tra database có được tiến trình khác ghi vào không
+WATCH_INTERVAL = 0.25
+
+def watch_changes(conn, version):
+    """Nạp lại bản ghi mới nhất mỗi khi tiến trình khác (worker khác, collector.py,
+    manage.py) commit vào database, và đẩy bản ghi mới tới dashboard của tiến trình này.
+
+    conn là kết nối riêng chỉ dùng để đọc PRAGMA data_version (đổi khi kết nối
+    khác commit); version là giá trị đọc trước lần nạp đầu tiên.
+    """
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        try:
+            current = conn.execute("PRAGMA data_version").fetchone()[0]
+            if current != version:
+                version = current
+                load_latest(publish=True)
+        except Exception as e:
+            print("Lỗi khi theo dõi thay đổi database:", str(e))
+
+# Chế độ ghi: 'sync' ghi ngay trong request,
+# 'async' xếp hàng rồi trả 202, luồng ghi riêng gom lô để ghi
+INGEST_MODE = os.environ.get('INGEST_MODE', 'sync')
+
+# Tên spool trong bảng spool_state (mỗi worker một spool: 'ingest-<số thứ tự>')
+SPOOL_NAME = 'ingest'
+
+ingest_queue = None
+spool = None
+spool_name = SPOOL_NAME
+
+def spool_location(slot=None):
+    """(thư mục, tên) spool ghi trước của worker slot (None: chạy một tiến trình).
+
+    Mặc định là thư mục '<database>-spool' (INGEST_SPOOL_DIR), 'off' để tắt: (None, None).
+    """
+    base = os.environ.get('INGEST_SPOOL_DIR', storage.db_path() + '-spool')
+    if base == 'off':
+        return None, None
+    if slot is None:
+        return base, SPOOL_NAME
+    return os.path.join(base, f'worker-{slot}'), f'{SPOOL_NAME}-{slot}'
+
+def replay_spool(target, name):
+    """Ghi các bản ghi đã nhận vào spool nhưng chưa kịp ghi trước lần dừng trước"""
+    def write(items):
+        try:
+            storage.insert_readings([row for _, row in items], name, max(seq for seq, _ in items))
+        except Exception as e:
+            # Ghi lại từng bản ghi theo thứ tự; bản ghi vẫn lỗi vào dead letter
+            print(f"❌ Lỗi nạp lại lô {len(items)} bản ghi, nạp từng bản ghi:", str(e))
+            for seq, row in items:
+                try:
+                    storage.insert_readings([row], name, seq)
+                except Exception as e:
+                    print("⚠️ Chuyển bản ghi vào dead letter:", str(e))
+                    storage.insert_dead_letters([row], str(e), name, seq)
+
+    replayed = target.replay(storage.spool_applied_seq(name), write)
+    if replayed:
+        print(f"♻️ Đã nạp lại {replayed} bản ghi từ spool {name}")
+    return replayed
+
+def write_queued(items):
+    """Ghi một lô (seq, dòng) từ hàng đợi, kèm mốc seq của spool nếu có"""
+    rows = [row for _, row in items]
+    if spool is None:
+        storage.insert_readings(rows)
+    else:
+        storage.insert_readings(rows, spool_name, max(seq for seq, _ in items))
+
+def dead_letter_queued(items, error):
+    """Lưu vào dead letter các bản ghi không ghi được, kèm mốc seq của spool nếu có"""
+    rows = [row for _, row in items]
+    if spool is None:
+        storage.insert_dead_letters(rows, error)
+    else:
+        storage.insert_dead_letters(rows, error, spool_name, max(seq for seq, _ in items))
+
+def after_written(items):
+    if spool is not None:
+        spool.mark_applied(max(seq for seq, _ in items))
+    publish_rows([row for _, row in items])
+
+class SpoolError(Exception):
+    """Không ghi/fsync được spool: chưa chắc bản ghi được lưu, route trả 503"""
+
+def enqueue(rows):
+    """Nối vào spool (nếu bật) rồi xếp hàng; False nếu hàng đợi đầy.
+
+    Chỉ trả về True khi các bản ghi đã nằm trên đĩa trong spool; báo SpoolError
+    nếu không ghi được spool (thiết bị nên gửi lại sau).
+    """
+    if spool is None:
+        return ingest_queue.submit([(None, row) for row in rows])
+
+    seqs = []
+    def append_to_spool(rows):
+        seqs.extend(spool.append(rows))
+        return list(zip(seqs, rows))
+
+    try:
+        if not ingest_queue.submit(rows, prepare=append_to_spool):
+            return False
+        # Lỗi fsync: bản ghi đã xếp hàng vẫn có thể được ghi, thiết bị gửi lại có thể tạo bản trùng
+        spool.wait_durable(seqs[-1])
+    except OSError as e:
+        print("❌ Lỗi ghi spool:", str(e))
+        raise SpoolError(str(e)) from e
+    return True
+
+# Số giây giữa hai lần xóa phân vùng quá hạn (khi có WEATHER_RETENTION_DAYS)
+RETENTION_CHECK_SECONDS = 3600
+
+def expire_partitions():
+    """Xóa các phân vùng tháng đã quá hạn giữ dữ liệu thô"""
+    try:
+        dropped = storage.apply_retention()
+        if dropped:
+            print(f"🗑️ Đã xóa phân vùng quá hạn: {', '.join(dropped)}")
+    except Exception as e:
+        print("Lỗi khi xóa phân vùng quá hạn:", str(e))
+
+def retention_loop():
+    while True:
+        time.sleep(RETENTION_CHECK_SECONDS)
+        expire_partitions()
+
+def startup():
+    """Việc chỉ chạy một lần cho cả server, trước khi có worker nào nhận request:
+    nâng cấp schema, xóa phân vùng quá hạn, nạp lại spool của mọi worker lần trước
+    (kể cả worker không còn được tạo lại vì số worker giảm).
+    """
+    storage.init_db()
+    if storage.retention_days() is not None:
+        expire_partitions()
+    base, _ = spool_location()
+    if INGEST_MODE == 'async' and base is not None and os.path.isdir(base):
+        spools = [(base, SPOOL_NAME)]
+        spools += [spool_location(int(name[7:])) for name in sorted(os.listdir(base))
+                   if name.startswith('worker-') and name[7:].isdigit()]
+        for directory, name in spools:
+            target = Spool(directory)
+            replay_spool(target, name)
+            target.close()
+    # Không để kết nối SQLite của tiến trình chính đi qua fork sang worker
+    storage.close()
+
+def init_worker(slot=None):
+    """Khởi tạo trạng thái riêng của một tiến trình: hàng đợi ghi và spool,
+    bộ nhớ đệm bản ghi mới nhất, luồng theo dõi database.
+
+    slot là số thứ tự worker (None: chạy một tiến trình); chỉ worker 0
+    định kỳ xóa phân vùng quá hạn.
+    """
+    global ingest_queue, spool, spool_name
+    if INGEST_MODE == 'async':
+        directory, name = spool_location(slot)
+        if directory is not None:
+            spool = Spool(directory, fsync=os.environ.get('INGEST_SPOOL_FSYNC', '1') != '0')
+            spool_name = name
+            replay_spool(spool, spool_name)
+            atexit.register(spool.close)
+
+        ingest_queue = IngestQueue(
+            write_queued,
+            on_written=after_written,
+            dead_letter=dead_letter_queued,
+            max_pending=int(os.environ.get('INGEST_MAX_PENDING', 20000)),
+            batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 1000)))
+        ingest_queue.start()
+        # Ghi nốt các bản ghi đang chờ khi tiến trình thoát
+        atexit.register(ingest_queue.stop)
+
+    watcher = storage.connect(storage.db_path())
+    version = watcher.execute("PRAGMA data_version").fetchone()[0]
+    load_latest()
+    threading.Thread(target=watch_changes, args=(watcher, version),
+                     name='db-watch', daemon=True).start()
+
+    if storage.retention_days() is not None and slot in (None, 0):
+        threading.Thread(target=retention_loop, name='retention', daemon=True).start()
+
+worker_slot = None
+_initialized = False
+_init_lock = threading.Lock()
+
+def create_app(run_startup=True, slot=None):
+    """App factory: trả về app đã khởi tạo cho tiến trình hiện tại.
+
+    run_startup=False khi startup() đã chạy ở tiến trình chính (serve.py);
+    slot là số thứ tự worker. Gọi lại trong cùng tiến trình không khởi tạo lần nữa.
+    """
+    global worker_slot, _initialized
+    with _init_lock:
+        if not _initialized:
+            if run_startup:
+                startup()
+            worker_slot = slot
+            init_worker(slot)
+            _initialized = True
+    return app
+
+# Tính lại cột dẫn xuất trong luồng nền (POST /api/reanalyze)
+reanalysis_job = reanalysis.ReanalysisJob(on_done=load_latest) if reanalysis is not None else None
+
+# Số giây thiết bị nên chờ trước khi gửi lại khi hàng đợi đầy
+RETRY_AFTER_SECONDS = 2
+
+def busy_response():
+    response = jsonify({"error": "Server busy, retry later"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+def unavailable_response():
+    """503: không ghi được spool, bản ghi chưa được nhận"""
+    response = jsonify({"error": "Storage unavailable, retry later"})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+    return response
+
+# Trình duyệt phải hỏi lại server (kèm If-None-Match) trước khi dùng bản đã lưu
+CURRENT_CACHE_CONTROL = 'no-cache'
 
 @app.route('/')
 def index():
     return "ESP32 Weather Station Backend"
 
+# Các trường bắt buộc trong một bản ghi từ thiết bị
+REQUIRED_FIELDS = ['temp', 'humi', 'pres', 'soil', 'ptrend',
+                   'ah', 'dew', 'rain', 'comfort', 'desc',
+                   'device_id', 'timestamp']
+
+# Các trường phải là số
+NUMERIC_FIELDS = ['temp', 'humi', 'pres', 'soil', 'ptrend',
+                  'ah', 'dew', 'rain', 'comfort', 'timestamp']
+
+# Số bản ghi tối đa trong một lô
+MAX_BATCH_SIZE = 5000
+
+def validate_reading(data):
+    """Kiểm tra một bản ghi, trả về thông báo lỗi hoặc None nếu hợp lệ"""
+    if not isinstance(data, dict):
+        return "Reading must be a JSON object"
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return f"Missing required field: {field}"
+    for field in NUMERIC_FIELDS:
+        value = data[field]
+        # null: cảm biến không đo được (bản ghi nhị phân giải mã giá trị đánh dấu thành None)
+        if value is None and field != 'timestamp':
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"Field must be a number: {field}"
+    # Giây tính từ epoch; timestamp mili giây hay quá lớn không chọn được phân vùng
+    if not storage.valid_timestamp(data['timestamp']):
+        return "Timestamp out of range (seconds since epoch)"
+    return None
+
+def reading_to_row(data, created_at):
+    """Chuyển bản ghi JSON thành bộ giá trị cho câu lệnh INSERT"""
+    return (data['device_id'], data['temp'], data['humi'], data['pres'],
+            data['soil'], data['ptrend'], data['ah'], data['dew'],
+            data['rain'], data['comfort'], data['desc'], data['timestamp'],
+            created_at)
+
+def store_reading(row):
+    """Lưu một bản ghi: "success" (đã ghi), "accepted" (đã xếp hàng, chế độ async)
+    hoặc None nếu hàng đợi đầy; SpoolError nếu không ghi được spool
+    """
+    # Chế độ async: xếp hàng và trả lời ngay
+    if ingest_queue is not None:
+        return "accepted" if enqueue([row]) else None
+
+    # Lưu vào database
+    storage.insert_reading(row)
+
+    # Cập nhật dữ liệu mới nhất
+    update_latest(row)
+    return "success"
+
 @app.route('/api/data', methods=['POST'])
 def receive_data():
     try:
         # Debug raw data
         print("📥 Raw data received:", request.data)
         
-        data = request.get_json()
+        # Bản ghi nhị phân cố định hoặc JSON, chọn theo Content-Type
+        if request.mimetype == wire_format.CONTENT_TYPE:
+            data = wire_format.decode(request.get_data())
+        else:
+            data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data received"}), 400
 
-        # Validate required fields
-        required_fields = ['temp', 'humi', 'pres', 'soil', 'ptrend', 
-                          'ah', 'dew', 'rain', 'comfort', 'desc', 
-                          'device_id', 'timestamp']
-        
-        for field in required_fields:
-            if field not in data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-
-        # Lưu vào database
-        conn = sqlite3.connect('weather_data.db')
-        c = conn.cursor()
-        c.execute('''INSERT INTO weather 
-                    (device_id, temperature, humidity, pressure, soil_moisture,
-                     pressure_trend, absolute_humidity, dew_point, rain_probability,
-                     comfort_index, weather_description, timestamp, created_at)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                 (data['device_id'], data['temp'], data['humi'], data['pres'],
-                  data['soil'], data['ptrend'], data['ah'], data['dew'],
-                  data['rain'], data['comfort'], data['desc'], data['timestamp'],
-                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
-        conn.commit()
-        conn.close()
-
-        # Cập nhật dữ liệu mới nhất
-        latest_data['data'] = {
-            'temp': data['temp'],
-            'humi': data['humi'],
-            'pres': data['pres'],
-            'soil': data['soil'],
-            'ptrend': data['ptrend'],
-            'ah': data['ah'],
-            'dew': data['dew'],
-            'rain': data['rain'],
-            'comfort': data['comfort'],
-            'desc': data['desc'],
-            'timestamp': int(data.get('timestamp', time.time()))
-        }
-        latest_data['last_updated'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        return jsonify({"status": "success"})
+        # Kiểm tra trước khi trả 202: bản ghi lỗi không được vào hàng đợi/spool
+        error = validate_reading(data)
+        if error:
+            return jsonify({"error": error}), 400
 
+        row = reading_to_row(data, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
     except Exception as e:
         print("❌ Error processing data:", str(e))
         return jsonify({"error": "Invalid request format"}), 400
 
+    # Lỗi khi lưu là lỗi của server, không phải của request
+    try:
+        status = store_reading(row)
+    except SpoolError:
+        return unavailable_response()
+    except Exception as e:
+        print("❌ Error writing data:", str(e))
+        return jsonify({"error": "Database error"}), 500
+    if status is None:
+        return busy_response()
+    return jsonify({"status": status}), 202 if status == "accepted" else 200
+
+def parse_batch_body():
+    """Đọc danh sách bản ghi từ mảng JSON, NDJSON (mỗi dòng một bản ghi)
+    hoặc các bản ghi nhị phân nối liền nhau
+    """
+    if request.mimetype == wire_format.CONTENT_TYPE:
+        return wire_format.decode_many(request.get_data())
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        for line in request.get_data().splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError as e:
+                # Giữ vị trí của dòng lỗi để báo lại cho thiết bị
+                items.append(ValueError(f"Invalid JSON line: {e}"))
+        return items
+
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise ValueError("Batch body must be a JSON array")
+    return data
+
+@app.route('/api/data/batch', methods=['POST'])
+def receive_batch():
+    try:
+        items = parse_batch_body()
+    except Exception as e:
+        print("❌ Error parsing batch:", str(e))
+        return jsonify({"error": "Invalid request format"}), 400
+
+    if not items:
+        return jsonify({"error": "Empty batch"}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE})"}), 413
+
+    # Kiểm tra từng bản ghi, chỉ ghi những bản ghi hợp lệ
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    results = []
+    rows = []
+    for index, item in enumerate(items):
+        error = str(item) if isinstance(item, ValueError) else validate_reading(item)
+        if error:
+            results.append({"index": index, "status": "rejected", "error": error})
+            continue
+        results.append({"index": index, "status": "accepted"})
+        rows.append(reading_to_row(item, created_at))
+
+    status, code = "success", 200
+    if rows and ingest_queue is not None:
+        # Chế độ async: xếp hàng cả lô (hoặc không nhận bản ghi nào)
+        try:
+            if not enqueue(rows):
+                return busy_response()
+        except SpoolError:
+            return unavailable_response()
+        status, code = "accepted", 202
+    elif rows:
+        # Ghi toàn bộ lô trong một giao dịch duy nhất
+        try:
+            storage.insert_readings(rows)
+        except Exception as e:
+            print("❌ Error writing batch:", str(e))
+            return jsonify({"error": "Database error"}), 500
+
+        # Chỉ bản ghi mới nhất của mỗi thiết bị trong lô được đẩy đi
+        publish_rows(rows)
+
+    print(f"📦 Batch: {len(rows)} accepted, {len(items) - len(rows)} rejected")
+    return jsonify({
+        "status": status,
+        "accepted": len(rows),
+        "rejected": len(items) - len(rows),
+        "results": results
+    }), code
+
 @app.route('/get_current')
 def get_current_data():
-    if not latest_data.get('data'):
+    entry = latest_cache.get(request.args.get('device_id'))
+    if entry is None:
         return jsonify({"error": "No data available"}), 404
-        
+
+    # Dữ liệu chưa đổi so với lần poll trước: trả 304, không gửi lại nội dung
+    if request.if_none_match.contains(entry['etag']):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.headers['Cache-Control'] = CURRENT_CACHE_CONTROL
+    return response
+
+@app.route('/stream')
+def stream():
+    """Server-Sent Events: gửi bản ghi hiện tại rồi đẩy mỗi bản ghi mới"""
+    device_id = request.args.get('device_id')
+    sub = broker.subscribe(device_id)
+    if sub is None:
+        return jsonify({"error": "Too many subscribers"}), 503
+
+    entry = latest_cache.get(device_id)
+    initial = entry['body'] if entry else None
+    return Response(event_stream(broker, sub, initial),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Số liệu vận hành của tiến trình trả lời: hàng đợi ghi và số client SSE"""
     return jsonify({
-        "temperature": latest_data['data'].get('temp'),
-        "humidity": latest_data['data'].get('humi'),
-        "pressure": latest_data['data'].get('pres'),
-        "soil_moisture": latest_data['data'].get('soil'),
-        "pressure_trend": latest_data['data'].get('ptrend'),
-        "absolute_humidity": latest_data['data'].get('ah'),
-        "dew_point": latest_data['data'].get('dew'),
-        "rain_probability": latest_data['data'].get('rain'),
-        "comfort_index": latest_data['data'].get('comfort'),
-        "weather_description": latest_data['data'].get('desc'),
-        "last_updated": latest_data.get('last_updated')
+        "pid": os.getpid(),
+        "worker_slot": worker_slot,
+        "ingest_mode": INGEST_MODE,
+        "ingest": ingest_queue.metrics() if ingest_queue is not None else None,
+        "stream_subscribers": broker.subscriber_count(),
+        "stream_published": broker.published,
     })
 
+@app.route('/api/reanalyze', methods=['GET', 'POST'])
+def reanalyze():
+    """POST: bắt đầu tính lại các cột dẫn xuất (body JSON: params, device_id, from, to, dry_run).
+    GET: trạng thái lần chạy gần nhất.
+    """
+    if reanalysis_job is None:
+        return jsonify({"error": "Reanalysis requires NumPy"}), 501
+    if request.method == 'GET':
+        return jsonify(reanalysis_job.status)
+    try:
+        body = request.get_json(silent=True) or {}
+        started = reanalysis_job.start(
+            params=body.get('params'),
+            device_id=body.get('device_id'),
+            start=body.get('from'),
+            end=body.get('to'),
+            dry_run=bool(body.get('dry_run')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not started:
+        return jsonify({"error": "Reanalysis already running", **reanalysis_job.status}), 409
+    return jsonify(reanalysis_job.status), 202
+
+@app.route('/api/export')
+def export_history():
+    """Xuất dữ liệu thô theo luồng: ?format=csv|arrow|parquet&from=&to=&device_id=a,b&columns=a,b
+
+    from/to mặc định là toàn bộ dữ liệu; device_id có thể lặp lại hoặc cách nhau bởi dấu phẩy.
+    """
+    fmt = request.args.get('format', 'csv')
+    try:
+        start = float(request.args['from']) if 'from' in request.args else None
+        end = float(request.args['to']) if 'to' in request.args else None
+        if start is not None and end is not None and start >= end:
+            raise ValueError("from phải nhỏ hơn to")
+        columns = export.parse_columns(request.args.get('columns'))
+        device_ids = [d for value in request.args.getlist('device_id')
+                      for d in value.split(',') if d] or None
+        chunks = export.export(fmt, columns, start, end, device_ids)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 501
+
+    mimetype, extension = export.FORMATS[fmt]
+    name = f"weather_{int(start) if start is not None else 'begin'}_{int(end) if end is not None else 'end'}"
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{name}.{extension}"',
+                             'X-Accel-Buffering': 'no'})
+
+@app.route('/api/model/latest')
+def get_latest_model():
+    """Bộ hệ số dự báo mưa mới nhất cho thiết bị.
+
+    ?since=<phiên bản>: trả về 204 nếu server không có bản mới hơn.
+    """
+    model = storage.fetch_model()
+    if model is None:
+        return jsonify({"error": "No published model"}), 404
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({"error": "since must be an integer"}), 400
+    if model['version'] <= since:
+        return '', 204
+    return jsonify({key: model[key] for key in ('version', 'link', 'coeffs', 'created_at')})
+
+@app.route('/get_devices')
+def get_devices():
+    return jsonify(latest_cache.devices())
+
+@app.route('/get_pressure_trend')
+def get_pressure_trend():
+    """Xu hướng áp suất (hPa/3h) tính lại từ lịch sử đã lưu, cùng thuật toán với thiết bị.
+
+    Tham số: device_id (mặc định: mọi thiết bị), at (mặc định: bản ghi mới nhất).
+    """
+    try:
+        device_id = request.args.get('device_id')
+        devices = [device_id] if device_id else latest_cache.devices()
+        at = request.args.get('at')
+        result = []
+        for device in devices:
+            entry = latest_cache.get(device)
+            end = int(at) if at else (entry['timestamp'] if entry else int(time.time()))
+            samples = storage.fetch_pressure_series(device, end - pressure_trend.WINDOW_SECONDS, end)
+            item = {
+                'device_id': device,
+                'timestamp': end,
+                'pressure_trend': round(pressure_trend.trend_from_samples(samples), 3),
+                'samples': len(samples),
+            }
+            if entry is not None and not at:
+                item['device_pressure_trend'] = entry['payload'].get('pressure_trend')
+            result.append(item)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print("Lỗi khi tính xu hướng áp suất:", str(e))
+        return jsonify({"error": str(e)}), 500
+
+# Tên metric trên API -> cột trong bảng weather
+METRIC_MAP = {
+    'temperature': 'temperature',
+    'humidity': 'humidity',
+    'pressure': 'pressure',
+    'soil_moisture': 'soil_moisture',
+    'rain_probability': 'rain_probability',
+    'comfort_index': 'comfort_index',
+    'absolute_humidity': 'absolute_humidity',
+    'dew_point': 'dew_point',
+    'pressure_trend': 'pressure_trend'
+}
+
+# Đơn vị cho tham số bucket (vd: 1m, 5m, 1h, 1d)
+BUCKET_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Các khung gộp được chọn tự động khi không truyền bucket
+AUTO_BUCKETS = [60, 300, 900, 3600, 6*3600, 86400]
+
+# Số điểm mục tiêu khi tự chọn khung, và số khung tối đa mỗi phản hồi
+AUTO_POINTS = 300
+MAX_BUCKETS = 2000
+
+# Số bản ghi thô tối đa khi bucket=raw
+MAX_RAW_ROWS = 1000
+
+def parse_bucket(value, start, end):
+    """Đổi tham số bucket thành số giây ('auto' chọn khung nhỏ nhất đủ AUTO_POINTS điểm)"""
+    if value == 'auto':
+        for bucket in AUTO_BUCKETS:
+            if (end - start) / bucket <= AUTO_POINTS:
+                return bucket
+        return AUTO_BUCKETS[-1] * max(1, int((end - start) / (AUTO_BUCKETS[-1] * AUTO_POINTS)) + 1)
+
+    unit = value[-1:]
+    if unit not in BUCKET_UNITS or not value[:-1].isdigit() or int(value[:-1]) <= 0:
+        raise ValueError(f"bucket không hợp lệ: {value}")
+    bucket = int(value[:-1]) * BUCKET_UNITS[unit]
+    if bucket < 60:
+        raise ValueError("bucket tối thiểu là 1m")
+    if (end - start) / bucket > MAX_BUCKETS:
+        raise ValueError(f"Khoảng thời gian quá dài cho bucket {value} (tối đa {MAX_BUCKETS} khung)")
+    return bucket
+
+def parse_history_args(args=None):
+    """Đọc from/to/device_id/bucket/limit từ query string (mặc định: 24 giờ gần nhất)"""
+    if args is None:
+        args = request.args
+    now = time.time()
+    end = float(args.get('to', now))
+    start = float(args.get('from', end - 24*3600))
+    if start >= end:
+        raise ValueError("from phải nhỏ hơn to")
+    device_id = args.get('device_id')
+    bucket_arg = args.get('bucket', 'auto')
+    bucket = None if bucket_arg == 'raw' else parse_bucket(bucket_arg, start, end)
+    limit = int(args.get('limit', 100))
+    if limit < 1:
+        # LIMIT âm trong SQLite là không giới hạn, vượt qua MAX_RAW_ROWS
+        raise ValueError("limit phải lớn hơn 0")
+    limit = min(limit, MAX_RAW_ROWS)
+    return start, end, device_id, bucket, limit
+
+def metric_history(metric, start, end, device_id, bucket, limit):
+    """Dữ liệu trả về của /get_history/<metric>: bản ghi thô (bucket None) hoặc min/mean/max theo khung"""
+    if bucket is None:
+        # Dữ liệu thô, sắp xếp từ cũ đến mới
+        rows = storage.fetch_history(METRIC_MAP[metric], start, limit=limit,
+                                     device_id=device_id, until=end)
+        return [{
+            'timestamp': row[0],
+            'value': row[1]
+        } for row in rows]
+
+    # Gộp min/mean/max theo từng khung thời gian
+    rows = storage.fetch_buckets(METRIC_MAP[metric], start, end, bucket,
+                                 device_id=device_id)
+    return [{
+        'timestamp': row[0],
+        'count': row[1],
+        'min': row[2],
+        'value': row[3],
+        'max': row[4]
+    } for row in rows]
+
 @app.route('/get_history/<metric>')
 def get_history(metric):
     print(f"📊 Requested history for: {metric}")  # Thêm dòng này
-# Thay đổi metric_map thành:
-    metric_map = {
-        'temperature': 'temperature',
-        'humidity': 'humidity',
-        'pressure': 'pressure',
-        'soil_moisture': 'soil_moisture',
-        'rain_probability': 'rain_probability',
-        'comfort_index': 'comfort_index',
-        'absolute_humidity': 'absolute_humidity',
-        'dew_point': 'dew_point',
-        'pressure_trend': 'pressure_trend'
-    }
     
-    if metric not in metric_map:
+    if metric not in METRIC_MAP:
         print(f"❌ Invalid metric: {metric}")  # Thêm dòng này
         return jsonify({"error": "Metric không hợp lệ"}), 400
 
-    conn = sqlite3.connect('weather_data.db')
-    c = conn.cursor()
-    
     try:
-        # Lấy 24 giờ gần nhất, sắp xếp từ cũ đến mới
-        cutoff = time.time() - 24*3600
-        c.execute(f'''
-            SELECT timestamp, {metric_map[metric]} 
-            FROM weather 
-            WHERE timestamp > ? 
-            ORDER BY timestamp ASC
-            LIMIT 100
-        ''', (cutoff,))
-        
-        history = [{
-            'timestamp': row[0],
-            'value': row[1]
-        } for row in c.fetchall()]
-        
-        return jsonify(history)
-        
+        start, end, device_id, bucket, limit = parse_history_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        return jsonify(metric_history(metric, start, end, device_id, bucket, limit))
     except Exception as e:
         print(f"Lỗi khi lấy lịch sử {metric}:", str(e))
         return jsonify({"error": str(e)}), 500
-        
-    finally:
-        conn.close()
+
+@app.route('/get_history')
+def get_history_multi():
+    """Lịch sử nhiều metric trong một request, dạng cột:
+    {"timestamps": [...], "temperature": [...], "humidity": [...], ...}
+    """
+    metrics_arg = request.args.get('metrics', 'all')
+    metrics = list(METRIC_MAP) if metrics_arg == 'all' else metrics_arg.split(',')
+    invalid = [m for m in metrics if m not in METRIC_MAP]
+    if invalid:
+        print(f"❌ Invalid metrics: {invalid}")
+        return jsonify({"error": f"Metric không hợp lệ: {', '.join(invalid)}"}), 400
+
+    try:
+        start, end, device_id, bucket, limit = parse_history_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Thêm cột <metric>_min / <metric>_max khi stats=1
+    with_stats = request.args.get('stats') == '1'
+    columns = [METRIC_MAP[m] for m in metrics]
+
+    try:
+        if bucket is None:
+            rows = storage.fetch_history_multi(columns, start, limit=limit,
+                                               device_id=device_id, until=end)
+            result = {'timestamps': [row[0] for row in rows]}
+            for i, metric in enumerate(metrics):
+                result[metric] = [row[i + 1] for row in rows]
+        else:
+            rows = storage.fetch_buckets_multi(columns, start, end, bucket,
+                                               device_id=device_id)
+            empty = (0, None, None, None)
+            result = {'timestamps': [row[0] for row in rows], 'bucket': bucket}
+            for metric, column in zip(metrics, columns):
+                stats = [row[1].get(column, empty) for row in rows]
+                result[metric] = [s[2] for s in stats]
+                if with_stats:
+                    result[f'{metric}_min'] = [s[1] for s in stats]
+                    result[f'{metric}_max'] = [s[3] for s in stats]
+
+        return jsonify(result)
+
+    except Exception as e:
+        print("Lỗi khi lấy lịch sử nhiều metric:", str(e))
+        return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Server phát triển một tiến trình; chạy thật: python serve.py
+    create_app().run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,189 @@
+"""Biến thể asyncio (aiohttp) của các route thiết bị/dashboard gọi nhiều nhất.
+
+/api/data, /get_current và /get_history/<metric> giữ nguyên JSON vào/ra như
+webserver3.py, nhưng mỗi kết nối chỉ là một coroutine: thiết bị gửi chậm (tới
+10 giây timeout của NetworkManager.send_data) không giữ luồng nào, nên một
+tiến trình giữ được hàng chục nghìn kết nối đang chờ. Truy cập database
+(ghi bản ghi, đọc lịch sử) chạy trong ThreadPoolExecutor cỡ bằng pool kết nối
+SQLite; /get_current đọc thẳng bộ nhớ đệm trong event loop.
+
+Kiểm tra dữ liệu, bộ nhớ đệm bản ghi mới nhất, hàng đợi ghi (INGEST_MODE) và
+việc khởi động dùng chung với webserver3 (create_app), nên chạy được song song
+với serve.py trên cùng database.
+
+Cần aiohttp (pip install aiohttp). Ví dụ:
+    python webserver_async.py --port 5001
+"""
+import argparse
+import asyncio
+import json
+import resource
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import storage
+import webserver3
+import wire_format
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+# Tăng giới hạn số file mở được (mỗi kết nối một file descriptor)
+MAX_OPEN_FILES = 65536
+
+
+def json_response(data, status=200, headers=None):
+    """Phản hồi JSON cùng định dạng với jsonify của Flask (khóa sắp xếp, gọn, xuống dòng)"""
+    body = json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n'
+    return web.Response(text=body, status=status, content_type='application/json', headers=headers)
+
+
+def etag_matches(header, etag):
+    """If-None-Match có chứa etag không (so sánh yếu, chấp nhận '*')"""
+    for value in header.split(','):
+        value = value.strip()
+        if value.startswith('W/'):
+            value = value[2:]
+        if value == '*' or value.strip('"') == etag:
+            return True
+    return False
+
+
+async def run_db(request, function, *args):
+    """Chạy hàm truy cập database trong executor, không chặn event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app['executor'], function, *args)
+
+
+async def receive_data(request):
+    try:
+        # Bản ghi nhị phân cố định hoặc JSON, chọn theo Content-Type
+        if request.content_type == wire_format.CONTENT_TYPE:
+            data = wire_format.decode(await request.read())
+        elif request.content_type == 'application/json':
+            data = json.loads(await request.read() or b'null')
+        else:
+            raise ValueError(f"Unsupported Content-Type: {request.content_type}")
+        if not data:
+            return json_response({"error": "No JSON data received"}, 400)
+
+        # Cùng kiểm tra với webserver3 (kể cả khoảng timestamp) trước khi trả 202
+        error = webserver3.validate_reading(data)
+        if error:
+            return json_response({"error": error}, 400)
+
+        row = webserver3.reading_to_row(data, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    except Exception as e:
+        print("❌ Error processing data:", str(e))
+        return json_response({"error": "Invalid request format"}, 400)
+
+    # Lỗi khi lưu là lỗi của server, không phải của request
+    try:
+        status = await run_db(request, webserver3.store_reading, row)
+    except webserver3.SpoolError:
+        return json_response({"error": "Storage unavailable, retry later"}, 503,
+                             {'Retry-After': str(webserver3.RETRY_AFTER_SECONDS)})
+    except Exception as e:
+        print("❌ Error writing data:", str(e))
+        return json_response({"error": "Database error"}, 500)
+
+    if status is None:
+        return json_response({"error": "Server busy, retry later"}, 429,
+                             {'Retry-After': str(webserver3.RETRY_AFTER_SECONDS)})
+    return json_response({"status": status}, 202 if status == "accepted" else 200)
+
+
+async def get_current_data(request):
+    entry = webserver3.latest_cache.get(request.query.get('device_id'))
+    if entry is None:
+        return json_response({"error": "No data available"}, 404)
+
+    # Dữ liệu chưa đổi so với lần poll trước: trả 304, không gửi lại nội dung
+    if etag_matches(request.headers.get('If-None-Match', ''), entry['etag']):
+        response = web.Response(status=304)
+    else:
+        response = web.Response(body=entry['body'], content_type='application/json')
+    response.etag = entry['etag']
+    response.headers['Cache-Control'] = webserver3.CURRENT_CACHE_CONTROL
+    return response
+
+
+async def get_history(request):
+    metric = request.match_info['metric']
+    if metric not in webserver3.METRIC_MAP:
+        return json_response({"error": "Metric không hợp lệ"}, 400)
+
+    try:
+        start, end, device_id, bucket, limit = webserver3.parse_history_args(request.query)
+    except ValueError as e:
+        return json_response({"error": str(e)}, 400)
+
+    try:
+        history = await run_db(request, webserver3.metric_history,
+                               metric, start, end, device_id, bucket, limit)
+        return json_response(history)
+    except Exception as e:
+        print(f"Lỗi khi lấy lịch sử {metric}:", str(e))
+        return json_response({"error": str(e)}, 500)
+
+
+async def index(request):
+    return web.Response(text="ESP32 Weather Station Backend (asyncio)")
+
+
+async def add_cors_header(request, response):
+    # Như CORS(app) của webserver3: cho phép dashboard ở origin khác
+    response.headers['Access-Control-Allow-Origin'] = '*'
+
+
+async def close_executor(app):
+    app['executor'].shutdown(wait=True)
+
+
+def create_app(run_startup=True):
+    """App factory: khởi tạo trạng thái dùng chung (webserver3.create_app) và trả về app aiohttp"""
+    if web is None:
+        raise RuntimeError("Biến thể asyncio cần aiohttp: pip install aiohttp")
+    webserver3.create_app(run_startup=run_startup)
+    app = web.Application()
+    app['executor'] = ThreadPoolExecutor(max_workers=storage.get_pool().size,
+                                         thread_name_prefix='db')
+    app.router.add_get('/', index)
+    app.router.add_post('/api/data', receive_data)
+    app.router.add_get('/get_current', get_current_data)
+    app.router.add_get('/get_history/{metric}', get_history)
+    app.on_response_prepare.append(add_cors_header)
+    app.on_cleanup.append(close_executor)
+    return app
+
+
+def raise_open_file_limit(limit=MAX_OPEN_FILES):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = limit if hard == resource.RLIM_INFINITY else min(limit, hard)
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--backlog', type=int, default=4096,
+                        help="Hàng đợi kết nối chưa accept của socket")
+    args = parser.parse_args()
+
+    if web is None:
+        print("❌ Cần aiohttp: pip install aiohttp")
+        sys.exit(1)
+    files = raise_open_file_limit()
+    print(f"🚀 asyncio tại {args.host}:{args.port} (tối đa {files} file mở)")
+    web.run_app(create_app(), host=args.host, port=args.port, backlog=args.backlog,
+                access_log=None, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""Định dạng nhị phân cố định cho báo cáo của trạm (dùng chung ESP32 và server).
+
+Một bản ghi dài RECORD_SIZE byte, little-endian, số thực lưu dạng số nguyên
+có hệ số (fixed-point), mô tả thời tiết và cảnh báo lưu dạng mã:
+
+    version        B   phiên bản định dạng (SCHEMA_VERSION)
+    device_id      6s  địa chỉ MAC (device_id dạng hex 12 ký tự)
+    timestamp      I   giây
+    temp           h   °C x100
+    humi           H   % x100
+    pres           I   hPa x100
+    soil           H   giá trị ADC
+    ptrend         h   hPa/3h x100
+    ah             H   g/m³ x100
+    dew            h   °C x100
+    rain           H   xác suất 0-1 x10000
+    comfort        B   0-100
+    desc           B   mã trong DESCRIPTIONS
+    alerts         B   mặt nạ bit theo ALERTS
+
+Giá trị NaN/không đo được được mã hóa bằng giá trị lớn nhất (kiểu không dấu)
+hoặc nhỏ nhất (kiểu có dấu) của trường, và giải mã thành None. Nhiều bản ghi có thể nối liền nhau
+trong một body (gửi theo lô).
+"""
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
+
+CONTENT_TYPE = 'application/x-weather-record'
+SCHEMA_VERSION = 1
+
+RECORD_FORMAT = '<B6sIhHIHhHhHBBB'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+# (tên trường, mã struct, hệ số)
+FIELDS = (
+    ('temp', 'h', 100),
+    ('humi', 'H', 100),
+    ('pres', 'I', 100),
+    ('soil', 'H', 1),
+    ('ptrend', 'h', 100),
+    ('ah', 'H', 100),
+    ('dew', 'h', 100),
+    ('rain', 'H', 10000),
+    ('comfort', 'B', 1),
+)
+
+# Khoảng giá trị và giá trị đánh dấu NaN cho từng kiểu
+LIMITS = {
+    'h': (-32767, 32767, -32768),
+    'H': (0, 65534, 65535),
+    'I': (0, 4294967294, 4294967295),
+    'B': (0, 254, 255),
+}
+
+# Mã mô tả thời tiết (giữ nguyên thứ tự, chỉ thêm vào cuối)
+DESCRIPTIONS = (
+    'Không thể xác định',
+    'Chắc chắn có mưa',
+    'Khả năng cao có mưa',
+    'Ít khả năng có mưa',
+    'Chắc chắn không mưa',
+    'Thời tiết ổn định',
+)
+UNKNOWN_DESCRIPTION = 255
+
+# Bit cảnh báo (giữ nguyên thứ tự, tối đa 8)
+ALERTS = (
+    "CẢNH BÁO: Khả năng mưa rất cao (>80%)",
+    "Lưu ý: Khả năng mưa cao (>60%)",
+    "⚠️ Áp suất cực thấp - Nguy cơ bão lớn",
+    "⚠️ Áp suất thấp - Thời tiết xấu",
+    "⚠️ Áp suất giảm nhanh - Mưa có thể đến sớm",
+    "🔥 Nhiệt độ nguy hiểm: >35°C",
+    "❄️ Nhiệt độ thấp: <10°C",
+)
+
+
+def _to_fixed(value, code, scale):
+    low, high, missing = LIMITS[code]
+    if value is None or value != value:   # None hoặc NaN
+        return missing
+    raw = int(round(value * scale))
+    return low if raw < low else high if raw > high else raw
+
+
+def _from_fixed(raw, code, scale):
+    if raw == LIMITS[code][2]:
+        return None     # Không đo được: null trong JSON (NaN không phải JSON hợp lệ)
+    return raw / scale if scale != 1 else raw
+
+
+def encode(reading):
+    """Mã hóa một bản ghi (dict theo khóa của server: temp, humi, ...) thành bytes"""
+    desc = reading.get('desc')
+    desc_code = DESCRIPTIONS.index(desc) if desc in DESCRIPTIONS else UNKNOWN_DESCRIPTION
+    alert_bits = 0
+    for alert in reading.get('alerts') or ():
+        if alert in ALERTS:
+            alert_bits |= 1 << ALERTS.index(alert)
+    values = [_to_fixed(reading.get(name), code, scale) for name, code, scale in FIELDS]
+    return struct.pack(RECORD_FORMAT, SCHEMA_VERSION,
+                       binascii.unhexlify(reading['device_id']),
+                       int(reading['timestamp']),
+                       *values, desc_code, alert_bits)
+
+
+def _decode_values(values):
+    version = values[0]
+    if version != SCHEMA_VERSION:
+        raise ValueError('Unsupported record version: %d' % version)
+    reading = {
+        'device_id': binascii.hexlify(values[1]).decode(),
+        'timestamp': values[2],
+    }
+    for (name, code, scale), raw in zip(FIELDS, values[3:3 + len(FIELDS)]):
+        reading[name] = _from_fixed(raw, code, scale)
+    desc_code, alert_bits = values[-2], values[-1]
+    reading['desc'] = DESCRIPTIONS[desc_code] if desc_code < len(DESCRIPTIONS) else None
+    reading['alerts'] = [a for i, a in enumerate(ALERTS) if alert_bits & (1 << i)]
+    return reading
+
+
+def decode(data):
+    """Giải mã một bản ghi"""
+    if len(data) != RECORD_SIZE:
+        raise ValueError('Record must be %d bytes' % RECORD_SIZE)
+    return _decode_values(struct.unpack(RECORD_FORMAT, data))
+
+
+def decode_many(data):
+    """Giải mã body gồm nhiều bản ghi nối liền nhau"""
+    if not data or len(data) % RECORD_SIZE:
+        raise ValueError('Body length must be a multiple of %d bytes' % RECORD_SIZE)
+    return [_decode_values(values) for values in struct.iter_unpack(RECORD_FORMAT, data)]